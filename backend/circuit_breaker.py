@@ -0,0 +1,106 @@
+import threading
+import time
+from .config import CONFIG
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class _Breaker:
+    def __init__(self) -> None:
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probe_started = 0.0
+        self.stats = {"successes": 0, "failures": 0, "slow_calls": 0, "short_circuited": 0, "opened": 0, "probes": 0}
+
+
+class CircuitBreakerRegistry:
+    """One circuit breaker per (api_url, model_name) in front of upstream chat requests.
+
+    A breaker opens after LLM_BREAKER_FAILURE_THRESHOLD consecutive failures, where a failure is a transport
+    error, a retryable status, a malformed body or a call slower than LLM_BREAKER_SLOW_CALL_SECONDS. While open,
+    requests to the endpoint are refused at once so LLMHandler can fail over to the next configured endpoint.
+    After LLM_BREAKER_OPEN_SECONDS it goes half-open and lets a single probe through: success closes it, failure
+    opens it again. A probe that never reports back (cancelled caller) is replaced after another open period.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._breakers: dict[tuple[str, str], _Breaker] = {}
+
+    def _get(self, api_url: str, model_name: str) -> _Breaker:
+        key = (api_url or "", model_name or "")
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            breaker = _Breaker()
+            self._breakers[key] = breaker
+        return breaker
+
+    def allow(self, api_url: str, model_name: str) -> bool:
+        if not CONFIG.LLM_BREAKER_ENABLED:
+            return True
+        with self._lock:
+            breaker = self._get(api_url, model_name)
+            now = time.monotonic()
+            open_seconds = max(0.0, CONFIG.LLM_BREAKER_OPEN_SECONDS)
+            if breaker.state == OPEN and now - breaker.opened_at >= open_seconds:
+                breaker.state = HALF_OPEN
+                breaker.probe_started = 0.0
+            if breaker.state == HALF_OPEN and (not breaker.probe_started or now - breaker.probe_started >= open_seconds):
+                breaker.probe_started = now
+                breaker.stats["probes"] += 1
+                return True
+            if breaker.state == CLOSED:
+                return True
+            breaker.stats["short_circuited"] += 1
+            return False
+
+    def record_success(self, api_url: str, model_name: str, latency: float) -> None:
+        slow = CONFIG.LLM_BREAKER_SLOW_CALL_SECONDS
+        if slow > 0 and latency > slow:
+            # The endpoint answered, but outside the latency SLO
+            with self._lock:
+                self._get(api_url, model_name).stats["slow_calls"] += 1
+            self.record_failure(api_url, model_name)
+            return
+        with self._lock:
+            breaker = self._get(api_url, model_name)
+            breaker.stats["successes"] += 1
+            breaker.consecutive_failures = 0
+            if breaker.state != CLOSED:
+                print(f"Circuit closed for {model_name} at {api_url}")
+            breaker.state = CLOSED
+            breaker.probe_started = 0.0
+
+    def record_failure(self, api_url: str, model_name: str) -> None:
+        with self._lock:
+            breaker = self._get(api_url, model_name)
+            breaker.stats["failures"] += 1
+            breaker.consecutive_failures += 1
+            if breaker.state == HALF_OPEN or (
+                breaker.state == CLOSED and breaker.consecutive_failures >= max(1, CONFIG.LLM_BREAKER_FAILURE_THRESHOLD)
+            ):
+                print(f"Circuit opened for {model_name} at {api_url} after {breaker.consecutive_failures} consecutive failure(s)")
+                breaker.state = OPEN
+                breaker.opened_at = time.monotonic()
+                breaker.probe_started = 0.0
+                breaker.stats["opened"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            endpoints = {
+                f"{model} @ {url}": {"state": b.state, "consecutive_failures": b.consecutive_failures, **b.stats}
+                for (url, model), b in self._breakers.items()
+            }
+        return {
+            "enabled": CONFIG.LLM_BREAKER_ENABLED,
+            "failure_threshold": CONFIG.LLM_BREAKER_FAILURE_THRESHOLD,
+            "open_seconds": CONFIG.LLM_BREAKER_OPEN_SECONDS,
+            "slow_call_seconds": CONFIG.LLM_BREAKER_SLOW_CALL_SECONDS,
+            "endpoints": endpoints,
+        }
+
+
+CIRCUIT_BREAKERS = CircuitBreakerRegistry()
@@ -18,6 +18,12 @@ def _get_int(name: str, default: int) -> int:
     except Exception:
         return int(default)
 
+def _get_bool(name: str, default: bool) -> bool:
+    v = os.getenv(name)
+    if v is None:
+        return bool(default)
+    return v.strip().lower() in ("1", "true", "yes", "on")
+
 
 class AppConfig:
     def __init__(self) -> None:
@@ -40,10 +46,147 @@ class AppConfig:
         # 领域经验检索余弦相似度阈值：cosine >= 阈值 或存在标签匹配时保留候选
         self.RETRIEVAL_COSINE_THRESHOLD = _get_float("RETRIEVAL_COSINE_THRESHOLD", 0.7)
         self.RETRIEVAL_TOP_K = _get_int("RETRIEVAL_TOP_K", 5)
+        # 领域经验向量的存储精度：float32（默认）或 float16（体积减半，精度略降）
+        self.EMBEDDING_STORAGE_DTYPE = (os.getenv("EMBEDDING_STORAGE_DTYPE") or "float32").strip().lower()
+        if self.EMBEDDING_STORAGE_DTYPE not in ("float32", "float16"):
+            self.EMBEDDING_STORAGE_DTYPE = "float32"
+        # Embedding缓存：按(模型, 文本sha256)持久化到SQLite，命中时不再请求网络
+        self.EMBEDDING_CACHE_ENABLED = _get_bool("EMBEDDING_CACHE_ENABLED", True)
+        # Embedding缓存：最多保留的条目数，超出后按最近最少使用淘汰
+        self.EMBEDDING_CACHE_MAX_ENTRIES = _get_int("EMBEDDING_CACHE_MAX_ENTRIES", 20000)
+        # Embedding缓存：命中时仅当上次使用时间早于该值（秒）才更新，避免每次命中都写库
+        self.EMBEDDING_CACHE_TOUCH_SECONDS = _get_int("EMBEDDING_CACHE_TOUCH_SECONDS", 3600)
+        # LLM响应缓存：仅对显式开启缓存的确定性调用生效（按模型、prompt与query哈希）
+        self.LLM_CACHE_ENABLED = _get_bool("LLM_CACHE_ENABLED", True)
+        # LLM响应缓存：条目有效期（秒）
+        self.LLM_CACHE_TTL_SECONDS = _get_int("LLM_CACHE_TTL_SECONDS", 86400)
+        # LLM响应缓存：最多保留的条目数，超出后按最近最少使用淘汰
+        self.LLM_CACHE_MAX_ENTRIES = _get_int("LLM_CACHE_MAX_ENTRIES", 5000)
+        # LLM响应缓存：命中时仅当上次使用时间早于该值（秒）才更新，避免每次命中都写库
+        self.LLM_CACHE_TOUCH_SECONDS = _get_int("LLM_CACHE_TOUCH_SECONDS", 3600)
+        # 对话记录缓存：内存中最多保留的主题数（按最近使用淘汰）
+        self.CONVERSATION_CACHE_MAX_TOPICS = _get_int("CONVERSATION_CACHE_MAX_TOPICS", 2000)
+        # 对话窗口：写入提示词的对话记录的估算token预算
+        self.CONVERSATION_TOKEN_BUDGET = _get_int("CONVERSATION_TOKEN_BUDGET", 3000)
+        # 对话窗口：原文保留的最近轮数，更早的轮次以滚动摘要代替
+        self.CONVERSATION_KEEP_ROUNDS = _get_int("CONVERSATION_KEEP_ROUNDS", 6)
+        # 对话窗口：是否在每轮结束后异步生成较早轮次的滚动摘要
+        self.CONVERSATION_SUMMARY_ENABLED = _get_bool("CONVERSATION_SUMMARY_ENABLED", True)
+        # LLM准入控制：按 (api_url, api_key) 共享限流与并发上限，并按优先级（交互 > 报告 > 后台）排队
+        self.LLM_ADMISSION_ENABLED = _get_bool("LLM_ADMISSION_ENABLED", True)
+        # LLM准入控制：每个 (api_url, api_key) 同时进行的上游请求数上限
+        self.LLM_MAX_CONCURRENCY = _get_int("LLM_MAX_CONCURRENCY", 8)
+        # LLM准入控制：每分钟请求数上限（令牌桶），0表示不限
+        self.LLM_RPM_LIMIT = _get_int("LLM_RPM_LIMIT", 0)
+        # LLM准入控制：每分钟token数上限（令牌桶，按估算的提示词token预扣、按响应用量补扣），0表示不限
+        self.LLM_TPM_LIMIT = _get_int("LLM_TPM_LIMIT", 0)
+        # LLM重试：单次调用的最大尝试次数（含首次）
+        self.LLM_RETRY_MAX_ATTEMPTS = _get_int("LLM_RETRY_MAX_ATTEMPTS", 3)
+        # LLM重试：首次重试前的基础等待时间（秒），之后每次翻倍
+        self.LLM_RETRY_BASE_DELAY = _get_float("LLM_RETRY_BASE_DELAY", 0.8)
+        # LLM重试：单次等待时间上限（秒）
+        self.LLM_RETRY_MAX_DELAY = _get_float("LLM_RETRY_MAX_DELAY", 8.0)
+        # LLM重试：自首次请求起超过该时间（秒）不再发起重试
+        self.LLM_RETRY_MAX_ELAPSED = _get_float("LLM_RETRY_MAX_ELAPSED", 60.0)
+        # LLM重试：等待时间的随机抖动比例（0~1），避免多个请求同时重试
+        self.LLM_RETRY_JITTER = _get_float("LLM_RETRY_JITTER", 0.5)
+        # LLM重试：可重试的HTTP状态码（逗号分隔），其余状态码（如400/401）直接失败
+        self.LLM_RETRY_STATUSES = (os.getenv("LLM_RETRY_STATUSES") or "408,409,425,429,500,502,503,504").strip()
+        # LLM重试：上游Retry-After超过该值（秒）时不再等待重试
+        self.LLM_RETRY_AFTER_MAX = _get_float("LLM_RETRY_AFTER_MAX", 30.0)
+        # LLM调用的默认截止时间（秒，含排队与重试），0表示不限
+        self.LLM_CALL_DEADLINE_SECONDS = _get_float("LLM_CALL_DEADLINE_SECONDS", 0.0)
+        # LLM熔断：是否按 (api_url, model_name) 启用熔断器
+        self.LLM_BREAKER_ENABLED = _get_bool("LLM_BREAKER_ENABLED", True)
+        # LLM熔断：连续失败多少次后打开熔断器（之后的请求直接跳过该端点）
+        self.LLM_BREAKER_FAILURE_THRESHOLD = _get_int("LLM_BREAKER_FAILURE_THRESHOLD", 5)
+        # LLM熔断：打开状态持续时间（秒），之后进入半开状态放行一个探测请求
+        self.LLM_BREAKER_OPEN_SECONDS = _get_float("LLM_BREAKER_OPEN_SECONDS", 30.0)
+        # LLM熔断：响应慢于该值（秒）也记为一次失败（延迟SLO），0表示不检查
+        self.LLM_BREAKER_SLOW_CALL_SECONDS = _get_float("LLM_BREAKER_SLOW_CALL_SECONDS", 0.0)
+        # LLM故障转移：按顺序尝试的备用端点，格式 "api_url|model_name,api_url|model_name"，为空表示不转移
+        self.LLM_FALLBACK_ENDPOINTS = (os.getenv("LLM_FALLBACK_ENDPOINTS") or "").strip()
+        # LLM故障转移：备用端点使用的API Key；为空时仅同源（scheme://host:port相同）的备用端点沿用调用方的Key，其他备用端点被跳过
+        self.LLM_FALLBACK_API_KEY = (os.getenv("LLM_FALLBACK_API_KEY") or "").strip()
+        # LLM故障转移：存在备用端点时，每个非最后端点的尝试次数，用尽后转到下一个端点
+        self.LLM_FAILOVER_ATTEMPTS = _get_int("LLM_FAILOVER_ATTEMPTS", 1)
+        # LLM对冲请求：是否允许调用方（call_llm(hedge=True)）在首个请求迟迟未返回时发送重复请求（默认关闭，需显式开启）
+        self.LLM_HEDGE_ENABLED = _get_bool("LLM_HEDGE_ENABLED", False)
+        # LLM对冲请求：等待时间取该端点近期成功延迟的百分位
+        self.LLM_HEDGE_PERCENTILE = _get_float("LLM_HEDGE_PERCENTILE", 95.0)
+        # LLM对冲请求：样本不足时使用的等待时间（秒）
+        self.LLM_HEDGE_DEFAULT_DELAY = _get_float("LLM_HEDGE_DEFAULT_DELAY", 3.0)
+        # LLM对冲请求：等待时间下限（秒）
+        self.LLM_HEDGE_MIN_DELAY = _get_float("LLM_HEDGE_MIN_DELAY", 0.5)
+        # LLM对冲请求：等待时间上限（秒）
+        self.LLM_HEDGE_MAX_DELAY = _get_float("LLM_HEDGE_MAX_DELAY", 15.0)
+        # LLM对冲请求：计算百分位至少需要的延迟样本数
+        self.LLM_HEDGE_MIN_SAMPLES = _get_int("LLM_HEDGE_MIN_SAMPLES", 20)
+        # LLM对冲请求：每个端点保留的最近延迟样本数
+        self.LLM_HEDGE_WINDOW = _get_int("LLM_HEDGE_WINDOW", 200)
+        # LLM对冲请求：重复请求发往的备用端点，格式 "api_url|model_name"，为空时发往同一端点
+        self.LLM_HEDGE_ENDPOINT = (os.getenv("LLM_HEDGE_ENDPOINT") or "").strip()
+        # LLM对冲请求：备用端点使用的API Key；为空时仅同源备用端点沿用调用方的Key，否则对冲请求发往原端点
+        self.LLM_HEDGE_API_KEY = (os.getenv("LLM_HEDGE_API_KEY") or "").strip()
+        # 后台任务队列：工作协程数（领域经验自学习等低优先级任务），0表示不在本进程运行任务
+        self.JOB_QUEUE_WORKERS = _get_int("JOB_QUEUE_WORKERS", 2)
+        # 后台任务队列：单个任务的最大尝试次数，用尽后标记为Failed
+        self.JOB_MAX_ATTEMPTS = _get_int("JOB_MAX_ATTEMPTS", 3)
+        # 后台任务队列：失败重试的初始退避时间（秒），每次失败翻倍
+        self.JOB_RETRY_BASE_SECONDS = _get_int("JOB_RETRY_BASE_SECONDS", 30)
+        # 后台任务队列：重试退避时间上限（秒）
+        self.JOB_RETRY_MAX_SECONDS = _get_int("JOB_RETRY_MAX_SECONDS", 1800)
+        # 后台任务队列：任务租约（秒），进程异常退出后租约到期的任务会被重新领取
+        self.JOB_LEASE_SECONDS = _get_int("JOB_LEASE_SECONDS", 900)
+        # 后台任务队列：空闲时轮询任务表的间隔（秒）
+        self.JOB_POLL_SECONDS = _get_float("JOB_POLL_SECONDS", 5.0)
+        # 后台任务队列：调用方的API Key只保存在入队进程的内存中（不写入background_jobs表）；重启后或由其他进程执行的任务改用以下服务端配置的Key
+        self.JOB_LLM_API_KEY = (os.getenv("JOB_LLM_API_KEY") or "").strip()
+        # 后台任务队列：同上，嵌入模型使用的API Key
+        self.JOB_EMBEDDING_API_KEY = (os.getenv("JOB_EMBEDDING_API_KEY") or "").strip()
+        # 数据库连接串（SQLAlchemy URL），为空时使用 database/database.db 本地SQLite文件
+        self.DATABASE_URL = (os.getenv("DATABASE_URL") or "").strip()
+        # 异步会话使用的连接串，为空时由 DATABASE_URL 推导（sqlite -> aiosqlite，postgresql -> asyncpg）
+        self.ASYNC_DATABASE_URL = (os.getenv("ASYNC_DATABASE_URL") or "").strip()
+        # 连接池（非SQLite）：常驻连接数
+        self.DB_POOL_SIZE = _get_int("DB_POOL_SIZE", 10)
+        # 连接池（非SQLite）：高峰期可额外创建的连接数
+        self.DB_MAX_OVERFLOW = _get_int("DB_MAX_OVERFLOW", 20)
+        # 连接池（非SQLite）：取出连接前先探活，丢弃已断开的连接
+        self.DB_POOL_PRE_PING = _get_bool("DB_POOL_PRE_PING", True)
+        # 连接池（非SQLite）：连接最长复用时间（秒），避免被服务端或代理超时断开
+        self.DB_POOL_RECYCLE_SECONDS = _get_int("DB_POOL_RECYCLE_SECONDS", 1800)
+        # 连接池（非SQLite）：等待空闲连接的超时时间（秒）
+        self.DB_POOL_TIMEOUT_SECONDS = _get_int("DB_POOL_TIMEOUT_SECONDS", 30)
+        # SQLite日志模式：wal（默认，读写可并发）、delete、truncate、persist、memory、off
+        self.SQLITE_JOURNAL_MODE = (os.getenv("SQLITE_JOURNAL_MODE") or "wal").strip().lower()
+        if self.SQLITE_JOURNAL_MODE not in ("wal", "delete", "truncate", "persist", "memory", "off"):
+            self.SQLITE_JOURNAL_MODE = "wal"
+        # SQLite同步级别：normal（默认，WAL下安全且更快）、full、off
+        self.SQLITE_SYNCHRONOUS = (os.getenv("SQLITE_SYNCHRONOUS") or "normal").strip().lower()
+        if self.SQLITE_SYNCHRONOUS not in ("off", "normal", "full", "extra"):
+            self.SQLITE_SYNCHRONOUS = "normal"
+        # SQLite遇到锁时的等待时间（毫秒），超时才报 database is locked
+        self.SQLITE_BUSY_TIMEOUT_MS = _get_int("SQLITE_BUSY_TIMEOUT_MS", 5000)
+        # SQLite每个连接的页缓存大小（KiB）
+        self.SQLITE_CACHE_SIZE_KB = _get_int("SQLITE_CACHE_SIZE_KB", 65536)
+        # SQLite内存映射读取的上限（字节），0表示关闭
+        self.SQLITE_MMAP_SIZE = _get_int("SQLITE_MMAP_SIZE", 268435456)
+        # 批量Embedding：单次请求最多包含的文本条数
+        self.EMBED_BATCH_MAX_ITEMS = _get_int("EMBED_BATCH_MAX_ITEMS", 64)
+        # 批量Embedding：单次请求的估算token预算
+        self.EMBED_BATCH_MAX_TOKENS = _get_int("EMBED_BATCH_MAX_TOKENS", 100000)
+        # 批量Embedding：同时进行的批次请求数
+        self.EMBED_BATCH_CONCURRENCY = _get_int("EMBED_BATCH_CONCURRENCY", 4)
 
         # 操作选择置信度阈值：>= THETA 执行推荐操作，否则维持当前主题；也用于选择高/低置信度文案模板
         self.OPERATION_SELECTION_THETA = _get_float("OPERATION_SELECTION_THETA", 0.6)
 
+        # 单轮回复中受影响主题槽位填充的LLM并发上限
+        self.SLOT_FILL_CONCURRENCY = _get_int("SLOT_FILL_CONCURRENCY", 4)
+        # 多主题槽位填充模式：batch=一次LLM请求填充全部受影响主题；concurrent=每个主题一次请求（并发）
+        self.SLOT_FILL_MODE = (os.getenv("SLOT_FILL_MODE") or "batch").strip().lower()
+
         # 主题完成度低阈值：槽位填充比例  0 < STRATEGY_COMPLETION 时采用filling_phase策略；STRATEGY_COMPLETION < 100 使用digging_phase策略
         self.STRATEGY_COMPLETION = _get_float("STRATEGY_COMPLETION_LOW", 0.5)
 
@@ -58,6 +201,18 @@ class AppConfig:
         # Embedding服务密钥（由前端设置）
         self.EMBED_API_KEY = ""
 
+        # LLM/Embedding HTTP连接池：所有LLMHandler共享，按上游主机（scheme://host:port）复用keep-alive连接
+        # 是否启用HTTP/2（需要安装h2；未安装时自动回退到HTTP/1.1）
+        self.HTTP_POOL_HTTP2 = _get_bool("HTTP_POOL_HTTP2", True)
+        # 每个上游主机的最大连接数
+        self.HTTP_POOL_MAX_CONNECTIONS = _get_int("HTTP_POOL_MAX_CONNECTIONS", 100)
+        # 每个上游主机保留的最大空闲keep-alive连接数
+        self.HTTP_POOL_MAX_KEEPALIVE = _get_int("HTTP_POOL_MAX_KEEPALIVE", 20)
+        # 空闲keep-alive连接的保留时长（秒）
+        self.HTTP_POOL_KEEPALIVE_EXPIRY = _get_float("HTTP_POOL_KEEPALIVE_EXPIRY", 30.0)
+        # 单次请求超时（秒）
+        self.HTTP_POOL_TIMEOUT = _get_float("HTTP_POOL_TIMEOUT", 30.0)
+
         # 调度文案模板：按置信度分桶（high/low），用于生成“采访者备注”的转场或说明文本
         self.SCHED_TEMPLATES = {
             "high": {
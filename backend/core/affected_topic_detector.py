@@ -0,0 +1,27 @@
+import json
+from ..llm_handler import LLMHandler
+from ..prompts.affected_topic_detection import affected_topic_detection_prompt
+
+class AffectedTopicDetector:
+
+    @staticmethod
+    async def detect(llm_handler: LLMHandler, current_topic: dict, current_topic_conversation_record: list, topics_list: list) -> list[str]:
+        try:
+            detection_resp = await llm_handler.call_llm(
+                prompt=affected_topic_detection_prompt.replace("{current_topic_content}", str(current_topic["topic_content"]))
+                                                      .replace("{current_topic_conversation_record}", str(current_topic_conversation_record))
+                                                      .replace("{topics_list}", str(topics_list))
+            )
+            affected_list = []
+            if detection_resp:
+                try:
+                    parsed = json.loads(detection_resp)
+                    if isinstance(parsed, list):
+                        affected_list = [str(x) for x in parsed]
+                except json.JSONDecodeError:
+                    affected_list = []
+            if not affected_list:
+                affected_list = [current_topic["topic_number"]]
+        except Exception:
+            affected_list = [current_topic["topic_number"]]
+        return affected_list
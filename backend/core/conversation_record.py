@@ -0,0 +1,144 @@
+import threading
+from collections import OrderedDict
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from database.models import Message, Topic, Section, Project
+from ..config import CONFIG
+from ..llm_handler import LLMHandler
+
+
+def estimate_record_tokens(record: list[dict]) -> int:
+    """Estimated prompt tokens of a record, measured on the same str() form that is pasted into prompts."""
+    return LLMHandler.estimate_tokens(str(record))
+
+
+class _TopicRecord:
+    """Append-only conversation record of one topic plus the id of the last message folded into it."""
+
+    def __init__(self) -> None:
+        self.rounds: list[dict] = []
+        self.last_message_id = 0
+
+    def append(self, m: Message) -> None:
+        if m.role == 'Interviewer':
+            self.rounds.append({
+                "Round": len(self.rounds) + 1,
+                "Interviewer_id": m.message_id,
+                "Interviewer": m.message_content,
+            })
+        elif self.rounds:
+            self.rounds[-1]["Interviewee_id"] = m.message_id
+            self.rounds[-1]["Interviewee"] = m.message_content
+        self.last_message_id = max(self.last_message_id, m.message_id)
+
+
+class ConversationRecordCache:
+    """Per-topic conversation records kept in memory and extended incrementally.
+
+    Each lookup only fetches messages newer than the last one already folded in, so a turn costs one small
+    query instead of re-reading the topic's whole history. Updates/deletes of messages and topic deletions
+    drop the affected entries (see the listeners below); the least recently used topics are evicted past
+    CONVERSATION_CACHE_MAX_TOPICS.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.RLock()
+        self._records: "OrderedDict[int, _TopicRecord]" = OrderedDict()
+        self._stats = {"hits": 0, "misses": 0, "appended_messages": 0, "invalidations": 0}
+
+    def _refresh(self, db: Session, topic_id: int) -> _TopicRecord:
+        with self._lock:
+            rec = self._records.get(topic_id)
+            if rec is None:
+                rec = _TopicRecord()
+                self._records[topic_id] = rec
+                self._stats["misses"] += 1
+            else:
+                self._stats["hits"] += 1
+            self._records.move_to_end(topic_id)
+            new_messages = (
+                db.query(Message)
+                .filter(Message.topic_id == topic_id, Message.message_id > rec.last_message_id)
+                .order_by(Message.message_id)
+                .all()
+            )
+            # Async sessions run this through run_sync, so another request can refresh the same topic while this
+            # query is in flight; messages already folded in by it are skipped
+            new_messages = [m for m in new_messages if m.message_id > rec.last_message_id]
+            for m in new_messages:
+                rec.append(m)
+            self._stats["appended_messages"] += len(new_messages)
+            while len(self._records) > max(1, CONFIG.CONVERSATION_CACHE_MAX_TOPICS):
+                self._records.popitem(last=False)
+            return rec
+
+    def record(self, db: Session, topic_id: int, with_ids: bool = False, last_rounds: int | None = None) -> list[dict]:
+        """Conversation record of a topic as [{"Round", "Interviewer", "Interviewee"}, ...].
+
+        `with_ids` keeps the Interviewer_id / Interviewee_id keys used for slot evidence; `last_rounds` limits
+        the view to the most recent rounds (Round numbers stay those of the full record).
+        """
+        with self._lock:
+            rounds = self._refresh(db, topic_id).rounds
+            if last_rounds is not None:
+                rounds = rounds[-last_rounds:] if last_rounds > 0 else []
+            if with_ids:
+                return [dict(r) for r in rounds]
+            return [{k: v for k, v in r.items() if not k.endswith("_id")} for r in rounds]
+
+    def prompt_record(self, db: Session, topic: Topic, with_ids: bool = False) -> list[dict]:
+        """Record to paste into prompts, bounded by CONVERSATION_TOKEN_BUDGET.
+
+        Short topics get the full record. Longer ones get the stored rolling summary (as a leading
+        {"Round": "1-N", "Summary": ...} entry) followed by the rounds it does not cover, dropping the oldest
+        verbatim rounds until the budget fits. The last round is always kept, so record[-1] stays the latest
+        exchange.
+        """
+        rounds = self.record(db, topic.topic_id, with_ids=with_ids)
+        budget = max(1, CONFIG.CONVERSATION_TOKEN_BUDGET)
+        if not rounds or estimate_record_tokens(rounds) <= budget:
+            return rounds
+        through = int(topic.summary_through_round or 0) if topic.conversation_summary else 0
+        through = min(through, len(rounds) - 1)
+        head = [{"Round": f"1-{through}", "Summary": topic.conversation_summary}] if through > 0 else []
+        window = rounds[through:]
+        while len(window) > 1 and estimate_record_tokens(head + window) > budget:
+            window = window[1:]
+        return head + window
+
+    def invalidate(self, topic_id: int | None = None) -> None:
+        with self._lock:
+            if topic_id is None:
+                self._records.clear()
+            else:
+                self._records.pop(topic_id, None)
+            self._stats["invalidations"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "topics": len(self._records),
+                "max_topics": CONFIG.CONVERSATION_CACHE_MAX_TOPICS,
+                **self._stats,
+            }
+
+
+CONVERSATION_RECORDS = ConversationRecordCache()
+
+
+@event.listens_for(Message, "after_update")
+@event.listens_for(Message, "after_delete")
+def _invalidate_on_message_change(mapper, connection, target):
+    CONVERSATION_RECORDS.invalidate(target.topic_id)
+
+
+@event.listens_for(Topic, "after_delete")
+def _invalidate_on_topic_delete(mapper, connection, target):
+    CONVERSATION_RECORDS.invalidate(target.topic_id)
+
+
+# Sections/projects remove their topics through ON DELETE CASCADE, which emits no per-topic events
+@event.listens_for(Section, "after_delete")
+@event.listens_for(Project, "after_delete")
+def _invalidate_on_cascade_delete(mapper, connection, target):
+    CONVERSATION_RECORDS.invalidate()
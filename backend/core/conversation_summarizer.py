@@ -0,0 +1,84 @@
+import asyncio
+from sqlalchemy.orm import Session
+from database.database import with_session
+from database.models import Topic
+from ..llm_handler import LLMHandler
+from ..llm_admission import PRIORITY_BACKGROUND
+from ..config import CONFIG
+from ..prompts.conversation_summary import conversation_summary_prompt
+from .conversation_record import CONVERSATION_RECORDS, estimate_record_tokens
+
+# Topics whose summary is being computed, and strong references to the running tasks
+_SUMMARY_RUNNING: set[int] = set()
+_SUMMARY_TASKS: set[asyncio.Task] = set()
+
+
+class ConversationSummarizer:
+    """Keeps Topic.conversation_summary covering every round older than the last CONVERSATION_KEEP_ROUNDS."""
+
+    @staticmethod
+    def _pending(db: Session, topic_id: int) -> tuple[str, list[dict], int] | None:
+        """(previous summary, rounds to fold in, new summary_through_round), or None when nothing is due."""
+        topic = db.query(Topic).filter(Topic.topic_id == topic_id).first()
+        if not topic:
+            return None
+        rounds = CONVERSATION_RECORDS.record(db, topic_id)
+        # Nothing to do while the whole record still fits the prompt budget
+        if estimate_record_tokens(rounds) <= CONFIG.CONVERSATION_TOKEN_BUDGET:
+            return None
+        target = len(rounds) - max(1, CONFIG.CONVERSATION_KEEP_ROUNDS)
+        through = int(topic.summary_through_round or 0) if topic.conversation_summary else 0
+        if target <= through:
+            return None
+        return topic.conversation_summary or "", rounds[through:target], target
+
+    @staticmethod
+    def _store(db: Session, topic_id: int, summary: str, target: int) -> bool:
+        topic = db.query(Topic).filter(Topic.topic_id == topic_id).first()
+        if not topic:
+            return False
+        topic.conversation_summary = summary
+        topic.summary_through_round = target
+        db.commit()
+        return True
+
+    @staticmethod
+    async def update_summary(llm_handler: LLMHandler, topic_id: int) -> bool:
+        """Fold the rounds that fell out of the kept window into the topic's summary.
+
+        The reads and the write use their own sync sessions in a worker thread; only the LLM call runs on the
+        loop, so a commit never waits on the loop for a lock held by an async-session transaction.
+        """
+        pending = await asyncio.to_thread(with_session, ConversationSummarizer._pending, topic_id)
+        if pending is None:
+            return False
+        previous, new_rounds, target = pending
+        response = await llm_handler.call_llm(
+            prompt=conversation_summary_prompt
+                .replace("{previous_summary}", previous)
+                .replace("{new_rounds}", str(new_rounds))
+        )
+        if not response:
+            return False
+        return await asyncio.to_thread(with_session, ConversationSummarizer._store, topic_id, response.strip(), target)
+
+    @staticmethod
+    def schedule(llm_handler: LLMHandler, topic_id: int) -> bool:
+        """Run update_summary in the background; False if disabled or already running."""
+        if not CONFIG.CONVERSATION_SUMMARY_ENABLED or topic_id in _SUMMARY_RUNNING:
+            return False
+        _SUMMARY_RUNNING.add(topic_id)
+        llm_handler = llm_handler.with_priority(PRIORITY_BACKGROUND)
+
+        async def _run() -> None:
+            try:
+                await ConversationSummarizer.update_summary(llm_handler=llm_handler, topic_id=topic_id)
+            except Exception as e:
+                print(f"Conversation summary failed for topic {topic_id}: {e}")
+            finally:
+                _SUMMARY_RUNNING.discard(topic_id)
+
+        task = asyncio.create_task(_run())
+        _SUMMARY_TASKS.add(task)
+        task.add_done_callback(_SUMMARY_TASKS.discard)
+        return True
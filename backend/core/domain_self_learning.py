@@ -3,11 +3,17 @@ import asyncio
 from sqlalchemy.orm import Session
 from datetime import datetime, timezone
 from database.models import Project, Section, Topic, Slot, DomainExperience
+from database.embedding_codec import set_embedding
 from ..llm_handler import LLMHandler
+from ..llm_admission import PRIORITY_BACKGROUND
 from ..config import CONFIG
+from ..job_queue import JOB_QUEUE
+from .embedding_index import EMBEDDING_INDEX
 from ..prompts.domain_optimization import domain_optimization_prompt
 from ..prompts.domain_ingest import domain_ingest_prompt
 
+DOMAIN_LEARNING_JOB = "domain_learning"
+
 
 class DomainSelfLearner:
     @staticmethod
@@ -64,84 +70,141 @@ class DomainSelfLearner:
 
     @staticmethod
     async def optimize_domain_experience(db: Session, project_id: int, domain_id: int, llm_config: dict | None, embed_config: dict | None) -> None:
-        d = db.query(DomainExperience).filter(DomainExperience.domain_id == domain_id).first()
-        if not d:
+        def _load():
+            d = db.query(DomainExperience).filter(DomainExperience.domain_id == domain_id).first()
+            if not d:
+                return None
+            return d, DomainSelfLearner.build_project_structure(db, project_id)
+
+        # Database work runs in a worker thread so its sync commits never block the event loop
+        loaded = await asyncio.to_thread(_load)
+        if loaded is None:
             return
-        project_structure = DomainSelfLearner.build_project_structure(db, project_id)
+        d, project_structure = loaded
         if not llm_config or not llm_config.get("api_url") or not llm_config.get("api_key") or not llm_config.get("model_name"):
             return
-        llm = LLMHandler(api_url=llm_config["api_url"], api_key=llm_config["api_key"], model_name=llm_config["model_name"])
+        llm = LLMHandler(api_url=llm_config["api_url"], api_key=llm_config["api_key"], model_name=llm_config["model_name"], priority=PRIORITY_BACKGROUND)
         response = await llm.call_llm(
             prompt=domain_optimization_prompt
                 .replace("{original_domain_experience}", d.domain_experience_content or "")
                 .replace("{project_structure}", project_structure)
         )
         optimized = (response or "").strip()
-        if optimized:
+        if not optimized:
+            raise RuntimeError(f"The LLM returned no optimized experience for domain {domain_id}")
+        vec = None
+        # Recompute embedding if API key configured
+        if embed_config and embed_config.get("api_url") and embed_config.get("api_key") and embed_config.get("model_name"):
+            handler = LLMHandler(api_url=embed_config["api_url"], api_key=embed_config["api_key"], model_name=embed_config["model_name"], priority=PRIORITY_BACKGROUND)
+            vec = await handler.get_embedding(f"{d.domain_name}\n{d.domain_description}\n{optimized}", embedding_api_url=embed_config["api_url"], model_name=embed_config["model_name"])
+
+        def _save() -> None:
             d.domain_experience_content = optimized
             d.updated_time = datetime.now(timezone.utc)
-            # Recompute embedding if API key configured
-            if embed_config and embed_config.get("api_url") and embed_config.get("api_key") and embed_config.get("model_name"):
-                handler = LLMHandler(api_url=embed_config["api_url"], api_key=embed_config["api_key"], model_name=embed_config["model_name"])
-                vec = await handler.get_embedding(f"{d.domain_name}\n{d.domain_description}\n{optimized}", embedding_api_url=embed_config["api_url"], model_name=embed_config["model_name"]) 
-                if vec is not None:
-                    try:
-                        d.embedding = json.dumps(vec)
-                    except Exception:
-                        pass
+            if vec is not None:
+                try:
+                    set_embedding(d, vec, model_name=embed_config["model_name"], dtype=CONFIG.EMBEDDING_STORAGE_DTYPE)
+                except Exception:
+                    pass
             db.commit()
+            EMBEDDING_INDEX.upsert_domain(db, d)
+
+        await asyncio.to_thread(_save)
 
     @staticmethod
-    async def learn_if_contributing(db: Session, project_id: int, llm_config: dict | None, embed_config: dict | None) -> None:
-        project = db.query(Project).filter(Project.project_id == project_id).first()
-        if not project:
-            return
-        # Only run when interview completed
-        if str(project.project_status) != 'Completed':
-            return
-        kc = DomainSelfLearner.compute_kc_score(db, project_id)
-        try:
-            score_kc = float(kc.get("Score_KC", 0.0))
-        except Exception:
-            score_kc = 0.0
-        if score_kc < float(CONFIG.KC_THRESHOLD):
-            return
-        # If domain_ids exist => optimize; else => ingest from project structure
-        domain_ids = []
-        if project.domain_ids:
+    async def learn_if_contributing(db: Session, project_id: int, llm_config: dict | None, embed_config: dict | None,
+                                    domain_ids: list[int] | None = None) -> list[int]:
+        """Optimize the project's domain experiences (or ingest a new one); returns the domain ids that failed.
+
+        `domain_ids` restricts the optimization to those domains, so a retry does not redo the ones that succeeded.
+        """
+        def _plan() -> list[int] | None:
+            project = db.query(Project).filter(Project.project_id == project_id).first()
+            if not project:
+                return None
+            # Only run when interview completed
+            if str(project.project_status) != 'Completed':
+                return None
+            kc = DomainSelfLearner.compute_kc_score(db, project_id)
             try:
-                domain_ids = json.loads(project.domain_ids)
+                score_kc = float(kc.get("Score_KC", 0.0))
             except Exception:
-                pass
+                score_kc = 0.0
+            if score_kc < float(CONFIG.KC_THRESHOLD):
+                return None
+            # If domain_ids exist => optimize; else => ingest from project structure
+            if domain_ids is not None:
+                return domain_ids
+            if project.domain_ids:
+                try:
+                    return json.loads(project.domain_ids)
+                except Exception:
+                    pass
+            return []
+
+        domain_ids = await asyncio.to_thread(_plan)
+        if domain_ids is None:
+            return []
+        failed = []
         if domain_ids and len(domain_ids) > 0:
             for did in domain_ids:
                 try:
                     await DomainSelfLearner.optimize_domain_experience(db, project_id, int(did), llm_config=llm_config, embed_config=embed_config)
-                except Exception:
+                except Exception as e:
+                    await asyncio.to_thread(db.rollback)
+                    print(f"Optimizing domain experience {did} from project {project_id} failed: {e}")
+                    failed.append(int(did))
                     await asyncio.sleep(0)
         else:
-            try:
-                await DomainSelfLearner.ingest_domain_experience_from_project(db, project_id, llm_config=llm_config, embed_config=embed_config)
-            except Exception:
-                await asyncio.sleep(0)
+            await DomainSelfLearner.ingest_domain_experience_from_project(db, project_id, llm_config=llm_config, embed_config=embed_config)
+        return failed
+
+    @staticmethod
+    async def run_learning_job(db: Session, project_id: int, payload: dict) -> None:
+        """JOB_QUEUE handler of DOMAIN_LEARNING_JOB; failed domains are kept in the payload for the retry.
+
+        The API keys come from the queue's in-memory secrets, else from JOB_LLM_API_KEY / JOB_EMBEDDING_API_KEY.
+        """
+        llm_config = payload.get("llm_config")
+        if llm_config:
+            llm_config = {**llm_config, "api_key": payload.get("llm_api_key") or llm_config.get("api_key") or CONFIG.JOB_LLM_API_KEY}
+            if not llm_config["api_key"]:
+                raise RuntimeError(f"No LLM API key for the self-learning job of project {project_id}")
+        embed_config = payload.get("embed_config")
+        if embed_config:
+            embed_config = {**embed_config, "api_key": payload.get("embed_api_key") or embed_config.get("api_key") or CONFIG.JOB_EMBEDDING_API_KEY}
+        failed = await DomainSelfLearner.learn_if_contributing(
+            db=db,
+            project_id=project_id,
+            llm_config=llm_config,
+            embed_config=embed_config,
+            domain_ids=payload.get("domain_ids"),
+        )
+        if failed:
+            payload["domain_ids"] = failed
+            raise RuntimeError(f"Optimizing domain experiences {failed} failed")
 
     @staticmethod
     async def ingest_domain_experience_from_project(db: Session, project_id: int, llm_config: dict | None, embed_config: dict | None) -> None:
-        project = db.query(Project).filter(Project.project_id == project_id).first()
-        if not project:
-            return
         if not llm_config or not llm_config.get("api_url") or not llm_config.get("api_key") or not llm_config.get("model_name"):
             return
-        llm = LLMHandler(api_url=llm_config["api_url"], api_key=llm_config["api_key"], model_name=llm_config["model_name"])
-        documents = DomainSelfLearner.build_project_structure(db, project_id)
-        domain_name = project.project_name or f"Project-{project_id}"
-        domain_description = project.initial_requirements or ""
+
+        def _load():
+            project = db.query(Project).filter(Project.project_id == project_id).first()
+            if not project:
+                return None
+            return project.project_name or f"Project-{project_id}", project.initial_requirements or "", project.user_id, \
+                DomainSelfLearner.build_project_structure(db, project_id)
+
+        loaded = await asyncio.to_thread(_load)
+        if loaded is None:
+            return
+        domain_name, domain_description, user_id, documents = loaded
+        llm = LLMHandler(api_url=llm_config["api_url"], api_key=llm_config["api_key"], model_name=llm_config["model_name"], priority=PRIORITY_BACKGROUND)
         prompt = domain_ingest_prompt.replace("{domain_name}", domain_name).replace("{domain_description}", domain_description).replace("{documents}", documents)
-        resp = None
-        try:
-            resp = await llm.call_llm(prompt=prompt)
-        except Exception:
-            resp = None
+        resp = await llm.call_llm(prompt=prompt)
+        if not resp:
+            raise RuntimeError(f"The LLM returned no domain experience for project {project_id}")
         content = ""
         tags = []
         if resp:
@@ -163,29 +226,39 @@ class DomainSelfLearner:
             tags = data.get("tags", [])
         if not content:
             return
-        d = DomainExperience(
-            domain_number=f"domain-{project_id}-{int(datetime.now(timezone.utc).timestamp())}",
-            domain_name=domain_name,
-            domain_description=domain_description,
-            domain_experience_content=content,
-            user_id=project.user_id,
-            updated_time=datetime.now(timezone.utc),
-            tags=(json.dumps(tags, ensure_ascii=False) if isinstance(tags, list) else None),
-        )
-        db.add(d)
-        db.commit()
-        db.refresh(d)
+        vec = None
         if embed_config and embed_config.get("api_url") and embed_config.get("api_key") and embed_config.get("model_name"):
-            handler = LLMHandler(api_url=embed_config["api_url"], api_key=embed_config["api_key"], model_name=embed_config["model_name"])
-            vec = await handler.get_embedding(f"{d.domain_name}\n{d.domain_description}\n{d.domain_experience_content}", embedding_api_url=embed_config["api_url"], model_name=embed_config["model_name"])
+            handler = LLMHandler(api_url=embed_config["api_url"], api_key=embed_config["api_key"], model_name=embed_config["model_name"], priority=PRIORITY_BACKGROUND)
+            vec = await handler.get_embedding(f"{domain_name}\n{domain_description}\n{content}", embedding_api_url=embed_config["api_url"], model_name=embed_config["model_name"])
+
+        def _save() -> None:
+            d = DomainExperience(
+                domain_number=f"domain-{project_id}-{int(datetime.now(timezone.utc).timestamp())}",
+                domain_name=domain_name,
+                domain_description=domain_description,
+                domain_experience_content=content,
+                user_id=user_id,
+                updated_time=datetime.now(timezone.utc),
+                tags=(json.dumps(tags, ensure_ascii=False) if isinstance(tags, list) else None),
+            )
+            if vec is not None:
+                try:
+                    set_embedding(d, vec, model_name=embed_config["model_name"], dtype=CONFIG.EMBEDDING_STORAGE_DTYPE)
+                except Exception:
+                    set_embedding(d, None)
+            db.add(d)
+            db.commit()
+            db.refresh(d)
             if vec is not None:
+                EMBEDDING_INDEX.upsert_domain(db, d)
+            project = db.query(Project).filter(Project.project_id == project_id).first()
+            if project:
                 try:
-                    d.embedding = json.dumps(vec)
+                    project.domain_ids = json.dumps([int(d.domain_id)], ensure_ascii=False)
                 except Exception:
-                    d.embedding = None
+                    project.domain_ids = json.dumps([d.domain_id])
                 db.commit()
-        try:
-            project.domain_ids = json.dumps([int(d.domain_id)], ensure_ascii=False)
-        except Exception:
-            project.domain_ids = json.dumps([d.domain_id])
-        db.commit()
+
+        await asyncio.to_thread(_save)
+
+JOB_QUEUE.register(DOMAIN_LEARNING_JOB, DomainSelfLearner.run_learning_job)
@@ -0,0 +1,187 @@
+import threading
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from database.models import DomainExperience
+from database.embedding_codec import get_embedding
+
+
+class _Shard:
+    """Contiguous float32 matrix of L2-normalised embeddings that all share one dimension."""
+
+    def __init__(self, dim: int) -> None:
+        self.dim = dim
+        self.matrix = np.zeros((16, dim), dtype=np.float32)
+        self.user_ids = np.zeros(16, dtype=np.int64)
+        self.domain_ids = np.zeros(16, dtype=np.int64)
+        self.size = 0
+        self.pos: dict[int, int] = {}
+
+    def upsert(self, domain_id: int, user_id: int, unit: np.ndarray) -> None:
+        i = self.pos.get(domain_id)
+        if i is None:
+            if self.size == self.matrix.shape[0]:
+                cap = self.matrix.shape[0] * 2
+                self.matrix = np.resize(self.matrix, (cap, self.dim))
+                self.user_ids = np.resize(self.user_ids, cap)
+                self.domain_ids = np.resize(self.domain_ids, cap)
+            i = self.size
+            self.size += 1
+            self.pos[domain_id] = i
+        self.matrix[i] = unit
+        self.user_ids[i] = user_id
+        self.domain_ids[i] = domain_id
+
+    def remove(self, domain_id: int) -> None:
+        i = self.pos.pop(domain_id, None)
+        if i is None:
+            return
+        last = self.size - 1
+        if i != last:
+            # Keep rows contiguous by moving the last row into the hole
+            self.matrix[i] = self.matrix[last]
+            self.user_ids[i] = self.user_ids[last]
+            self.domain_ids[i] = self.domain_ids[last]
+            self.pos[int(self.domain_ids[i])] = i
+        self.size = last
+
+    def scores(self, unit: np.ndarray, user_id: int | None) -> tuple[np.ndarray, np.ndarray]:
+        m = self.matrix[:self.size]
+        ids = self.domain_ids[:self.size]
+        if user_id is not None:
+            mask = self.user_ids[:self.size] == user_id
+            m = m[mask]
+            ids = ids[mask]
+        return ids, m @ unit
+
+
+class EmbeddingIndex:
+    """Process-level index of domain-experience embeddings answering cosine queries with one matrix-vector product.
+
+    Rows are pre-normalised so cosine similarity is a plain dot product. The index is loaded lazily from the
+    database, updated incrementally by the routes that write embeddings, and reloaded whenever the
+    domain_experiences table changed behind its back (another worker, a manual edit).
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.RLock()
+        self._shards: dict[int, _Shard] = {}
+        self._signature = None
+
+    @staticmethod
+    def _normalize(vec) -> np.ndarray | None:
+        try:
+            arr = np.asarray(vec, dtype=np.float32).reshape(-1)
+        except Exception:
+            return None
+        if arr.size == 0:
+            return None
+        norm = float(np.linalg.norm(arr))
+        if norm == 0.0 or not np.isfinite(norm):
+            return None
+        return arr / norm
+
+    @staticmethod
+    def _db_signature(db: Session) -> tuple:
+        row = db.query(func.count(DomainExperience.domain_id), func.max(DomainExperience.updated_time)).one()
+        return (int(row[0] or 0), str(row[1]))
+
+    def _set(self, domain_id: int, user_id: int, vec) -> None:
+        unit = self._normalize(vec) if vec is not None else None
+        for shard in self._shards.values():
+            if unit is None or shard.dim != unit.shape[0]:
+                shard.remove(domain_id)
+        if unit is None:
+            return
+        shard = self._shards.get(unit.shape[0])
+        if shard is None:
+            shard = _Shard(unit.shape[0])
+            self._shards[unit.shape[0]] = shard
+        shard.upsert(domain_id, user_id, unit)
+
+    def reload(self, db: Session) -> None:
+        with self._lock:
+            signature = self._db_signature(db)
+            rows = db.query(
+                DomainExperience.domain_id,
+                DomainExperience.user_id,
+                DomainExperience.embedding_blob,
+                DomainExperience.embedding_dim,
+                DomainExperience.embedding_dtype,
+                DomainExperience.embedding,
+            ).filter((DomainExperience.embedding_blob != None) | (DomainExperience.embedding != None)).all()
+            self._shards = {}
+            for r in rows:
+                self._set(int(r.domain_id), int(r.user_id), get_embedding(r))
+            self._signature = signature
+
+    def sync(self, db: Session) -> None:
+        with self._lock:
+            if self._signature is None or self._signature != self._db_signature(db):
+                self.reload(db)
+
+    def upsert_domain(self, db: Session, d: DomainExperience) -> None:
+        """Call after committing a created/updated DomainExperience."""
+        with self._lock:
+            if self._signature is None:
+                return
+            self._set(int(d.domain_id), int(d.user_id), get_embedding(d))
+            self._signature = self._db_signature(db)
+
+    def upsert_vectors(self, db: Session, items: list[tuple[int, int, list[float]]]) -> None:
+        """Bulk variant of upsert_domain taking (domain_id, user_id, vector) triples that were just committed."""
+        with self._lock:
+            if self._signature is None:
+                return
+            for domain_id, user_id, vec in items:
+                self._set(int(domain_id), int(user_id), vec)
+            self._signature = self._db_signature(db)
+
+    def remove_domain(self, db: Session, domain_id: int) -> None:
+        """Call after committing the deletion of a DomainExperience."""
+        with self._lock:
+            if self._signature is None:
+                return
+            for shard in self._shards.values():
+                shard.remove(int(domain_id))
+            self._signature = self._db_signature(db)
+
+    def scores(self, db: Session, qvec, user_id: int | None = None) -> dict[int, float]:
+        """Cosine similarity of the query against every indexed domain (optionally only one user's)."""
+        unit = self._normalize(qvec)
+        if unit is None:
+            return {}
+        with self._lock:
+            self.sync(db)
+            shard = self._shards.get(unit.shape[0])
+            if shard is None or shard.size == 0:
+                return {}
+            ids, sims = shard.scores(unit, user_id)
+        return {int(i): float(s) for i, s in zip(ids.tolist(), sims.tolist())}
+
+    def top_k(self, db: Session, qvec, k: int, user_id: int | None = None) -> list[tuple[int, float]]:
+        unit = self._normalize(qvec)
+        if unit is None or k <= 0:
+            return []
+        with self._lock:
+            self.sync(db)
+            shard = self._shards.get(unit.shape[0])
+            if shard is None or shard.size == 0:
+                return []
+            ids, sims = shard.scores(unit, user_id)
+        if sims.size > k:
+            part = np.argpartition(-sims, k - 1)[:k]
+        else:
+            part = np.arange(sims.size)
+        order = part[np.argsort(-sims[part])]
+        return [(int(ids[i]), float(sims[i])) for i in order]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "loaded": self._signature is not None,
+                "shards": {str(dim): shard.size for dim, shard in self._shards.items()},
+            }
+
+
+EMBEDDING_INDEX = EmbeddingIndex()
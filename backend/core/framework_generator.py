@@ -28,7 +28,7 @@ class FrameworkGenerator:
                 })
                 domain_experience_content_map[domain_object.domain_number] = domain_object.domain_experience_content
             # Choose a domain
-            domain_number =  await llm_handler.call_llm(domain_selection_prompt, f"User's input: {user_input}\n domain_list: {domains_list}")
+            domain_number =  await llm_handler.call_llm(domain_selection_prompt, f"User's input: {user_input}\n domain_list: {domains_list}", cache=True)
             domain_number = str(domain_number or "").strip().strip('"').strip("'")
             domain_experience_content = domain_experience_content_map.get(domain_number)
             if not domain_experience_content:
@@ -83,9 +83,14 @@ class FrameworkGenerator:
                     db.flush()  # Refresh to obtain the topic_id
 
                     # Traverse the slots under this topic
+                    seen_slot_numbers = set()
                     for slot_data in topic_data["slots"]:
                         slot_number = slot_data["slot_number"]
                         slot_key = slot_data["slot_key"]
+                        # slot_number is unique per topic; keep the first occurrence
+                        if slot_number in seen_slot_numbers:
+                            continue
+                        seen_slot_numbers.add(slot_number)
 
                         # create slot
                         slot = Slot(
@@ -145,9 +150,13 @@ class FrameworkGenerator:
                     )
                     db.add(topic)
                     db.flush()
+                    seen_slot_numbers = set()
                     for slot_data in topic_data["slots"]:
                         slot_number = slot_data["slot_number"]
                         slot_key = slot_data["slot_key"]
+                        if slot_number in seen_slot_numbers:
+                            continue
+                        seen_slot_numbers.add(slot_number)
                         slot = Slot(
                             slot_number=slot_number,
                             slot_key=slot_key,
@@ -10,7 +10,8 @@ class OperationSelector:
             # generate an interview framework
             response = await llm_handler.call_llm(
                 prompt=next_operation_selection_prompt.replace("{current_topic_content}", str(current_topic["topic_content"]))
-                                                       .replace("{current_topic_conversation_record}", str(current_topic_conversation_record)).replace("{topics_list}", str(topics_list)))
+                                                       .replace("{current_topic_conversation_record}", str(current_topic_conversation_record)).replace("{topics_list}", str(topics_list)),
+                hedge=True)
 
             r = (response or "").strip()
             if r.startswith("```"):
@@ -1,7 +1,8 @@
 import json
 import hashlib
 from typing import Tuple
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from database.models import Topic, Section
 from ..llm_handler import LLMHandler
 from ..prompts.topic_dependency import topic_dependency_prompt
@@ -10,14 +11,19 @@ PRIORITY_CACHE: dict[int, Tuple[str, list[dict]]] = {}
 
 class PriorityBuilder:
     @staticmethod
-    async def build(db: Session, llm_handler: LLMHandler, project_id: int) -> list[dict]:
-        topics = db.query(Topic).join(Section).filter(Section.project_id == project_id).all()
+    async def build(db: AsyncSession, llm_handler: LLMHandler, project_id: int) -> list[dict]:
+        topics = (await db.execute(
+            select(Topic.topic_number, Topic.topic_content, Topic.topic_status, Section.section_number)
+            .join(Section, Section.section_id == Topic.section_id)
+            .where(Topic.project_id == project_id)
+            .order_by(Topic.topic_id)
+        )).all()
         data = []
         for t in topics:
             data.append({
                 "topic_number": t.topic_number,
                 "topic_content": t.topic_content,
-                "section_number": t.section.section_number,
+                "section_number": t.section_number,
                 "status": t.topic_status,
             })
         canonical = json.dumps(sorted(data, key=lambda x: x["topic_number"]), ensure_ascii=False)
@@ -25,7 +31,7 @@ class PriorityBuilder:
         cached = PRIORITY_CACHE.get(project_id)
         if cached and cached[0] == digest:
             return cached[1]
-        resp = await llm_handler.call_llm(prompt=topic_dependency_prompt.replace("{topics}", str(data)))
+        resp = await llm_handler.call_llm(prompt=topic_dependency_prompt.replace("{topics}", str(data)), cache=True)
         try:
             edges = json.loads(resp)
         except Exception:
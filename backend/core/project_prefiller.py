@@ -1,25 +1,99 @@
 import json
-from sqlalchemy.orm import Session
-from database.models import Slot, Topic, Section, Project
+import asyncio
+import hashlib
+from sqlalchemy import update, bindparam
+from sqlalchemy.orm import Session, joinedload
+from database.database import SessionLocal
+from database.models import Slot, Topic, Project
 from ..llm_handler import LLMHandler
+from ..llm_admission import PRIORITY_BACKGROUND
 from ..prompts.initial_slots_filling import initial_slots_filling_prompt
 
+# Projects whose background prefill is running, and strong references to the tasks themselves
+_PREFILL_RUNNING: set[int] = set()
+_PREFILL_TASKS: set[asyncio.Task] = set()
+
 
 class ProjectPrefiller:
     @staticmethod
-    async def prefill_all_from_initial(db: Session, llm_handler: LLMHandler, project_id: int) -> None:
+    def fingerprint(db: Session, project: Project) -> str:
+        """Hash of the initial requirements plus the slot schema (topics and slot keys, not slot values)."""
+        rows = (
+            db.query(Topic.topic_number, Topic.topic_content, Slot.slot_number, Slot.slot_key)
+            .outerjoin(Slot, Slot.topic_id == Topic.topic_id)
+            .filter(Topic.project_id == project.project_id)
+            .order_by(Topic.topic_id, Slot.slot_id)
+            .all()
+        )
+        schema = [[r.topic_number, r.topic_content, r.slot_number, r.slot_key] for r in rows]
+        canonical = json.dumps([(project.initial_requirements or "").strip(), schema], ensure_ascii=False)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def needs_prefill(db: Session, project: Project) -> bool:
+        if not (project.initial_requirements or "").strip():
+            return False
+        return project.prefill_fingerprint != ProjectPrefiller.fingerprint(db, project)
+
+    @staticmethod
+    async def prefill_if_changed(db: Session, llm_handler: LLMHandler, project_id: int) -> bool:
+        """Run the prefill only when the fingerprint changed; the fingerprint is stored once prefill succeeded."""
         project = db.query(Project).filter(Project.project_id == project_id).first()
         if not project:
-            return
+            return False
+        fingerprint = ProjectPrefiller.fingerprint(db, project)
+        if project.prefill_fingerprint == fingerprint:
+            return False
+        if not await ProjectPrefiller.prefill_all_from_initial(db=db, llm_handler=llm_handler, project_id=project_id):
+            return False
+
+        def _store() -> None:
+            project = db.query(Project).filter(Project.project_id == project_id).first()
+            if project:
+                project.prefill_fingerprint = fingerprint
+                db.commit()
+
+        await asyncio.to_thread(_store)
+        return True
+
+    @staticmethod
+    def schedule_prefill(llm_handler: LLMHandler, project_id: int) -> bool:
+        """Start prefill_if_changed in the background with its own session; False if one is already running."""
+        if project_id in _PREFILL_RUNNING:
+            return False
+        _PREFILL_RUNNING.add(project_id)
+        llm_handler = llm_handler.with_priority(PRIORITY_BACKGROUND)
+
+        async def _run() -> None:
+            db = SessionLocal()
+            try:
+                await ProjectPrefiller.prefill_if_changed(db=db, llm_handler=llm_handler, project_id=project_id)
+            except Exception as e:
+                db.rollback()
+                print(f"Background prefill failed for project {project_id}: {e}")
+            finally:
+                db.close()
+                _PREFILL_RUNNING.discard(project_id)
+
+        task = asyncio.create_task(_run())
+        _PREFILL_TASKS.add(task)
+        task.add_done_callback(_PREFILL_TASKS.discard)
+        return True
+
+    @staticmethod
+    async def prefill_all_from_initial(db: Session, llm_handler: LLMHandler, project_id: int) -> bool:
+        project = db.query(Project).filter(Project.project_id == project_id).first()
+        if not project:
+            return False
         initial = (project.initial_requirements or "").strip()
         if not initial:
-            return
+            return False
 
-        # Build topics list
+        # Build topics list (one eager-loaded read of the whole topic/slot tree)
         topics = (
             db.query(Topic)
-            .join(Section)
-            .filter(Section.project_id == project_id)
+            .options(joinedload(Topic.slots))
+            .filter(Topic.project_id == project_id)
             .order_by(Topic.topic_id)
             .all()
         )
@@ -30,21 +104,17 @@ class ProjectPrefiller:
 
         # Build slots_by_topic: include current values
         slots_by_topic: dict[str, dict] = {}
+        slot_index: dict[tuple[str, str], Slot] = {}
         for t in topics:
-            ts = (
-                db.query(Slot)
-                .filter(Slot.topic_id == t.topic_id)
-                .order_by(Slot.slot_id)
-                .all()
-            )
             slots = []
-            for s in ts:
+            for s in sorted(t.slots, key=lambda x: x.slot_id):
                 slots.append({
                     "slot_number": s.slot_number,
                     "slot_key": s.slot_key,
                     "slot_value": s.slot_value,
                     "is_necessary": s.is_necessary,
                 })
+                slot_index.setdefault((t.topic_number, s.slot_number), s)
             slots_by_topic[f"{t.topic_number}: {t.topic_content}"] = {"slots": slots}
 
         prompt = (
@@ -53,9 +123,9 @@ class ProjectPrefiller:
             .replace("{topics_list}", json.dumps(topics_list, ensure_ascii=False))
             .replace("{slots_by_topic}", json.dumps(slots_by_topic, ensure_ascii=False))
         )
-        response = await llm_handler.call_llm(prompt=prompt)
+        response = await llm_handler.call_llm(prompt=prompt, cache=True)
         if not response:
-            return
+            return False
         s = response.strip()
         if s.startswith("```"):
             s = s.strip("`")
@@ -72,10 +142,10 @@ class ProjectPrefiller:
                 updates = []
 
         if not isinstance(updates, list):
-            return
+            return False
 
         # Apply updates: only update existing slots; do not create new ones
-        topic_number_to_id = {t.topic_number: t.topic_id for t in topics}
+        mappings: dict[int, dict] = {}
         for u in updates:
             try:
                 tnum = str(u.get("topic_number"))
@@ -83,14 +153,7 @@ class ProjectPrefiller:
                 sval_raw = u.get("slot_value")
                 if not tnum or not snum:
                     continue
-                tid = topic_number_to_id.get(tnum)
-                if not tid:
-                    continue
-                slot = (
-                    db.query(Slot)
-                    .filter(Slot.topic_id == tid, Slot.slot_number == snum)
-                    .first()
-                )
+                slot = slot_index.get((tnum, snum))
                 if not slot:
                     continue
                 if sval_raw == "None":
@@ -102,8 +165,28 @@ class ProjectPrefiller:
 
                 # Update only if value changes or is empty
                 if slot.slot_value != new_val:
-                    slot.slot_value = new_val
-                print("prefill slots is success")
+                    mappings[slot.slot_id] = {"b_slot_id": slot.slot_id, "b_read_value": slot.slot_value, "b_slot_value": new_val}
             except Exception:
                 continue
-        db.commit()
+
+        def _write() -> None:
+            if mappings:
+                # Compare-and-set: the LLM call above can take long enough for the interview's SlotFiller to commit
+                # slot values in the meantime; those rows no longer hold the value read here and are left alone.
+                slots = Slot.__table__
+                stmt = (
+                    update(slots)
+                    .where(
+                        slots.c.slot_id == bindparam("b_slot_id"),
+                        slots.c.slot_value.is_not_distinct_from(bindparam("b_read_value")),
+                    )
+                    .values(slot_value=bindparam("b_slot_value"))
+                )
+                db.connection().execute(stmt, list(mappings.values()))
+                print(f"prefill slots is success: {len(mappings)} slots updated")
+            db.commit()
+
+        # A blocking write on the loop could wait for the lock held by a suspended async-session transaction
+        # of an interview route, which cannot finish while the loop is blocked
+        await asyncio.to_thread(_write)
+        return True
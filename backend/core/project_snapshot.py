@@ -0,0 +1,112 @@
+from sqlalchemy.orm import Session
+from database.models import Slot, Topic
+
+
+class ProjectSnapshot:
+    """Topics and slots of one project, read with a single query and shared by everything in a request.
+
+    SlotFiller, RemarksGenerator and StrategySelector read slot state from here instead of re-running the
+    topic/section/slot joins; SlotFiller folds committed slot writes back in with `apply`, so later readers in
+    the same request see them. Reload it after operations that create topics.
+    """
+
+    def __init__(self, project_id: int) -> None:
+        self.project_id = project_id
+        self.topics: dict[int, dict] = {}
+        self.topic_ids_by_number: dict[str, list[int]] = {}
+
+    @staticmethod
+    def load(db: Session, project_id: int) -> "ProjectSnapshot":
+        snapshot = ProjectSnapshot(project_id)
+        rows = (
+            db.query(
+                Topic.topic_id,
+                Topic.topic_number,
+                Topic.topic_content,
+                Slot.slot_id,
+                Slot.slot_number,
+                Slot.slot_key,
+                Slot.slot_value,
+                Slot.is_necessary,
+            )
+            .outerjoin(Slot, Slot.topic_id == Topic.topic_id)
+            .filter(Topic.project_id == project_id)
+            .order_by(Topic.topic_id, Slot.slot_id)
+            .all()
+        )
+        for r in rows:
+            topic = snapshot.topics.get(r.topic_id)
+            if topic is None:
+                topic = {"topic_id": r.topic_id, "topic_number": r.topic_number, "topic_content": r.topic_content, "slots": []}
+                snapshot.topics[r.topic_id] = topic
+                snapshot.topic_ids_by_number.setdefault(r.topic_number, []).append(r.topic_id)
+            if r.slot_id is not None:
+                topic["slots"].append({
+                    "slot_id": r.slot_id,
+                    "slot_number": r.slot_number,
+                    "slot_key": r.slot_key,
+                    "slot_value": r.slot_value,
+                    "is_necessary": r.is_necessary,
+                })
+        return snapshot
+
+    def _slots_of(self, topic_number: str) -> list[dict]:
+        slots = []
+        for topic_id in self.topic_ids_by_number.get(topic_number, []):
+            slots.extend(self.topics[topic_id]["slots"])
+        return slots
+
+    def topic_info_slots(self, topic_number: str) -> list:
+        """Every slot of a topic (filled or not), as shown to the slot-filling and remarks prompts."""
+        return [
+            {
+                "slot_number": s["slot_number"],
+                "slot_key": s["slot_key"],
+                "slot_value": s["slot_value"],
+                "is_necessary": s["is_necessary"],
+            }
+            for s in self._slots_of(topic_number)
+        ]
+
+    def entire_interview_info_slots(self) -> dict:
+        """All filled slots of the project grouped by "topic_number: topic_content"."""
+        grouped = {}
+        for topic in self.topics.values():
+            for s in topic["slots"]:
+                if s["slot_value"] is None or s["slot_value"] == "":
+                    continue
+                topic_key = f"{topic['topic_number']}: {topic['topic_content']}"
+                grouped.setdefault(topic_key, {"slots": []})["slots"].append({
+                    "slot_number": s["slot_number"],
+                    "slot_key": s["slot_key"],
+                    "slot_value": s["slot_value"],
+                })
+        return grouped
+
+    def completion(self, topic_number: str) -> float:
+        slots = self._slots_of(topic_number)
+        if not slots:
+            return 0.0
+        filled = [s for s in slots if (s["slot_value"] is not None and str(s["slot_value"]).strip() != "")]
+        return len(filled) / len(slots)
+
+    def apply(self, topic_id: int, written: list[dict]) -> None:
+        """Fold committed slot writes ({"slot_number", "slot_key", "slot_value", "is_necessary"}) into the snapshot."""
+        topic = self.topics.get(topic_id)
+        if topic is None:
+            return
+        by_number = {s["slot_number"]: s for s in topic["slots"]}
+        for w in written:
+            existing = by_number.get(w["slot_number"])
+            if existing is not None:
+                existing["slot_value"] = w["slot_value"]
+            else:
+                entry = {
+                    "slot_id": w.get("slot_id"),
+                    "slot_number": w["slot_number"],
+                    "slot_key": w["slot_key"],
+                    "slot_value": w["slot_value"],
+                    "is_necessary": w["is_necessary"],
+                }
+                topic["slots"].append(entry)
+                by_number[w["slot_number"]] = entry
@@ -1,76 +1,25 @@
 import json
+import asyncio
 
-from sqlalchemy import and_
-from sqlalchemy.orm import Session
-from database.models import Slot, Topic, Section, Project
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.database import upsert_statement
+from database.models import Slot, Topic
 from ..llm_handler import LLMHandler
+from ..config import CONFIG
 from ..prompts.slots_filling import slots_filling_prompt
+from ..prompts.slots_filling_batch import slots_filling_batch_prompt
+from .project_snapshot import ProjectSnapshot
 
 class SlotFiller:
     @staticmethod
-    async def fill_slot(db: Session, llm_handler: LLMHandler, project_id: int, current_topic: dict,
-                                   current_topic_conversation_record: list) :
+    async def extract_slots(db: AsyncSession, llm_handler: LLMHandler, project_id: int, current_topic: dict,
+                                   current_topic_conversation_record: list, snapshot: ProjectSnapshot | None = None) -> list:
+        """Ask the LLM which slots of the target topic to fill/update/extend; nothing is written."""
         try:
-            # Obtain the slot for the current topic
-            slots = db.query(
-                Slot.slot_number,
-                Slot.slot_key,
-                Slot.slot_value,
-                Slot.is_necessary,
-            ).join(Topic).join(Section).filter(
-                Topic.topic_number == current_topic["topic_number"],
-                Section.project_id == project_id
-            ).all()
-
-            current_topic_info_slots = []
-            for slot in slots:
-                current_topic_info_slots.append({
-                    "slot_number": slot.slot_number,
-                    "slot_key": slot.slot_key,
-                    "slot_value": slot.slot_value,
-                    "is_necessary": slot.is_necessary,
-                })
-
-            # Obtain all the filled slots in the project and group them by topic
-            filled_slots_object = db.query(
-                Slot.slot_number,
-                Slot.slot_key,
-                Slot.slot_value,
-                Topic.topic_number,
-                Topic.topic_content,
-            ).join(Topic).join(Section).join(Project).filter(
-                and_(
-                    Project.project_id == project_id,
-                    Slot.slot_value != None,
-                    Slot.slot_value != ""
-                )
-            ).all()
-
-            filled_slots = []
-            for slot in filled_slots_object:
-                filled_slots.append({
-                    "slot_number": slot.slot_number,
-                    "slot_key": slot.slot_key,
-                    "slot_value": slot.slot_value,
-                    "topic_number": slot.topic_number,
-                    "topic_content": slot.topic_content,
-                })
-
-            entire_interview_info_slots = {}
-            for slot in filled_slots:
-                topic_key = f"{slot['topic_number']}: {slot['topic_content']}"
-
-                if topic_key not in entire_interview_info_slots:
-                    entire_interview_info_slots[topic_key] = {
-                        "slots": []
-                    }
-
-                entire_interview_info_slots[topic_key]["slots"].append({
-                    "slot_number": slot["slot_number"],
-                    "slot_key": slot["slot_key"],
-                    "slot_value": slot["slot_value"],
-                })
-
+            snapshot = snapshot or await db.run_sync(ProjectSnapshot.load, project_id)
+            current_topic_info_slots = snapshot.topic_info_slots(current_topic["topic_number"])
+            entire_interview_info_slots = snapshot.entire_interview_info_slots()
 
             # Filling slot
             response = await llm_handler.call_llm(
@@ -84,118 +33,243 @@ class SlotFiller:
                 slots = json.loads(response.replace('"slot_value": None','"slot_value": "None"'))
             except json.JSONDecodeError as e:
                 raise ValueError(f"Failed to parse LLM response as JSON: {response}") from e
+            return slots
+
+        except Exception as e:
+            raise e
+
+    @staticmethod
+    def _current_round_ids(current_topic_conversation_record: list) -> list[int]:
+        current_round_ids = []
+        if current_topic_conversation_record and len(current_topic_conversation_record) > 0:
+            last_round = current_topic_conversation_record[-1]
+            try:
+                iid = last_round.get("Interviewer_id")
+                if iid is not None:
+                    current_round_ids.append(int(iid))
+            except Exception:
+                pass
+            try:
+                aid = last_round.get("Interviewee_id")
+                if aid is not None:
+                    current_round_ids.append(int(aid))
+            except Exception:
+                pass
+        return current_round_ids
+
+    @staticmethod
+    async def apply_slots(db: AsyncSession, topic_id: int, slots: list, current_topic_conversation_record: list) -> list[dict]:
+        """Write the slots extracted for one topic into the session without committing.
 
-            topic = db.query(Topic).join(Section).filter(
+        The topic's slots are read once and every change goes out as a single INSERT ... ON CONFLICT
+        (topic_id, slot_number) DO UPDATE. Returns the written slots in the form ProjectSnapshot.apply
+        expects, to be folded in after the commit.
+        """
+        existing = {
+            row.slot_number: row._asdict()
+            for row in (await db.execute(
+                select(
+                    Slot.slot_number,
+                    Slot.slot_key,
+                    Slot.slot_value,
+                    Slot.is_necessary,
+                    Slot.evidence_message_ids,
+                ).where(Slot.topic_id == topic_id)
+            )).all()
+        }
+        # Evidence is computed by code logic based on current round; LLM does not return it
+        current_round_ids = SlotFiller._current_round_ids(current_topic_conversation_record)
+
+        rows: dict[str, dict] = {}
+        # Process each slot data
+        for slot_data in slots:
+            slot_number = slot_data["slot_number"]
+            slot_key = slot_data["slot_key"]
+            if slot_data["slot_value"] != "None":
+                raw_value = slot_data["slot_value"]
+                if isinstance(raw_value, (list, dict)):
+                    slot_value = json.dumps(raw_value, ensure_ascii=False)
+                elif raw_value is None:
+                    slot_value = None
+                else:
+                    slot_value = str(raw_value)
+            else:
+                slot_value = None
+
+            # A slot returned twice in one response is compared against what the earlier entry wrote
+            current = rows.get(slot_number) or existing.get(slot_number)
+            if current is not None:
+                current_evidence = current["evidence_message_ids"]
+                # Update the existing slot
+                value_changed = (current["slot_value"] != slot_value)
+                existing_evidence = []
+                try:
+                    if current_evidence:
+                        parsed_existing = json.loads(current_evidence)
+                        if isinstance(parsed_existing, list):
+                            existing_evidence = parsed_existing
+                except Exception:
+                    existing_evidence = []
+                merged = []
+                seen = set()
+                for x in existing_evidence + (current_round_ids if value_changed else []):
+                    if x not in seen:
+                        seen.add(x)
+                        merged.append(x)
+                try:
+                    new_evidence_value = json.dumps(merged, ensure_ascii=False)
+                except Exception:
+                    new_evidence_value = json.dumps(existing_evidence, ensure_ascii=False)
+                if not value_changed and current_evidence == new_evidence_value:
+                    continue
+                rows[slot_number] = {
+                    "slot_number": slot_number,
+                    "slot_key": current["slot_key"],
+                    "slot_value": slot_value,
+                    "is_necessary": current["is_necessary"],
+                    "topic_id": topic_id,
+                    "evidence_message_ids": new_evidence_value,
+                }
+            else:
+                # Create a new slot
+                merged = list(dict.fromkeys(current_round_ids))
+                rows[slot_number] = {
+                    "slot_number": slot_number,
+                    "slot_key": slot_key,
+                    "slot_value": slot_value,
+                    "is_necessary": False,  # The newly added slot is set to False.
+                    "topic_id": topic_id,
+                    "evidence_message_ids": json.dumps(merged, ensure_ascii=False),
+                }
+
+        if rows:
+            stmt = upsert_statement(
+                db.bind.dialect.name,
+                Slot,
+                list(rows.values()),
+                index_elements=[Slot.topic_id, Slot.slot_number],
+                update_columns=["slot_value", "evidence_message_ids"],
+            )
+            await db.execute(stmt)
+        return [
+            {"slot_number": r["slot_number"], "slot_key": r["slot_key"], "slot_value": r["slot_value"], "is_necessary": r["is_necessary"]}
+            for r in rows.values()
+        ]
+
+    @staticmethod
+    async def fill_slot(db: AsyncSession, llm_handler: LLMHandler, project_id: int, current_topic: dict,
+                                   current_topic_conversation_record: list, snapshot: ProjectSnapshot | None = None) :
+        try:
+            slots = await SlotFiller.extract_slots(db=db, llm_handler=llm_handler, project_id=project_id, current_topic=current_topic, current_topic_conversation_record=current_topic_conversation_record, snapshot=snapshot)
+
+            topic = (await db.execute(select(Topic).where(
                 Topic.topic_number == current_topic["topic_number"],
-                Section.project_id == project_id
-            ).first()
+                Topic.project_id == project_id
+            ))).scalars().first()
 
             if not topic:
-                raise ValueError(f"No topic with the topic_number of {current_topic["topic_number"]} was found.")
-
-            topic_id = topic.topic_id
-
-            # Process each slot data
-            for slot_data in slots:
-                slot_number = slot_data["slot_number"]
-                slot_key = slot_data["slot_key"]
-                if slot_data["slot_value"] != "None":
-                    raw_value = slot_data["slot_value"]
-                    if isinstance(raw_value, (list, dict)):
-                        slot_value = json.dumps(raw_value, ensure_ascii=False)
-                    elif raw_value is None:
-                        slot_value = None
-                    else:
-                        slot_value = str(raw_value)
-                else:
-                    slot_value = None
+                raise ValueError(f"No topic with the topic_number of {current_topic['topic_number']} was found.")
 
-                # Evidence is computed by code logic based on current round; LLM does not return it
+            written = await SlotFiller.apply_slots(db=db, topic_id=topic.topic_id, slots=slots, current_topic_conversation_record=current_topic_conversation_record)
+            await db.commit()
+            if snapshot is not None:
+                snapshot.apply(topic.topic_id, written)
 
-                # Check if a slot with the same slot_number already exists
-                existing_slot = db.query(Slot).filter(
-                    Slot.topic_id == topic_id,
-                    Slot.slot_number == slot_number
-                ).first()
+        except Exception as e:
+            raise e
 
-                if existing_slot:
-                    # Update the existing slot
-                    value_changed = (existing_slot.slot_value != slot_value)
-                    if value_changed:
-                        existing_slot.slot_value = slot_value
-                    existing_evidence = []
-                    try:
-                        if existing_slot.evidence_message_ids:
-                            parsed_existing = json.loads(existing_slot.evidence_message_ids)
-                            if isinstance(parsed_existing, list):
-                                existing_evidence = parsed_existing
-                    except Exception:
-                        existing_evidence = []
-                    current_round_ids = []
-                    if current_topic_conversation_record and len(current_topic_conversation_record) > 0:
-                        last_round = current_topic_conversation_record[-1]
-                        try:
-                            iid = last_round.get("Interviewer_id")
-                            if iid is not None:
-                                current_round_ids.append(int(iid))
-                        except Exception:
-                            pass
-                        try:
-                            aid = last_round.get("Interviewee_id")
-                            if aid is not None:
-                                current_round_ids.append(int(aid))
-                        except Exception:
-                            pass
-                    merged = []
-                    seen = set()
-                    for x in existing_evidence + (current_round_ids if value_changed else []):
-                        if x not in seen:
-                            seen.add(x)
-                            merged.append(x)
-                    try:
-                        new_evidence_value = json.dumps(merged, ensure_ascii=False)
-                    except Exception:
-                        new_evidence_value = json.dumps(existing_evidence, ensure_ascii=False)
-                    if existing_slot.evidence_message_ids != new_evidence_value:
-                        existing_slot.evidence_message_ids = new_evidence_value
-                else:
-                    # Create a new slot
-                    current_round_ids = []
-                    if current_topic_conversation_record and len(current_topic_conversation_record) > 0:
-                        last_round = current_topic_conversation_record[-1]
-                        try:
-                            iid = last_round.get("Interviewer_id")
-                            if iid is not None:
-                                current_round_ids.append(int(iid))
-                        except Exception:
-                            pass
-                        try:
-                            aid = last_round.get("Interviewee_id")
-                            if aid is not None:
-                                current_round_ids.append(int(aid))
-                        except Exception:
-                            pass
-                    merged = []
-                    seen = set()
-                    for x in current_round_ids:
-                        if x not in seen:
-                            seen.add(x)
-                            merged.append(x)
-                    try:
-                        evidence_value = json.dumps(merged, ensure_ascii=False)
-                    except Exception:
-                        evidence_value = json.dumps([], ensure_ascii=False)
-                    new_slot = Slot(
-                        slot_number=slot_number,
-                        slot_key=slot_key,
-                        slot_value=slot_value,
-                        is_necessary=False,  # The newly added slot is set to False.
-                        topic_id=topic_id,
-                        evidence_message_ids=evidence_value
-                    )
-                    db.add(new_slot)
-
-            db.commit()
+    @staticmethod
+    async def fill_slots_concurrently(db: AsyncSession, llm_handler: LLMHandler, project_id: int, target_topics: list,
+                                      current_topic_conversation_record: list, concurrency: int | None = None,
+                                      snapshot: ProjectSnapshot | None = None) -> None:
+        """Fill several topics at once: the LLM calls run concurrently (bounded by SLOT_FILL_CONCURRENCY),
+        then every result is written in a single transaction."""
+        limit = max(1, int(concurrency or CONFIG.SLOT_FILL_CONCURRENCY))
+        semaphore = asyncio.Semaphore(limit)
+        snapshot = snapshot or await db.run_sync(ProjectSnapshot.load, project_id)
 
+        async def _extract(target: dict) -> list:
+            async with semaphore:
+                return await SlotFiller.extract_slots(db=db, llm_handler=llm_handler, project_id=project_id, current_topic=target, current_topic_conversation_record=current_topic_conversation_record, snapshot=snapshot)
+
+        results = await asyncio.gather(*[_extract(t) for t in target_topics], return_exceptions=True)
+        for r in results:
+            if isinstance(r, BaseException):
+                raise r
+        written = []
+        try:
+            for target, slots in zip(target_topics, results):
+                written.append((target["topic_id"], await SlotFiller.apply_slots(db=db, topic_id=target["topic_id"], slots=slots, current_topic_conversation_record=current_topic_conversation_record)))
+            await db.commit()
         except Exception as e:
+            await db.rollback()
             raise e
+        for topic_id, w in written:
+            snapshot.apply(topic_id, w)
+
+    @staticmethod
+    async def fill_slots_batch(db: AsyncSession, llm_handler: LLMHandler, project_id: int, target_topics: list,
+                               current_topic_conversation_record: list, snapshot: ProjectSnapshot | None = None) -> dict[str, list]:
+        """Fill several topics with one LLM request; returns the per-topic result map that was applied."""
+        snapshot = snapshot or await db.run_sync(ProjectSnapshot.load, project_id)
+        target_topics_info = []
+        for target in target_topics:
+            target_topics_info.append({
+                "topic_number": target["topic_number"],
+                "topic_content": target["topic_content"],
+                "current_topic_info_slots": snapshot.topic_info_slots(target["topic_number"]),
+            })
+        entire_interview_info_slots = snapshot.entire_interview_info_slots()
+
+        response = await llm_handler.call_llm(
+            prompt=slots_filling_batch_prompt.replace(
+                "{current_topic_conversation_record}", str(current_topic_conversation_record)).replace(
+                "{target_topics}", str(target_topics_info)).replace(
+                "{entire_interview_info_slots}", str(entire_interview_info_slots)))
+
+        s = (response or "").strip()
+        if s.startswith("```"):
+            s = s.strip("`")
+            if s.lower().startswith("json\n"):
+                s = s[5:]
+        s = s.replace('"slot_value": None', '"slot_value": "None"')
+        try:
+            parsed = json.loads(s)
+        except json.JSONDecodeError as e:
+            start = s.find("{")
+            end = s.rfind("}")
+            if start == -1 or end <= start:
+                raise ValueError(f"Failed to parse LLM response as JSON: {response}") from e
+            parsed = json.loads(s[start:end + 1])
+        if not isinstance(parsed, dict):
+            raise ValueError(f"The batched slot filling response is not a topic map: {response}")
+
+        results: dict[str, list] = {}
+        written = []
+        try:
+            for target in target_topics:
+                slots = parsed.get(target["topic_number"]) or []
+                if not isinstance(slots, list):
+                    continue
+                written.append((target["topic_id"], await SlotFiller.apply_slots(db=db, topic_id=target["topic_id"], slots=slots, current_topic_conversation_record=current_topic_conversation_record)))
+                results[target["topic_number"]] = slots
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            raise e
+        for topic_id, w in written:
+            snapshot.apply(topic_id, w)
+        return results
+
+    @staticmethod
+    async def fill_affected_topics(db: AsyncSession, llm_handler: LLMHandler, project_id: int, target_topics: list,
+                                   current_topic_conversation_record: list, snapshot: ProjectSnapshot | None = None) -> None:
+        snapshot = snapshot or await db.run_sync(ProjectSnapshot.load, project_id)
+        # SLOT_FILL_MODE=batch sends every affected topic in one request; a failed batch falls back to per-topic calls
+        if len(target_topics) > 1 and CONFIG.SLOT_FILL_MODE == "batch":
+            try:
+                await SlotFiller.fill_slots_batch(db=db, llm_handler=llm_handler, project_id=project_id, target_topics=target_topics, current_topic_conversation_record=current_topic_conversation_record, snapshot=snapshot)
+                return
+            except Exception as e:
+                print(f"Batched slot filling failed, falling back to per-topic filling: {e}")
+        await SlotFiller.fill_slots_concurrently(db=db, llm_handler=llm_handler, project_id=project_id, target_topics=target_topics, current_topic_conversation_record=current_topic_conversation_record, snapshot=snapshot)
@@ -1,23 +1,28 @@
-from sqlalchemy.orm import Session
-from database.models import Topic, Section, Slot
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.models import Topic, Slot
 from ..config import CONFIG
 from ..prompts.question_strategy import QUESTION_STRATEGY_INSTRUCTIONS
+from .project_snapshot import ProjectSnapshot
 
 class StrategySelector:
     @staticmethod
-    def compute_completion(db: Session, project_id: int, current_topic_number: int) -> float:
-        slots = db.query(Slot).join(Topic).join(Section).filter(
+    async def compute_completion(db: AsyncSession, project_id: int, current_topic_number: int, snapshot: ProjectSnapshot | None = None) -> float:
+        if snapshot is not None:
+            return snapshot.completion(current_topic_number)
+        slots = (await db.execute(select(Slot).join(Topic).where(
             Topic.topic_number == current_topic_number,
-            Section.project_id == project_id
-        ).all()
+            Topic.project_id == project_id
+        ))).scalars().all()
         if not slots:
             return 0.0
         filled = [s for s in slots if (s.slot_value is not None and str(s.slot_value).strip() != "")]
         return len(filled) / len(slots)
 
     @staticmethod
-    def select(db: Session, project_id: int, current_topic: dict, current_topic_conversation_record: list) -> tuple[str, str, float]:
-        c = StrategySelector.compute_completion(db, project_id, current_topic["topic_number"])
+    async def select(db: AsyncSession, project_id: int, current_topic: dict, current_topic_conversation_record: list,
+               snapshot: ProjectSnapshot | None = None) -> tuple[str, str, float]:
+        c = await StrategySelector.compute_completion(db, project_id, current_topic["topic_number"], snapshot)
         code = "S2"
         if c == 0.0:
             code = "S1"
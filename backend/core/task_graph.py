@@ -0,0 +1,44 @@
+import asyncio
+from typing import Awaitable, Callable
+
+
+class TaskGraph:
+    """Tiny async dependency graph: every node starts as soon as the nodes it depends on have finished.
+
+    A node's callable receives the results of its dependencies as keyword arguments. Dependencies must be
+    added before the nodes that use them, which also rules out cycles.
+    """
+
+    def __init__(self) -> None:
+        self._nodes: dict[str, tuple[Callable[..., Awaitable[object]], tuple[str, ...]]] = {}
+
+    def add(self, name: str, fn: Callable[..., Awaitable[object]], deps: tuple[str, ...] | list[str] = ()) -> "TaskGraph":
+        if name in self._nodes:
+            raise ValueError(f"Duplicate task graph node: {name}")
+        for d in deps:
+            if d not in self._nodes:
+                raise ValueError(f"Task graph node {name} depends on unknown node {d}")
+        self._nodes[name] = (fn, tuple(deps))
+        return self
+
+    async def run(self) -> dict[str, object]:
+        tasks: dict[str, asyncio.Task] = {}
+
+        async def _run_node(name: str) -> object:
+            fn, deps = self._nodes[name]
+            kwargs = {}
+            for d in deps:
+                kwargs[d] = await tasks[d]
+            return await fn(**kwargs)
+
+        for name in self._nodes:
+            tasks[name] = asyncio.ensure_future(_run_node(name))
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for t in tasks.values():
+                if not t.done():
+                    t.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+        return {name: t.result() for name, t in tasks.items()}
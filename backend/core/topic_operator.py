@@ -1,5 +1,6 @@
 import json
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from database.models import Topic, Section, Slot, Project
 from ..llm_handler import LLMHandler
 from .priority_builder import PriorityBuilder
@@ -8,13 +9,19 @@ from ..prompts.topic_generation import topic_generation_prompt
 
 class TopicOperator:
 
+    @staticmethod
+    async def _find_topic(db: AsyncSession, project_id: int, topic_number: str) -> Topic | None:
+        return (await db.execute(
+            select(Topic).where(Topic.topic_number == topic_number, Topic.project_id == project_id)
+        )).scalars().first()
+
     @staticmethod
     async def maintain_current_topic(current_topic: dict) -> dict:
         return current_topic
 
     # Mark the current topic as a "SystemInterrupted" and redirect to the topic mentioned by the user.
     @staticmethod
-    async def switch_another_topic(db: Session, llm_handler: LLMHandler, project_id: int, current_topic: dict, current_topic_conversation_record: list, topics_list: list) -> dict | None:
+    async def switch_another_topic(db: AsyncSession, llm_handler: LLMHandler, project_id: int, current_topic: dict, current_topic_conversation_record: list, topics_list: list) -> dict | None:
         try:
             # Select the topic that needs to be switched to
             response = await llm_handler.call_llm(
@@ -31,44 +38,35 @@ class TopicOperator:
                 raise ValueError("The LLM has selected the error topic.")
 
             # Change the status of the replaced topic to "SystemInterrupted"
-            current_topic_object = db.query(Topic).join(Section).filter(
-                Topic.topic_number == current_topic["topic_number"],
-                Section.project_id == project_id
-            ).first()
+            current_topic_object = await TopicOperator._find_topic(db, project_id, current_topic["topic_number"])
             if not current_topic_object:
                 raise ValueError("The current_topic not found")
             current_topic_object.topic_status = "SystemInterrupted"
 
             # Activate the (selected) topic to be converted
-            selected_topic_object = db.query(Topic).join(Section).filter(
-                Topic.topic_number == selected_topic["topic_number"],
-                Section.project_id == project_id
-            ).first()
+            selected_topic_object = await TopicOperator._find_topic(db, project_id, selected_topic["topic_number"])
             if not selected_topic_object:
                 raise ValueError("The selected_topic not found")
 
             selected_topic_object.topic_status = "Ongoing"
 
-            db.commit()
+            await db.commit()
             return selected_topic
 
         except Exception as e:
-            db.rollback()
+            await db.rollback()
             raise e
 
    # Mark the current topic as "SystemInterrupted", create a new topic and switch.
     @staticmethod
-    async def create_new_topic(db: Session, llm_handler: LLMHandler, project_id: int, current_topic: dict, current_topic_conversation_record: list, topics_list: list) -> dict:
+    async def create_new_topic(db: AsyncSession, llm_handler: LLMHandler, project_id: int, current_topic: dict, current_topic_conversation_record: list, topics_list: list) -> dict:
         try:
             # Query section information
-            current_section_object = db.query(
-                Section.section_id,
-                Section.section_number,
-                Section.section_content,
-            ).join(Topic, Section.section_id == Topic.section_id).filter(
-                Topic.topic_number == current_topic["topic_number"],
-                Section.project_id == project_id
-            ).first()
+            current_section_object = (await db.execute(
+                select(Section.section_id, Section.section_number, Section.section_content)
+                .join(Topic, Section.section_id == Topic.section_id)
+                .where(Topic.topic_number == current_topic["topic_number"], Topic.project_id == project_id)
+            )).first()
 
             if not current_section_object:
                 raise ValueError("The current_section not found")
@@ -90,10 +88,7 @@ class TopicOperator:
                 raise ValueError(f"Failed to parse LLM response as JSON: {response}") from e
 
             # Change the status of the replaced topic to "SystemInterrupted"
-            current_topic_object = db.query(Topic).join(Section).filter(
-                Topic.topic_number == current_topic["topic_number"],
-                Section.project_id == project_id
-            ).first()
+            current_topic_object = await TopicOperator._find_topic(db, project_id, current_topic["topic_number"])
             if not current_topic_object:
                 raise ValueError("The current_topic not found")
             current_topic_object.topic_status = "SystemInterrupted"
@@ -108,11 +103,16 @@ class TopicOperator:
                 section_id=current_section_object.section_id
             )
             db.add(topic)
-            db.flush()
+            await db.flush()
 
             # Insert slots
             if "slots" in new_topic:
+                seen_slot_numbers = set()
                 for slot_data in new_topic["slots"]:
+                    # slot_number is unique per topic; keep the first occurrence
+                    if slot_data["slot_number"] in seen_slot_numbers:
+                        continue
+                    seen_slot_numbers.add(slot_data["slot_number"])
                     slot = Slot(
                         slot_number=slot_data["slot_number"],
                         slot_key=slot_data["slot_key"],
@@ -122,25 +122,22 @@ class TopicOperator:
                     )
                     db.add(slot)
 
-            db.commit()
+            await db.commit()
             return  {
                 "topic_number": topic.topic_number,
                 "topic_content": topic.topic_content
             }
 
         except Exception as e:
-            db.rollback()
+            await db.rollback()
             raise e
 
     # Mark the current topic as "Completed" and switch to the new topic in sequence.
     @staticmethod
-    async def end_current_topic(db: Session, llm_handler: LLMHandler, project_id: int, current_topic: dict, topics_list: list) -> dict | None:
+    async def end_current_topic(db: AsyncSession, llm_handler: LLMHandler, project_id: int, current_topic: dict, topics_list: list) -> dict | None:
         try:
             # Change the status of the replaced topic to "Completed"
-            current_topic_object = db.query(Topic).join(Section).filter(
-                Topic.topic_number == current_topic["topic_number"],
-                Section.project_id == project_id
-            ).first()
+            current_topic_object = await TopicOperator._find_topic(db, project_id, current_topic["topic_number"])
             if not current_topic_object:
                 raise ValueError("The current_topic not found")
             current_topic_object.topic_status = "Completed"
@@ -157,7 +154,7 @@ class TopicOperator:
                 return None
 
             next_topic = None
-            project = db.query(Project).filter(Project.project_id == project_id).first()
+            project = await db.get(Project, project_id)
             seq = []
             if project and project.priority_sequence:
                 try:
@@ -167,10 +164,7 @@ class TopicOperator:
                 except Exception:
                     seq = []
             for item in seq:
-                topic = db.query(Topic).join(Section).filter(
-                    Topic.topic_number == item.get("topic_number"),
-                    Section.project_id == project_id
-                ).first()
+                topic = await TopicOperator._find_topic(db, project_id, item.get("topic_number"))
                 if topic and topic.topic_status in ["Pending", "SystemInterrupted"]:
                     next_topic = topic
                     break
@@ -178,8 +172,8 @@ class TopicOperator:
             # If found, update the status
             if next_topic:
                 next_topic.topic_status = "Ongoing"
-                db.commit()
-                db.refresh(next_topic)
+                await db.commit()
+                await db.refresh(next_topic)
                 print(f"Found and updated the next topic in the 'Pending' status: {next_topic.topic_number}")
                 return {
                         "topic_number": next_topic.topic_number,
@@ -192,20 +186,17 @@ class TopicOperator:
                 return None
 
         except Exception as e:
-            db.rollback()
+            await db.rollback()
             raise e
 
     # Mark the current topic as "UserInterrupted" and switch to the new topic in sequence.
     @staticmethod
-    async def refuse_current_topic(db: Session, llm_handler: LLMHandler, project_id: int, current_topic: dict, topics_list: list) -> dict | None:
+    async def refuse_current_topic(db: AsyncSession, llm_handler: LLMHandler, project_id: int, current_topic: dict, topics_list: list) -> dict | None:
         # Change the status of the replaced topic to "UserInterrupted"
-        current_topic_object = db.query(Topic).join(Section).filter(
-            Topic.topic_number == current_topic["topic_number"],
-            Section.project_id == project_id
-        ).first()
+        current_topic_object = await TopicOperator._find_topic(db, project_id, current_topic["topic_number"])
         if current_topic_object:
             current_topic_object.topic_status = "UserInterrupted"
-            db.commit()
+            await db.commit()
 
         try:
             # Find the position of the current topic in the list
@@ -221,7 +212,7 @@ class TopicOperator:
 
             # Use stored priority sequence to select next Pending/SystemInterrupted topic
             next_topic = None
-            project = db.query(Project).filter(Project.project_id == project_id).first()
+            project = await db.get(Project, project_id)
             seq = []
             if project and project.priority_sequence:
                 try:
@@ -231,10 +222,7 @@ class TopicOperator:
                 except Exception:
                     seq = []
             for item in seq:
-                topic = db.query(Topic).join(Section).filter(
-                    Topic.topic_number == item.get("topic_number"),
-                    Section.project_id == project_id
-                ).first()
+                topic = await TopicOperator._find_topic(db, project_id, item.get("topic_number"))
                 if topic and topic.topic_status in ["Pending", "SystemInterrupted"]:
                     next_topic = topic
                     break
@@ -242,8 +230,8 @@ class TopicOperator:
             # If found, update the status
             if next_topic:
                 next_topic.topic_status = "Ongoing"
-                db.commit()
-                db.refresh(next_topic)
+                await db.commit()
+                await db.refresh(next_topic)
                 print(f"Found and updated the next topic in the 'Pending' status: {next_topic.topic_number}")
                 return {
                     "topic_number": next_topic.topic_number,
@@ -257,12 +245,12 @@ class TopicOperator:
                 return None
 
         except Exception as e:
-            db.rollback()
+            await db.rollback()
             raise e
 
     # Mark the current topic as a "UserInterrupted" and redirect to the topic mentioned by the user.
     @staticmethod
-    async def refuse_current_topic_and_switch_another_topic(db: Session, llm_handler: LLMHandler, project_id: int, current_topic: dict, current_topic_conversation_record: list, topics_list: list) -> dict | None:
+    async def refuse_current_topic_and_switch_another_topic(db: AsyncSession, llm_handler: LLMHandler, project_id: int, current_topic: dict, current_topic_conversation_record: list, topics_list: list) -> dict | None:
         try:
             # Select the topic that needs to be switched to
             response = await llm_handler.call_llm(
@@ -279,43 +267,34 @@ class TopicOperator:
                 raise ValueError("The LLM has selected the error topic.")
 
             # Change the status of the replaced topic to "SystemInterrupted"
-            current_topic_object = db.query(Topic).join(Section).filter(
-                Topic.topic_number == current_topic["topic_number"],
-                Section.project_id == project_id
-            ).first()
+            current_topic_object = await TopicOperator._find_topic(db, project_id, current_topic["topic_number"])
             if not current_topic_object:
                 raise ValueError("The current_topic not found")
             current_topic_object.topic_status = "UserInterrupted"
 
             # Activate the (selected) topic to be converted
-            selected_topic_object = db.query(Topic).join(Section).filter(
-                Topic.topic_number == selected_topic["topic_number"],
-                Section.project_id == project_id
-            ).first()
+            selected_topic_object = await TopicOperator._find_topic(db, project_id, selected_topic["topic_number"])
             if not selected_topic_object:
                 raise ValueError("The selected_topic not found")
             selected_topic_object.topic_status = "Ongoing"
 
-            db.commit()
+            await db.commit()
             return selected_topic
 
         except Exception as e:
-            db.rollback()
+            await db.rollback()
             raise e
 
     # Mark the current topic as "UserInterrupted", create a new topic and switch.
     @staticmethod
-    async def refuse_current_topic_and_create_new_topic(db: Session, llm_handler: LLMHandler, project_id: int, current_topic: dict, current_topic_conversation_record: list, topics_list: list) -> dict | None:
+    async def refuse_current_topic_and_create_new_topic(db: AsyncSession, llm_handler: LLMHandler, project_id: int, current_topic: dict, current_topic_conversation_record: list, topics_list: list) -> dict | None:
         try:
             # Query section information
-            current_section_object = db.query(
-                Section.section_id,
-                Section.section_number,
-                Section.section_content,
-            ).join(Topic, Section.section_id == Topic.section_id).filter(
-                Topic.topic_number == current_topic["topic_number"],
-                Section.project_id == project_id
-            ).first()
+            current_section_object = (await db.execute(
+                select(Section.section_id, Section.section_number, Section.section_content)
+                .join(Topic, Section.section_id == Topic.section_id)
+                .where(Topic.topic_number == current_topic["topic_number"], Topic.project_id == project_id)
+            )).first()
 
             if not current_section_object:
                 raise ValueError("The current_section not found")
@@ -337,10 +316,7 @@ class TopicOperator:
                 raise ValueError(f"Failed to parse LLM response as JSON: {response}") from e
 
             # Change the status of the replaced topic to "SystemInterrupted"
-            current_topic_object = db.query(Topic).join(Section).filter(
-                Topic.topic_number == current_topic["topic_number"],
-                Section.project_id == project_id
-            ).first()
+            current_topic_object = await TopicOperator._find_topic(db, project_id, current_topic["topic_number"])
             if not current_topic_object:
                 raise ValueError("The current_topic not found")
             current_topic_object.topic_status = "UserInterrupted"
@@ -355,10 +331,15 @@ class TopicOperator:
                 section_id=current_section_object.section_id
             )
             db.add(topic)
-            db.flush()
+            await db.flush()
             # Insert slots
             if "slots" in new_topic:
+                seen_slot_numbers = set()
                 for slot_data in new_topic["slots"]:
+                    # slot_number is unique per topic; keep the first occurrence
+                    if slot_data["slot_number"] in seen_slot_numbers:
+                        continue
+                    seen_slot_numbers.add(slot_data["slot_number"])
                     slot = Slot(
                         slot_number=slot_data["slot_number"],
                         slot_key=slot_data["slot_key"],
@@ -368,12 +349,12 @@ class TopicOperator:
                     )
                     db.add(slot)
 
-            db.commit()
+            await db.commit()
             return {
                 "topic_number": topic.topic_number,
                 "topic_content": topic.topic_content
             }
 
         except Exception as e:
-            db.rollback()
+            await db.rollback()
             raise e
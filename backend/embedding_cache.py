@@ -0,0 +1,156 @@
+import hashlib
+import threading
+from datetime import datetime, timezone, timedelta
+from typing import Optional
+from sqlalchemy import func, tuple_
+from database.database import SessionLocal
+from database.models import EmbeddingCacheEntry
+from database.embedding_codec import pack_embedding, unpack_embedding
+from .config import CONFIG
+from .http_pool import origin
+
+
+class EmbeddingCache:
+    """Persistent embedding cache keyed by (model @ endpoint origin, sha256(text)), stored in the embedding_cache table.
+
+    Entries record when they were last used; once the table grows past EMBEDDING_CACHE_MAX_ENTRIES the
+    least recently used rows are evicted. A hit only rewrites last_used_time when it is older than
+    EMBEDDING_CACHE_TOUCH_SECONDS, so repeated hits stay read-only. Vectors are kept as packed float32 so
+    hits are bit-identical to what the provider returned. The same model name served by two providers gets
+    separate entries. The methods do blocking database I/O; async callers run them with asyncio.to_thread.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "errors": 0}
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _model_key(api_url: str, model: str) -> str:
+        try:
+            return f"{model} @ {origin(api_url)}"
+        except Exception:
+            return f"{model} @ {api_url}"
+
+    def _count(self, key: str, n: int = 1) -> None:
+        with self._lock:
+            self._stats[key] += n
+
+    def get_many(self, api_url: str, model: str, texts: list[str]) -> list[Optional[list[float]]]:
+        """Cached vector (or None) for each text; hits not used for EMBEDDING_CACHE_TOUCH_SECONDS are marked as used."""
+        results: list[Optional[list[float]]] = [None] * len(texts)
+        if not CONFIG.EMBEDDING_CACHE_ENABLED or not texts:
+            return results
+        hashes = [self.text_hash(t) for t in texts]
+        db = SessionLocal()
+        try:
+            rows = db.query(EmbeddingCacheEntry).filter(
+                EmbeddingCacheEntry.model_name == self._model_key(api_url, model),
+                EmbeddingCacheEntry.text_hash.in_(list(set(hashes))),
+            ).all()
+            found = {}
+            now = datetime.now(timezone.utc)
+            stale_before = now - timedelta(seconds=max(0, CONFIG.EMBEDDING_CACHE_TOUCH_SECONDS))
+            touched = False
+            for row in rows:
+                arr = unpack_embedding(row.embedding_blob, "float32", row.embedding_dim)
+                if arr is not None:
+                    found[row.text_hash] = arr.tolist()
+                    used = row.last_used_time
+                    if used is None or (used if used.tzinfo else used.replace(tzinfo=timezone.utc)) <= stale_before:
+                        row.last_used_time = now
+                        touched = True
+            if touched:
+                db.commit()
+            for i, h in enumerate(hashes):
+                results[i] = found.get(h)
+        except Exception as e:
+            db.rollback()
+            self._count("errors")
+            print(f"Embedding cache lookup failed: {e}")
+        finally:
+            db.close()
+        hits = sum(1 for r in results if r is not None)
+        self._count("hits", hits)
+        self._count("misses", len(texts) - hits)
+        return results
+
+    def get(self, api_url: str, model: str, text: str) -> Optional[list[float]]:
+        return self.get_many(api_url, model, [text])[0]
+
+    def put_many(self, api_url: str, model: str, items: list[tuple[str, list[float]]]) -> None:
+        if not CONFIG.EMBEDDING_CACHE_ENABLED:
+            return
+        entries = {}
+        for text, vec in items:
+            if vec:
+                entries[self.text_hash(text)] = vec
+        if not entries:
+            return
+        db = SessionLocal()
+        try:
+            now = datetime.now(timezone.utc)
+            for h, vec in entries.items():
+                blob = pack_embedding(vec, "float32")
+                db.merge(EmbeddingCacheEntry(
+                    model_name=self._model_key(api_url, model),
+                    text_hash=h,
+                    embedding_blob=blob,
+                    embedding_dim=len(blob) // 4,
+                    created_time=now,
+                    last_used_time=now,
+                ))
+            db.commit()
+            self._count("stores", len(entries))
+            self._evict(db)
+        except Exception as e:
+            db.rollback()
+            self._count("errors")
+            print(f"Embedding cache store failed: {e}")
+        finally:
+            db.close()
+
+    def put(self, api_url: str, model: str, text: str, vec: list[float]) -> None:
+        self.put_many(api_url, model, [(text, vec)])
+
+    def _evict(self, db) -> None:
+        limit = max(0, int(CONFIG.EMBEDDING_CACHE_MAX_ENTRIES))
+        total = db.query(func.count(EmbeddingCacheEntry.text_hash)).scalar() or 0
+        if total <= limit:
+            return
+        stale = db.query(EmbeddingCacheEntry.model_name, EmbeddingCacheEntry.text_hash) \
+            .order_by(EmbeddingCacheEntry.last_used_time.asc()) \
+            .limit(total - limit).all()
+        if not stale:
+            return
+        db.query(EmbeddingCacheEntry).filter(
+            tuple_(EmbeddingCacheEntry.model_name, EmbeddingCacheEntry.text_hash).in_([(m, h) for m, h in stale])
+        ).delete(synchronize_session=False)
+        db.commit()
+        self._count("evictions", len(stale))
+
+    def stats(self) -> dict:
+        with self._lock:
+            st = dict(self._stats)
+        lookups = st["hits"] + st["misses"]
+        entries = None
+        db = SessionLocal()
+        try:
+            entries = db.query(func.count(EmbeddingCacheEntry.text_hash)).scalar() or 0
+        except Exception:
+            pass
+        finally:
+            db.close()
+        return {
+            "enabled": bool(CONFIG.EMBEDDING_CACHE_ENABLED),
+            "max_entries": CONFIG.EMBEDDING_CACHE_MAX_ENTRIES,
+            "entries": entries,
+            **st,
+            "hit_rate": round(st["hits"] / lookups, 4) if lookups else 0.0,
+        }
+
+
+EMBEDDING_CACHE = EmbeddingCache()
@@ -0,0 +1,167 @@
+import asyncio
+import time
+import weakref
+import contextlib
+from typing import AsyncIterator
+import httpx
+from .config import CONFIG
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def origin(url: str) -> str:
+    """scheme://host:port of a URL, the unit the pool keeps one client per."""
+    return HttpClientPool._origin(url)
+
+
+def same_origin(url_a: str, url_b: str) -> bool:
+    """True if both URLs point at the same scheme://host:port, i.e. at the same provider."""
+    try:
+        return HttpClientPool._origin(url_a) == HttpClientPool._origin(url_b)
+    except Exception:
+        return False
+
+
+class HttpClientPool:
+    """Process-wide pool of keep-alive httpx clients, one per upstream origin (scheme://host:port).
+
+    httpx clients are bound to the event loop that opened their connections, so clients are
+    additionally kept per running loop; the main uvicorn loop therefore shares one client per host.
+    """
+
+    def __init__(self) -> None:
+        self._clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[str, httpx.AsyncClient]]" = weakref.WeakKeyDictionary()
+        self._stats: dict[str, dict] = {}
+        self._http2 = None
+
+    @staticmethod
+    def _origin(url: str) -> str:
+        u = httpx.URL(url)
+        port = u.port or (443 if u.scheme == "https" else 80)
+        return f"{u.scheme}://{u.host}:{port}"
+
+    def _use_http2(self) -> bool:
+        if self._http2 is None:
+            self._http2 = bool(CONFIG.HTTP_POOL_HTTP2) and _http2_available()
+            if CONFIG.HTTP_POOL_HTTP2 and not self._http2:
+                print("HTTP/2 requested but the 'h2' package is not installed; falling back to HTTP/1.1")
+        return self._http2
+
+    def _new_client(self) -> httpx.AsyncClient:
+        limits = httpx.Limits(
+            max_connections=CONFIG.HTTP_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=CONFIG.HTTP_POOL_MAX_KEEPALIVE,
+            keepalive_expiry=CONFIG.HTTP_POOL_KEEPALIVE_EXPIRY,
+        )
+        return httpx.AsyncClient(http2=self._use_http2(), limits=limits, timeout=CONFIG.HTTP_POOL_TIMEOUT)
+
+    def get_client(self, url: str) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        origin = self._origin(url)
+        per_loop = self._clients.setdefault(loop, {})
+        client = per_loop.get(origin)
+        if client is None or client.is_closed:
+            client = self._new_client()
+            per_loop[origin] = client
+            st = self._stat(origin)
+            st["clients_created"] += 1
+        return client
+
+    def _stat(self, origin: str) -> dict:
+        st = self._stats.get(origin)
+        if st is None:
+            st = {
+                "requests": 0,
+                "errors": 0,
+                "in_flight": 0,
+                "clients_created": 0,
+                "total_latency_ms": 0.0,
+                "last_status": None,
+            }
+            self._stats[origin] = st
+        return st
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        client = self.get_client(url)
+        st = self._stat(self._origin(url))
+        st["requests"] += 1
+        st["in_flight"] += 1
+        started = time.perf_counter()
+        try:
+            response = await client.post(url, **kwargs)
+            st["last_status"] = response.status_code
+            return response
+        except Exception:
+            st["errors"] += 1
+            raise
+        finally:
+            st["in_flight"] -= 1
+            st["total_latency_ms"] += (time.perf_counter() - started) * 1000.0
+
+    @contextlib.asynccontextmanager
+    async def stream(self, url: str, **kwargs) -> AsyncIterator[httpx.Response]:
+        client = self.get_client(url)
+        st = self._stat(self._origin(url))
+        st["requests"] += 1
+        st["in_flight"] += 1
+        started = time.perf_counter()
+        try:
+            async with client.stream("POST", url, **kwargs) as response:
+                st["last_status"] = response.status_code
+                yield response
+        except Exception:
+            st["errors"] += 1
+            raise
+        finally:
+            st["in_flight"] -= 1
+            st["total_latency_ms"] += (time.perf_counter() - started) * 1000.0
+
+    def stats(self) -> dict:
+        open_connections: dict[str, int] = {}
+        http_versions: dict[str, set] = {}
+        for per_loop in list(self._clients.values()):
+            for origin, client in per_loop.items():
+                try:
+                    conns = client._transport._pool.connections
+                except Exception:
+                    conns = []
+                open_connections[origin] = open_connections.get(origin, 0) + len(conns)
+                for c in conns:
+                    try:
+                        http_versions.setdefault(origin, set()).add(c._connection.__class__.__name__)
+                    except Exception:
+                        pass
+        hosts = {}
+        for origin, st in self._stats.items():
+            done = st["requests"] - st["in_flight"]
+            hosts[origin] = {
+                **st,
+                "avg_latency_ms": round(st["total_latency_ms"] / done, 2) if done > 0 else 0.0,
+                "open_connections": open_connections.get(origin, 0),
+                "connection_types": sorted(http_versions.get(origin, set())),
+            }
+        return {
+            "http2": bool(self._use_http2()),
+            "max_connections": CONFIG.HTTP_POOL_MAX_CONNECTIONS,
+            "max_keepalive_connections": CONFIG.HTTP_POOL_MAX_KEEPALIVE,
+            "keepalive_expiry": CONFIG.HTTP_POOL_KEEPALIVE_EXPIRY,
+            "hosts": hosts,
+        }
+
+    async def aclose(self) -> None:
+        loop = asyncio.get_running_loop()
+        per_loop = self._clients.pop(loop, {})
+        for client in per_loop.values():
+            try:
+                await client.aclose()
+            except Exception:
+                pass
+
+
+HTTP_POOL = HttpClientPool()
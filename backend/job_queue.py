@@ -0,0 +1,324 @@
+import json
+import asyncio
+import threading
+from datetime import datetime, timezone, timedelta
+from typing import Awaitable, Callable, Optional
+from sqlalchemy import and_, or_, func, exists
+from sqlalchemy.orm import Session, aliased
+from database.database import SessionLocal
+from database.models import BackgroundJob
+from .config import CONFIG
+
+# (db, project_id, payload) -> None; raise to have the job retried. A handler may narrow `payload` before raising
+# so that the retry only redoes the part that failed. `db` is a sync session: handlers run their queries and
+# commits through asyncio.to_thread, so a commit never blocks the event loop that serves interactive routes.
+JobHandler = Callable[[Session, Optional[int], dict], Awaitable[None]]
+
+
+class BackgroundJobQueue:
+    """Persistent queue of low-priority work (domain self-learning) run by a small pool of worker coroutines.
+
+    Jobs live in the background_jobs table, so they survive restarts and can be shared by several uvicorn
+    workers: a worker claims a job with a conditional UPDATE and holds it for JOB_LEASE_SECONDS; a job whose
+    lease ran out (its process died) is picked up again. Each run gets its own session. Failures are retried
+    with exponential backoff up to JOB_MAX_ATTEMPTS. At most one pending job exists per (job_type, project_id):
+    enqueueing again refreshes its payload instead of adding a duplicate, and jobs of the same project never
+    run concurrently. A running job renews its lease every JOB_LEASE_SECONDS / 3, so a long run is not claimed twice.
+    All queue bookkeeping (claim, renew, finish) runs in worker threads; enqueue() is blocking as well, so async
+    callers run it with asyncio.to_thread.
+
+    Credentials never reach the table: `secrets` passed to enqueue() are kept in this process only and merged
+    into the payload the handler sees. A job run by another process or after a restart gets no secrets, so its
+    handler has to fall back to server-side configuration (e.g. JOB_LLM_API_KEY).
+    """
+
+    def __init__(self) -> None:
+        self._handlers: dict[str, JobHandler] = {}
+        self._workers: list[asyncio.Task] = []
+        self._wake: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        self._secrets: dict[int, dict] = {}
+        self._stats = {"enqueued": 0, "deduplicated": 0, "completed": 0, "retried": 0, "failed": 0, "interrupted": 0, "errors": 0}
+
+    def _count(self, key: str, n: int = 1) -> None:
+        with self._lock:
+            self._stats[key] += n
+
+    def register(self, job_type: str, handler: JobHandler) -> None:
+        self._handlers[job_type] = handler
+
+    def _notify(self) -> None:
+        if self._loop is None or self._wake is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._wake.set()
+        else:
+            # Enqueued from a sync route running in the threadpool
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def enqueue(self, job_type: str, project_id: Optional[int], payload: dict, secrets: Optional[dict] = None) -> Optional[int]:
+        """Add a job, or refresh the pending one of the same project; returns its job_id (None on failure).
+
+        `secrets` (e.g. API keys) are handed to the handler alongside `payload` but are not persisted.
+        """
+        db = SessionLocal()
+        try:
+            now = datetime.now(timezone.utc)
+            job = db.query(BackgroundJob).filter(
+                BackgroundJob.job_type == job_type,
+                BackgroundJob.project_id == project_id,
+                BackgroundJob.job_status == "Pending",
+            ).order_by(BackgroundJob.job_id).first()
+            if job is not None:
+                job.payload = json.dumps(payload, ensure_ascii=False)
+                job.next_run_time = now
+                job.updated_time = now
+                counter = "deduplicated"
+            else:
+                job = BackgroundJob(
+                    job_type=job_type,
+                    project_id=project_id,
+                    payload=json.dumps(payload, ensure_ascii=False),
+                    job_status="Pending",
+                    attempts=0,
+                    next_run_time=now,
+                    created_time=now,
+                    updated_time=now,
+                )
+                db.add(job)
+                counter = "enqueued"
+            db.commit()
+            job_id = job.job_id
+            with self._lock:
+                if secrets:
+                    self._secrets[job_id] = dict(secrets)
+                else:
+                    self._secrets.pop(job_id, None)
+            self._count(counter)
+        except Exception as e:
+            db.rollback()
+            self._count("errors")
+            print(f"Enqueueing background job {job_type} for project {project_id} failed: {e}")
+            return None
+        finally:
+            db.close()
+        self._notify()
+        return job_id
+
+    def _claim(self) -> Optional[dict]:
+        """Lease the next runnable job to this worker; None when nothing is due."""
+        db = SessionLocal()
+        try:
+            now = datetime.now(timezone.utc)
+            running = aliased(BackgroundJob)
+            claimable = or_(
+                and_(BackgroundJob.job_status == "Pending", BackgroundJob.next_run_time <= now),
+                and_(BackgroundJob.job_status == "Running", BackgroundJob.locked_until < now),
+            )
+            # A job waits while another one of the same project holds a live lease
+            busy_project = exists().where(
+                running.job_type == BackgroundJob.job_type,
+                running.project_id == BackgroundJob.project_id,
+                running.job_id != BackgroundJob.job_id,
+                running.job_status == "Running",
+                running.locked_until >= now,
+            )
+            candidates = (
+                db.query(BackgroundJob.job_id)
+                .filter(claimable, ~busy_project)
+                .order_by(BackgroundJob.next_run_time, BackgroundJob.job_id)
+                .limit(5)
+                .all()
+            )
+            for (job_id,) in candidates:
+                claimed = db.query(BackgroundJob).filter(BackgroundJob.job_id == job_id, claimable).update(
+                    {
+                        BackgroundJob.job_status: "Running",
+                        BackgroundJob.locked_until: now + timedelta(seconds=max(1, CONFIG.JOB_LEASE_SECONDS)),
+                        BackgroundJob.attempts: BackgroundJob.attempts + 1,
+                        BackgroundJob.updated_time: now,
+                    },
+                    synchronize_session=False,
+                )
+                db.commit()
+                if claimed != 1:
+                    # Another worker got there first
+                    continue
+                job = db.query(BackgroundJob).filter(BackgroundJob.job_id == job_id).first()
+                return {
+                    "job_id": job.job_id,
+                    "job_type": job.job_type,
+                    "project_id": job.project_id,
+                    "payload": json.loads(job.payload) if job.payload else {},
+                    "attempts": job.attempts,
+                }
+            return None
+        except Exception as e:
+            db.rollback()
+            self._count("errors")
+            print(f"Claiming a background job failed: {e}")
+            return None
+        finally:
+            db.close()
+
+    def _finish(self, job_id: int, **values) -> None:
+        db = SessionLocal()
+        try:
+            values["updated_time"] = datetime.now(timezone.utc)
+            db.query(BackgroundJob).filter(BackgroundJob.job_id == job_id).update(
+                {getattr(BackgroundJob, k): v for k, v in values.items()}, synchronize_session=False
+            )
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            self._count("errors")
+            print(f"Updating background job {job_id} failed: {e}")
+        finally:
+            db.close()
+
+    def _renew(self, job_id: int) -> bool:
+        """Extend the lease of a running job; False when it is no longer held."""
+        db = SessionLocal()
+        try:
+            now = datetime.now(timezone.utc)
+            renewed = db.query(BackgroundJob).filter(BackgroundJob.job_id == job_id, BackgroundJob.job_status == "Running").update(
+                {
+                    BackgroundJob.locked_until: now + timedelta(seconds=max(1, CONFIG.JOB_LEASE_SECONDS)),
+                    BackgroundJob.updated_time: now,
+                },
+                synchronize_session=False,
+            )
+            db.commit()
+            return renewed == 1
+        except Exception as e:
+            db.rollback()
+            self._count("errors")
+            print(f"Renewing the lease of background job {job_id} failed: {e}")
+            return True
+        finally:
+            db.close()
+
+    async def _heartbeat(self, job_id: int) -> None:
+        while True:
+            await asyncio.sleep(max(1, CONFIG.JOB_LEASE_SECONDS) / 3)
+            if not await asyncio.to_thread(self._renew, job_id):
+                print(f"Background job {job_id} lost its lease")
+                return
+
+    def _forget(self, job_id: int) -> None:
+        with self._lock:
+            self._secrets.pop(job_id, None)
+
+    @staticmethod
+    def _dump(payload: dict, secrets: dict) -> str:
+        """The payload to persist for the next run, without the in-memory secrets."""
+        return json.dumps({k: v for k, v in payload.items() if k not in secrets}, ensure_ascii=False)
+
+    @staticmethod
+    def _backoff(attempts: int) -> float:
+        delay = max(1, CONFIG.JOB_RETRY_BASE_SECONDS) * (2 ** max(0, attempts - 1))
+        return float(min(delay, max(1, CONFIG.JOB_RETRY_MAX_SECONDS)))
+
+    async def _run(self, job: dict) -> None:
+        handler = self._handlers.get(job["job_type"])
+        if handler is None:
+            self._count("failed")
+            self._forget(job["job_id"])
+            await asyncio.to_thread(self._finish, job["job_id"], job_status="Failed", payload=None, locked_until=None,
+                                    last_error=f"No handler for job type {job['job_type']}")
+            return
+        with self._lock:
+            secrets = dict(self._secrets.get(job["job_id"]) or {})
+        payload = {**job["payload"], **secrets}
+        db = SessionLocal()
+        heartbeat = asyncio.create_task(self._heartbeat(job["job_id"]))
+        try:
+            await handler(db, job["project_id"], payload)
+        except asyncio.CancelledError:
+            await asyncio.to_thread(db.rollback)
+            # Shutting down: hand the job back without spending an attempt
+            self._count("interrupted")
+            await asyncio.to_thread(self._finish, job["job_id"], job_status="Pending", attempts=max(0, job["attempts"] - 1),
+                                    locked_until=None, payload=self._dump(payload, secrets))
+            raise
+        except Exception as e:
+            await asyncio.to_thread(db.rollback)
+            error = f"{e} ({type(e).__name__})"
+            if job["attempts"] >= max(1, CONFIG.JOB_MAX_ATTEMPTS):
+                self._count("failed")
+                print(f"Background job {job['job_id']} ({job['job_type']}) failed for good after {job['attempts']} attempts: {error}")
+                self._forget(job["job_id"])
+                await asyncio.to_thread(self._finish, job["job_id"], job_status="Failed", payload=None, locked_until=None, last_error=error)
+            else:
+                delay = self._backoff(job["attempts"])
+                self._count("retried")
+                print(f"Background job {job['job_id']} ({job['job_type']}) failed, retrying in {delay:.0f}s: {error}")
+                await asyncio.to_thread(
+                    self._finish,
+                    job["job_id"],
+                    job_status="Pending",
+                    payload=self._dump(payload, secrets),
+                    next_run_time=datetime.now(timezone.utc) + timedelta(seconds=delay),
+                    locked_until=None,
+                    last_error=error,
+                )
+            return
+        finally:
+            heartbeat.cancel()
+            db.close()
+        self._count("completed")
+        self._forget(job["job_id"])
+        await asyncio.to_thread(self._finish, job["job_id"], job_status="Completed", payload=None, locked_until=None, last_error=None)
+
+    async def _worker(self) -> None:
+        while True:
+            job = await asyncio.to_thread(self._claim)
+            if job is None:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=max(0.1, CONFIG.JOB_POLL_SECONDS))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job)
+
+    def start(self) -> None:
+        """Start JOB_QUEUE_WORKERS worker coroutines on the running event loop (idempotent)."""
+        if self._workers or CONFIG.JOB_QUEUE_WORKERS <= 0:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        for _ in range(CONFIG.JOB_QUEUE_WORKERS):
+            self._workers.append(asyncio.create_task(self._worker()))
+
+    async def stop(self) -> None:
+        workers, self._workers = self._workers, []
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        self._loop = None
+        self._wake = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        db = SessionLocal()
+        try:
+            stats["jobs"] = {
+                status: count
+                for status, count in db.query(BackgroundJob.job_status, func.count(BackgroundJob.job_id)).group_by(BackgroundJob.job_status).all()
+            }
+        except Exception:
+            stats["jobs"] = {}
+        finally:
+            db.close()
+        stats["workers"] = len(self._workers)
+        return stats
+
+
+JOB_QUEUE = BackgroundJobQueue()
@@ -0,0 +1,207 @@
+import asyncio
+import hashlib
+import heapq
+import itertools
+import time
+import contextlib
+from typing import AsyncIterator
+from .config import CONFIG
+
+# Priority classes, most urgent first: interview turns, report/framework generation, background learning
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_REPORT = "report"
+PRIORITY_BACKGROUND = "background"
+PRIORITIES = {PRIORITY_INTERACTIVE: 0, PRIORITY_REPORT: 1, PRIORITY_BACKGROUND: 2}
+
+
+class _TokenBucket:
+    """Refills `per_minute` units per minute up to a one-minute burst; a limit of 0 disables the bucket."""
+
+    def __init__(self, per_minute: int) -> None:
+        self.capacity = float(max(0, per_minute))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.capacity / 60.0)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` units are available (requests larger than the burst wait for a full bucket)."""
+        if not self.enabled:
+            return 0.0
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) * 60.0 / self.capacity
+
+    def take(self, amount: float) -> None:
+        # May go negative when a response turns out larger than estimated; later requests then wait longer
+        if self.enabled:
+            self._refill()
+            self.tokens -= amount
+
+    def available(self) -> float | None:
+        if not self.enabled:
+            return None
+        self._refill()
+        return round(self.tokens, 1)
+
+
+class _Waiter:
+    def __init__(self, priority: str, tokens: int, future: asyncio.Future) -> None:
+        self.priority = priority
+        self.tokens = tokens
+        self.future = future
+        self.enqueued = time.monotonic()
+
+
+class Ticket:
+    """Handed out by LLMAdmissionController.admit; `charge` bills tokens only known after the response."""
+
+    def __init__(self, limiter: "_KeyLimiter") -> None:
+        self._limiter = limiter
+
+    def charge(self, tokens: int) -> None:
+        if tokens > 0:
+            self._limiter.tpm.take(tokens)
+
+
+class _KeyLimiter:
+    """Admission state of one (api_url, api_key): RPM/TPM buckets, a concurrency cap and a priority queue."""
+
+    def __init__(self, label: str) -> None:
+        self.label = label
+        self.rpm = _TokenBucket(CONFIG.LLM_RPM_LIMIT)
+        self.tpm = _TokenBucket(CONFIG.LLM_TPM_LIMIT)
+        self.max_concurrency = max(1, CONFIG.LLM_MAX_CONCURRENCY)
+        self.in_flight = 0
+        self.queue: list[tuple[int, int, _Waiter]] = []
+        self.timer: asyncio.TimerHandle | None = None
+        self.stats = {
+            p: {"admitted": 0, "queued": 0, "max_queue_depth": 0, "total_wait_ms": 0.0, "cancelled": 0}
+            for p in PRIORITIES
+        }
+
+
+class LLMAdmissionController:
+    """Process-wide gate in front of every upstream LLM/embedding request.
+
+    Requests are keyed by (api_url, api_key), so all LLMHandler instances sharing an account share its
+    LLM_RPM_LIMIT / LLM_TPM_LIMIT token buckets and LLM_MAX_CONCURRENCY slots. Waiting requests are admitted
+    strictly by priority class (interactive > report > background), FIFO within a class; the head of the queue
+    is never overtaken, so a large background request cannot be starved by a stream of small interactive ones
+    once it is the most urgent waiter.
+    """
+
+    def __init__(self) -> None:
+        self._limiters: dict[tuple[str, str], _KeyLimiter] = {}
+        self._seq = itertools.count()
+
+    @staticmethod
+    def _label(api_url: str, api_key: str) -> str:
+        # The key itself never appears in metrics, only a short fingerprint of it
+        fingerprint = hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:8]
+        return f"{api_url} [{fingerprint}]"
+
+    def _limiter(self, api_url: str, api_key: str) -> _KeyLimiter:
+        key = (api_url or "", api_key or "")
+        limiter = self._limiters.get(key)
+        if limiter is None:
+            limiter = _KeyLimiter(self._label(*key))
+            self._limiters[key] = limiter
+        return limiter
+
+    def _dispatch(self, limiter: _KeyLimiter) -> None:
+        if limiter.timer is not None:
+            limiter.timer.cancel()
+            limiter.timer = None
+        while limiter.queue:
+            waiter = limiter.queue[0][2]
+            if waiter.future.done():
+                heapq.heappop(limiter.queue)
+                continue
+            if limiter.in_flight >= limiter.max_concurrency:
+                return
+            wait = max(limiter.rpm.wait_time(1), limiter.tpm.wait_time(waiter.tokens))
+            if wait > 0:
+                limiter.timer = waiter.future.get_loop().call_later(wait, self._dispatch, limiter)
+                return
+            heapq.heappop(limiter.queue)
+            limiter.rpm.take(1)
+            limiter.tpm.take(waiter.tokens)
+            limiter.in_flight += 1
+            st = limiter.stats[waiter.priority]
+            st["admitted"] += 1
+            st["queued"] -= 1
+            st["total_wait_ms"] += (time.monotonic() - waiter.enqueued) * 1000.0
+            waiter.future.set_result(None)
+
+    def _release(self, limiter: _KeyLimiter) -> None:
+        limiter.in_flight -= 1
+        self._dispatch(limiter)
+
+    @contextlib.asynccontextmanager
+    async def admit(self, api_url: str, api_key: str, priority: str = PRIORITY_INTERACTIVE, tokens: int = 0) -> AsyncIterator[Ticket]:
+        """Wait for a slot and budget for one upstream request of about `tokens` prompt tokens."""
+        limiter = self._limiter(api_url, api_key)
+        if not CONFIG.LLM_ADMISSION_ENABLED:
+            yield Ticket(limiter)
+            return
+        priority = priority if priority in PRIORITIES else PRIORITY_INTERACTIVE
+        waiter = _Waiter(priority, max(0, int(tokens)), asyncio.get_running_loop().create_future())
+        st = limiter.stats[priority]
+        st["queued"] += 1
+        heapq.heappush(limiter.queue, (PRIORITIES[priority], next(self._seq), waiter))
+        st["max_queue_depth"] = max(st["max_queue_depth"], st["queued"])
+        self._dispatch(limiter)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Admitted just as the caller gave up: hand the slot straight back
+                self._release(limiter)
+            else:
+                st["queued"] -= 1
+                st["cancelled"] += 1
+                waiter.future.cancel()
+                self._dispatch(limiter)
+            raise
+        try:
+            yield Ticket(limiter)
+        finally:
+            self._release(limiter)
+
+    def stats(self) -> dict:
+        keys = {}
+        for limiter in self._limiters.values():
+            keys[limiter.label] = {
+                "in_flight": limiter.in_flight,
+                "max_concurrency": limiter.max_concurrency,
+                "queue_depth": sum(1 for _, _, w in limiter.queue if not w.future.done()),
+                "rpm_available": limiter.rpm.available(),
+                "tpm_available": limiter.tpm.available(),
+                "priorities": {
+                    p: {
+                        **st,
+                        "avg_wait_ms": round(st["total_wait_ms"] / st["admitted"], 2) if st["admitted"] else 0.0,
+                    }
+                    for p, st in limiter.stats.items()
+                },
+            }
+        return {
+            "enabled": CONFIG.LLM_ADMISSION_ENABLED,
+            "rpm_limit": CONFIG.LLM_RPM_LIMIT,
+            "tpm_limit": CONFIG.LLM_TPM_LIMIT,
+            "max_concurrency": CONFIG.LLM_MAX_CONCURRENCY,
+            "keys": keys,
+        }
+
+
+LLM_ADMISSION = LLMAdmissionController()
@@ -0,0 +1,142 @@
+import hashlib
+import threading
+from datetime import datetime, timezone, timedelta
+from typing import Optional
+from sqlalchemy import func, tuple_
+from database.database import SessionLocal
+from database.models import LLMResponseCacheEntry
+from .config import CONFIG
+from .http_pool import origin
+
+
+class LLMResponseCache:
+    """Persistent cache of LLM completions keyed by (model @ endpoint origin, sha256(prompt), sha256(query)).
+
+    Only call sites that opt in (`call_llm(..., cache=True)`) use it, i.e. prompts whose answer is a pure
+    function of their inputs. Rows live in the llm_response_cache table, so they survive restarts and are
+    shared between uvicorn workers; entries older than LLM_CACHE_TTL_SECONDS are ignored and the least
+    recently used rows are evicted past LLM_CACHE_MAX_ENTRIES. The same model name served by two providers
+    gets separate entries. A hit only rewrites last_used_time when it is older than LLM_CACHE_TOUCH_SECONDS.
+    The methods do blocking database I/O; async callers run them with asyncio.to_thread.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0, "errors": 0}
+
+    @staticmethod
+    def _hash(text: str) -> str:
+        return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+    def _count(self, key: str, n: int = 1) -> None:
+        with self._lock:
+            self._stats[key] += n
+
+    @staticmethod
+    def _model_key(api_url: str, model: str) -> str:
+        try:
+            return f"{model} @ {origin(api_url)}"
+        except Exception:
+            return f"{model} @ {api_url}"
+
+    def _cutoff(self) -> datetime:
+        return datetime.now(timezone.utc) - timedelta(seconds=max(0, int(CONFIG.LLM_CACHE_TTL_SECONDS)))
+
+    def get(self, api_url: str, model: str, prompt: str, query: str) -> Optional[str]:
+        if not CONFIG.LLM_CACHE_ENABLED:
+            return None
+        db = SessionLocal()
+        try:
+            row = db.query(LLMResponseCacheEntry).filter(
+                LLMResponseCacheEntry.model_name == self._model_key(api_url, model),
+                LLMResponseCacheEntry.prompt_hash == self._hash(prompt),
+                LLMResponseCacheEntry.query_hash == self._hash(query),
+                LLMResponseCacheEntry.created_time >= self._cutoff(),
+            ).first()
+            if row is None:
+                self._count("misses")
+                return None
+            response = row.response
+            now = datetime.now(timezone.utc)
+            used = row.last_used_time
+            if used is None or (used if used.tzinfo else used.replace(tzinfo=timezone.utc)) <= now - timedelta(seconds=max(0, CONFIG.LLM_CACHE_TOUCH_SECONDS)):
+                row.last_used_time = now
+                db.commit()
+            self._count("hits")
+            return response
+        except Exception as e:
+            db.rollback()
+            self._count("errors")
+            print(f"LLM cache lookup failed: {e}")
+            return None
+        finally:
+            db.close()
+
+    def put(self, api_url: str, model: str, prompt: str, query: str, response: str) -> None:
+        if not CONFIG.LLM_CACHE_ENABLED or not response:
+            return
+        db = SessionLocal()
+        try:
+            now = datetime.now(timezone.utc)
+            db.merge(LLMResponseCacheEntry(
+                model_name=self._model_key(api_url, model),
+                prompt_hash=self._hash(prompt),
+                query_hash=self._hash(query),
+                response=response,
+                created_time=now,
+                last_used_time=now,
+            ))
+            db.commit()
+            self._count("stores")
+            self._evict(db)
+        except Exception as e:
+            db.rollback()
+            self._count("errors")
+            print(f"LLM cache store failed: {e}")
+        finally:
+            db.close()
+
+    def _evict(self, db) -> None:
+        expired = db.query(LLMResponseCacheEntry).filter(
+            LLMResponseCacheEntry.created_time < self._cutoff()
+        ).delete(synchronize_session=False)
+        if expired:
+            db.commit()
+            self._count("expired", expired)
+        limit = max(0, int(CONFIG.LLM_CACHE_MAX_ENTRIES))
+        total = db.query(func.count(LLMResponseCacheEntry.prompt_hash)).scalar() or 0
+        if total <= limit:
+            return
+        key = (LLMResponseCacheEntry.model_name, LLMResponseCacheEntry.prompt_hash, LLMResponseCacheEntry.query_hash)
+        stale = db.query(*key).order_by(LLMResponseCacheEntry.last_used_time.asc()).limit(total - limit).all()
+        if not stale:
+            return
+        db.query(LLMResponseCacheEntry).filter(
+            tuple_(*key).in_([tuple(r) for r in stale])
+        ).delete(synchronize_session=False)
+        db.commit()
+        self._count("evictions", len(stale))
+
+    def stats(self) -> dict:
+        with self._lock:
+            st = dict(self._stats)
+        lookups = st["hits"] + st["misses"]
+        entries = None
+        db = SessionLocal()
+        try:
+            entries = db.query(func.count(LLMResponseCacheEntry.prompt_hash)).scalar() or 0
+        except Exception:
+            pass
+        finally:
+            db.close()
+        return {
+            "enabled": bool(CONFIG.LLM_CACHE_ENABLED),
+            "ttl_seconds": CONFIG.LLM_CACHE_TTL_SECONDS,
+            "max_entries": CONFIG.LLM_CACHE_MAX_ENTRIES,
+            "entries": entries,
+            **st,
+            "hit_rate": round(st["hits"] / lookups, 4) if lookups else 0.0,
+        }
+
+
+LLM_CACHE = LLMResponseCache()
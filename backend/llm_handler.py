@@ -1,100 +1,430 @@
 import asyncio
+import time
 import httpx
-from typing import Optional
+from typing import Optional, AsyncIterator
 import json
+from .http_pool import HTTP_POOL, same_origin
+from .config import CONFIG
+from .embedding_cache import EMBEDDING_CACHE
+from .llm_cache import LLM_CACHE
+from .llm_admission import LLM_ADMISSION, PRIORITY_INTERACTIVE
+from .retry_policy import RETRY_POLICY, RetryState
+from .circuit_breaker import CIRCUIT_BREAKERS
+from .llm_hedging import HEDGING
+
+DEFAULT_EMBEDDING_URL = "https://api.rcouyi.com/v1/embeddings"
+DEFAULT_EMBEDDING_MODEL = "text-embedding-3-large"
 
 class LLMHandler:
 
-    def __init__(self, api_url: str, api_key: str, model_name: str):
+    def __init__(self, api_url: str, api_key: str, model_name: str, priority: str = PRIORITY_INTERACTIVE):
         self.api_url = api_url
         self.api_key = api_key
         self.model_name = model_name
+        # Admission priority class of every request made through this handler (see llm_admission.py)
+        self.priority = priority
+
+    def with_priority(self, priority: str) -> "LLMHandler":
+        """Same endpoint and credentials, queued under another admission priority."""
+        return LLMHandler(api_url=self.api_url, api_key=self.api_key, model_name=self.model_name, priority=priority)
 
     def _validate_settings(self) -> bool:
         required_fields = [self.api_url, self.api_key, self.model_name]
         return all(field and field.strip() for field in required_fields)
 
-    async def call_llm(self, prompt: str, query: str = "") -> Optional[str]:
+    def _endpoints(self) -> list[tuple[str, str, str]]:
+        """(api_url, api_key, model_name) to try in order: this handler's endpoint, then LLM_FALLBACK_ENDPOINTS.
+
+        The caller's key is only ever sent to its own origin: a fallback on another host needs LLM_FALLBACK_API_KEY
+        and is skipped without it.
+        """
+        endpoints = [(self.api_url, self.api_key, self.model_name)]
+        for entry in (CONFIG.LLM_FALLBACK_ENDPOINTS or "").split(","):
+            api_url, _, model_name = entry.strip().partition("|")
+            api_url, model_name = api_url.strip(), model_name.strip()
+            if not api_url or not model_name:
+                continue
+            api_key = CONFIG.LLM_FALLBACK_API_KEY or (self.api_key if same_origin(api_url, self.api_url) else "")
+            if not api_key:
+                continue
+            endpoint = (api_url, api_key, model_name)
+            if all(e[0] != api_url or e[2] != model_name for e in endpoints):
+                endpoints.append(endpoint)
+        return endpoints
+
+    async def call_llm(self, prompt: str, query: str = "", cache: bool = False, deadline: Optional[float] = None,
+                       hedge: bool = False) -> Optional[str]:
+        """`cache=True` opts a deterministic call into the persistent response cache (see llm_cache.py).
+
+        `deadline` bounds the whole call in seconds, queueing and retries included (default LLM_CALL_DEADLINE_SECONDS).
+        Endpoints whose circuit breaker is open are skipped; when an endpoint keeps failing the call fails over to
+        the next one in LLM_FALLBACK_ENDPOINTS. `hedge=True` (latency-critical call sites) sends a duplicate request
+        when the first is slower than usual and takes whichever answers first (see llm_hedging.py).
+        """
         if not self._validate_settings():
             print("The LLM Settings are incomplete, making it impossible to call the large model")
             return None
+        if cache:
+            cached = await asyncio.to_thread(LLM_CACHE.get, self.api_url, self.model_name, prompt, query)
+            if cached is not None:
+                print(f"\nLLM response (cached): {cached}")
+                print(f"\n{'---'*40}")
+                return cached
+
+        endpoints = self._endpoints()
+        for index, (api_url, api_key, model_name) in enumerate(endpoints):
+            if not CIRCUIT_BREAKERS.allow(api_url, model_name):
+                print(f"Skipping {model_name} at {api_url}: circuit open")
+                continue
+            last = index == len(endpoints) - 1
+            retry = RETRY_POLICY.begin("chat", deadline, max_attempts=None if last else CONFIG.LLM_FAILOVER_ATTEMPTS)
+            if hedge and CONFIG.LLM_HEDGE_ENABLED:
+                content = await self._call_hedged(api_url, api_key, model_name, prompt, query, retry)
+            else:
+                content = await self._call_endpoint(api_url, api_key, model_name, prompt, query, retry)
+            if content is not None:
+                # Cached under the endpoint that answered, so a fallback's answer is not served as the primary's
+                if cache:
+                    await asyncio.to_thread(LLM_CACHE.put, api_url, model_name, prompt, query, content)
+                return content
+            if retry.gave_up != "exhausted":
+                return None
+            deadline = retry.remaining()
+            if deadline is not None and deadline <= 0:
+                return None
+            if not last:
+                print(f"Failing over from {model_name} at {api_url}")
+        return None
+
+    async def _call_hedged(self, api_url: str, api_key: str, model_name: str, prompt: str, query: str, retry: RetryState) -> Optional[str]:
+        """_call_endpoint, plus one duplicate request if the first has not answered within HEDGING.delay.
+
+        `retry` belongs to the first request, so a failover decision still follows its outcome; the duplicate
+        gets a single attempt within the remaining deadline.
+        """
+        primary = asyncio.create_task(self._call_endpoint(api_url, api_key, model_name, prompt, query, retry))
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=HEDGING.delay(api_url, model_name))
+            if done:
+                HEDGING.count("not_needed")
+                return primary.result()
+            HEDGING.count("hedged_calls")
+            hedge_url, hedge_key, hedge_model = HEDGING.secondary(api_url, api_key, model_name)
+            if CIRCUIT_BREAKERS.allow(hedge_url, hedge_model):
+                hedge_retry = RETRY_POLICY.begin("chat", retry.remaining(), max_attempts=1)
+                tasks.add(asyncio.create_task(self._call_endpoint(hedge_url, hedge_key, hedge_model, prompt, query, hedge_retry)))
+                HEDGING.count("hedges_sent")
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    content = task.result()
+                    if content is not None:
+                        HEDGING.count("primary_wins" if task is primary else "hedge_wins")
+                        return content
+            HEDGING.count("both_failed")
+            return None
+        finally:
+            # Cancel the loser (or both, if our caller was cancelled)
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
 
+    async def _call_endpoint(self, api_url: str, api_key: str, model_name: str, prompt: str, query: str, retry: RetryState) -> Optional[str]:
+        """One endpoint's attempts under `retry`; None once it gives up (see retry.gave_up)."""
         messages = [{"role": "system", "content": prompt}, {"role": "user", "content": query}]
-        request_data = {"model": self.model_name, "messages": messages}
-        headers = {"Content-Type": "application/json", "Authorization": f"Bearer {self.api_key}"}
+        request_data = {"model": model_name, "messages": messages}
+        headers = {"Content-Type": "application/json", "Authorization": f"Bearer {api_key}"}
+        prompt_tokens = self.estimate_tokens(prompt) + self.estimate_tokens(query)
+
+        async def _post() -> tuple[httpx.Response, object]:
+            async with LLM_ADMISSION.admit(api_url, api_key, self.priority, prompt_tokens) as ticket:
+                response = await HTTP_POOL.post(api_url, json=request_data, headers=headers)
+                result = None
+                if response.status_code == 200:
+                    result = response.json()
+                    ticket.charge(self._usage_tokens(result, prompt_tokens) - prompt_tokens)
+                return response, result
 
-        attempts = 3
-        base_delay = 0.8
-        last_error_text = None
-        for i in range(attempts):
-            print(f"\n[PROMPT] LLM call attempt {i + 1} with prompt: \n{prompt}")
+        while True:
+            print(f"\n[PROMPT] LLM call attempt {retry.attempt} with prompt: \n{prompt}")
             if query.strip():
-                print(f"\n[QUERY] LLM call attempt {i + 1} with query: \n{query}")
+                print(f"\n[QUERY] LLM call attempt {retry.attempt} with query: \n{query}")
             print(f"\n{'---'*40}")
+            response = None
+            started = time.monotonic()
             try:
-                async with httpx.AsyncClient(timeout=30.0) as client:
-                    response = await client.post(self.api_url, json=request_data, headers=headers)
+                response, result = await retry.run(_post())
                 if response.status_code == 200:
-                    result = response.json()
                     if 'choices' in result and len(result['choices']) > 0:
-                        print(f"\nLLM response: {result['choices'][0]['message']['content'].strip()}")
+                        content = result['choices'][0]['message']['content'].strip()
+                        print(f"\nLLM response: {content}")
                         print(f"\n{'---'*40}")
-                        return result['choices'][0]['message']['content'].strip()
+                        latency = time.monotonic() - started
+                        CIRCUIT_BREAKERS.record_success(api_url, model_name, latency)
+                        HEDGING.observe(api_url, model_name, latency)
+                        retry.succeeded()
+                        return content
                     else:
                         print(f"LLM response format exception: {result}")
-                        last_error_text = "format_error"
                     # fallthrough to retry
+                    response = None
+                    CIRCUIT_BREAKERS.record_failure(api_url, model_name)
                 else:
-                    last_error_text = f"{response.status_code} - {response.text}"
-                    print(f"The LLM API call failed: {last_error_text}")
+                    print(f"The LLM API call failed: {response.status_code} - {response.text}")
+                    if RETRY_POLICY.retryable(response.status_code):
+                        CIRCUIT_BREAKERS.record_failure(api_url, model_name)
             except httpx.ConnectError as e:
-                last_error_text = str(e)
-                print(f"The LLM API connection failed: {last_error_text}")
+                CIRCUIT_BREAKERS.record_failure(api_url, model_name)
+                print(f"The LLM API connection failed: {e}")
             except httpx.TimeoutException as e:
-                last_error_text = str(e)
-                print(f"The LLM API request timed out: {last_error_text}")
+                CIRCUIT_BREAKERS.record_failure(api_url, model_name)
+                print(f"The LLM API request timed out: {e}")
+            except asyncio.TimeoutError:
+                CIRCUIT_BREAKERS.record_failure(api_url, model_name)
+                retry.deadline_exceeded()
+                return None
             except Exception as e:
-                last_error_text = f"{str(e)} ({type(e).__name__})"
-                print(f"An error occurred when invoking the LLM service: {last_error_text}")
-            if i < attempts - 1:
-                delay = base_delay * (2 ** i)
-                try:
-                    await asyncio.sleep(delay)
-                except Exception:
-                    pass
-        return None
+                CIRCUIT_BREAKERS.record_failure(api_url, model_name)
+                print(f"An error occurred when invoking the LLM service: {str(e)} ({type(e).__name__})")
+            if not await retry.backoff(response=response):
+                return None
 
-    async def get_embedding(self, text: str, embedding_api_url: Optional[str] = None, model_name: Optional[str] = None) -> Optional[list[float]]:
-        url = embedding_api_url or "https://api.rcouyi.com/v1/embeddings"
-        model = model_name or "text-embedding-3-large"
-        data = {"model": model, "input": text}
+    @staticmethod
+    def _usage_tokens(result: object, estimated_prompt_tokens: int) -> int:
+        """Tokens a completion consumed: the reported usage, else the prompt estimate plus the answer's estimate."""
+        if isinstance(result, dict):
+            usage = result.get("usage")
+            if isinstance(usage, dict) and isinstance(usage.get("total_tokens"), int):
+                return usage["total_tokens"]
+            try:
+                return estimated_prompt_tokens + LLMHandler.estimate_tokens(result['choices'][0]['message']['content'])
+            except Exception:
+                pass
+        return estimated_prompt_tokens
+
+    async def stream_llm(self, prompt: str, query: str = "", deadline: Optional[float] = None) -> AsyncIterator[str]:
+        """Streaming variant of call_llm (OpenAI `stream: true`): yields content deltas as they arrive.
+
+        Failed attempts are retried, or failed over to the next endpoint, only while nothing has been yielded yet;
+        `deadline` bounds the connection and retries, not how long the stream may run once it has started.
+        """
+        if not self._validate_settings():
+            print("The LLM Settings are incomplete, making it impossible to call the large model")
+            return
+
+        endpoints = self._endpoints()
+        for index, (api_url, api_key, model_name) in enumerate(endpoints):
+            if not CIRCUIT_BREAKERS.allow(api_url, model_name):
+                print(f"Skipping {model_name} at {api_url}: circuit open")
+                continue
+            last = index == len(endpoints) - 1
+            retry = RETRY_POLICY.begin("stream", deadline, max_attempts=None if last else CONFIG.LLM_FAILOVER_ATTEMPTS)
+            yielded = False
+            deltas = self._stream_endpoint(api_url, api_key, model_name, prompt, query, retry)
+            try:
+                async for delta in deltas:
+                    yielded = True
+                    yield delta
+            finally:
+                # Release the admission slot and connection even if our consumer stops early
+                await deltas.aclose()
+            if yielded or retry.gave_up != "exhausted":
+                return
+            deadline = retry.remaining()
+            if deadline is not None and deadline <= 0:
+                return
+            if not last:
+                print(f"Failing over from {model_name} at {api_url}")
+
+    async def _stream_endpoint(self, api_url: str, api_key: str, model_name: str, prompt: str, query: str, retry: RetryState) -> AsyncIterator[str]:
+        messages = [{"role": "system", "content": prompt}, {"role": "user", "content": query}]
+        request_data = {"model": model_name, "messages": messages, "stream": True}
+        headers = {"Content-Type": "application/json", "Authorization": f"Bearer {api_key}", "Accept": "text/event-stream"}
+        prompt_tokens = self.estimate_tokens(prompt) + self.estimate_tokens(query)
+
+        while True:
+            print(f"\n[PROMPT] LLM stream attempt {retry.attempt} with prompt: \n{prompt}")
+            print(f"\n{'---'*40}")
+            yielded = False
+            streamed: list[str] = []
+            failed_response = None
+            started = time.monotonic()
+            try:
+                async with LLM_ADMISSION.admit(api_url, api_key, self.priority, prompt_tokens) as ticket, \
+                        HTTP_POOL.stream(api_url, json=request_data, headers=headers, timeout=retry.timeout(CONFIG.HTTP_POOL_TIMEOUT)) as response:
+                    if response.status_code != 200:
+                        body = await response.aread()
+                        failed_response = response
+                        print(f"The LLM API stream call failed: {response.status_code} - {body.decode('utf-8', errors='ignore')}")
+                        if RETRY_POLICY.retryable(response.status_code):
+                            CIRCUIT_BREAKERS.record_failure(api_url, model_name)
+                    elif "text/event-stream" not in response.headers.get("content-type", ""):
+                        # Upstream ignored `stream`; fall back to the whole completion at once
+                        result = json.loads(await response.aread())
+                        ticket.charge(self._usage_tokens(result, prompt_tokens) - prompt_tokens)
+                        if 'choices' in result and len(result['choices']) > 0:
+                            yielded = True
+                            CIRCUIT_BREAKERS.record_success(api_url, model_name, time.monotonic() - started)
+                            retry.succeeded()
+                            yield result['choices'][0]['message']['content'].strip()
+                            return
+                        print(f"LLM response format exception: {result}")
+                        CIRCUIT_BREAKERS.record_failure(api_url, model_name)
+                    else:
+                        async for line in response.aiter_lines():
+                            line = line.strip()
+                            if not line.startswith("data:"):
+                                continue
+                            data = line[5:].strip()
+                            if data == "[DONE]":
+                                break
+                            try:
+                                chunk = json.loads(data)
+                            except json.JSONDecodeError:
+                                continue
+                            choices = chunk.get("choices") or []
+                            if not choices:
+                                continue
+                            delta = (choices[0].get("delta") or {}).get("content")
+                            if delta:
+                                if not yielded:
+                                    # Time to first token is what the latency SLO applies to
+                                    CIRCUIT_BREAKERS.record_success(api_url, model_name, time.monotonic() - started)
+                                    retry.succeeded()
+                                yielded = True
+                                streamed.append(delta)
+                                yield delta
+                        ticket.charge(self.estimate_tokens("".join(streamed)))
+                        if yielded:
+                            return
+                        CIRCUIT_BREAKERS.record_failure(api_url, model_name)
+            except httpx.ConnectError as e:
+                CIRCUIT_BREAKERS.record_failure(api_url, model_name)
+                print(f"The LLM API connection failed: {e}")
+            except httpx.TimeoutException as e:
+                CIRCUIT_BREAKERS.record_failure(api_url, model_name)
+                print(f"The LLM API request timed out: {e}")
+            except Exception as e:
+                CIRCUIT_BREAKERS.record_failure(api_url, model_name)
+                print(f"An error occurred when streaming from the LLM service: {e} ({type(e).__name__})")
+            if yielded:
+                return
+            if not await retry.backoff(response=failed_response):
+                return
+
+    async def _request_embeddings(self, url: str, model: str, payload_input: str | list[str], expected: int) -> Optional[list[list[float]]]:
+        """POST one embeddings request (retried under RETRY_POLICY); returns the vectors in input order."""
+        data = {"model": model, "input": payload_input}
         headers = {"Content-Type": "application/json", "Authorization": f"Bearer {self.api_key}"}
-        attempts = 3
-        base_delay = 0.8
-        for i in range(attempts):
+        input_tokens = sum(self.estimate_tokens(t) for t in ([payload_input] if isinstance(payload_input, str) else payload_input))
+
+        async def _post() -> httpx.Response:
+            async with LLM_ADMISSION.admit(url, self.api_key, self.priority, input_tokens):
+                return await HTTP_POOL.post(url, json=data, headers=headers)
+
+        retry = RETRY_POLICY.begin("embeddings")
+        while True:
+            response = None
             try:
-                async with httpx.AsyncClient(timeout=30.0) as client:
-                    response = await client.post(url, json=data, headers=headers)
+                response = await retry.run(_post())
                 if response.status_code == 200:
                     result = response.json()
-                    if "data" in result and len(result["data"]) > 0 and "embedding" in result["data"][0]:
-                        return result["data"][0]["embedding"]
-                    else:
-                        pass
-                else:
-                    pass
-            except httpx.ConnectError:
-                pass
-            except httpx.TimeoutException:
-                pass
+                    items = result.get("data") if isinstance(result, dict) else None
+                    if isinstance(items, list) and len(items) == expected and all("embedding" in it for it in items):
+                        items = sorted(items, key=lambda it: it.get("index", 0))
+                        retry.succeeded()
+                        return [it["embedding"] for it in items]
+                    # Malformed body: retry like a transport error
+                    response = None
+            except asyncio.TimeoutError:
+                retry.deadline_exceeded()
+                return None
             except Exception:
                 pass
-            if i < attempts - 1:
-                delay = base_delay * (2 ** i)
-                try:
-                    await asyncio.sleep(delay)
-                except Exception:
-                    pass
-        return None
+            if not await retry.backoff(response=response):
+                return None
+
+    async def get_embedding(self, text: str, embedding_api_url: Optional[str] = None, model_name: Optional[str] = None) -> Optional[list[float]]:
+        url = embedding_api_url or DEFAULT_EMBEDDING_URL
+        model = model_name or DEFAULT_EMBEDDING_MODEL
+        # 缓存读写是同步的数据库I/O，放到线程中执行以免阻塞事件循环
+        cached = await asyncio.to_thread(EMBEDDING_CACHE.get, url, model, text)
+        if cached is not None:
+            return cached
+        vectors = await self._request_embeddings(url, model, text, 1)
+        if not vectors:
+            return None
+        await asyncio.to_thread(EMBEDDING_CACHE.put, url, model, text, vectors[0])
+        return vectors[0]
+
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        # 粗略估算：按UTF-8字节数/3计，中文约每字1 token，英文偏保守
+        return max(1, len((text or "").encode("utf-8")) // 3)
+
+    @staticmethod
+    def chunk_embedding_inputs(texts: list[str], max_items: int | None = None, max_tokens: int | None = None) -> list[list[int]]:
+        """Group input positions into batches bounded by an item count and an estimated token budget."""
+        max_items = max(1, int(max_items or CONFIG.EMBED_BATCH_MAX_ITEMS))
+        max_tokens = max(1, int(max_tokens or CONFIG.EMBED_BATCH_MAX_TOKENS))
+        batches: list[list[int]] = []
+        current: list[int] = []
+        current_tokens = 0
+        for i, text in enumerate(texts):
+            tokens = LLMHandler.estimate_tokens(text)
+            if current and (len(current) >= max_items or current_tokens + tokens > max_tokens):
+                batches.append(current)
+                current = []
+                current_tokens = 0
+            current.append(i)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    async def iter_embeddings(self, texts: list[str], embedding_api_url: Optional[str] = None,
+                              model_name: Optional[str] = None) -> AsyncIterator[tuple[list[int], list[Optional[list[float]]]]]:
+        """Embed many texts in batches, yielding (positions, vectors) for each batch as soon as it is done.
+
+        Batches follow chunk_embedding_inputs and at most EMBED_BATCH_CONCURRENCY of them are in flight. Each batch
+        is looked up in the embedding cache first; only its misses are sent, as one array `input` request. A
+        failed text gets None. Callers can persist every batch as it arrives instead of holding all vectors.
+        """
+        url = embedding_api_url or DEFAULT_EMBEDDING_URL
+        model = model_name or DEFAULT_EMBEDDING_MODEL
+        semaphore = asyncio.Semaphore(max(1, CONFIG.EMBED_BATCH_CONCURRENCY))
+
+        async def _run(batch: list[int]) -> tuple[list[int], list[Optional[list[float]]]]:
+            batch_texts = [texts[i] for i in batch]
+            async with semaphore:
+                vectors = await asyncio.to_thread(EMBEDDING_CACHE.get_many, url, model, batch_texts)
+                # 只请求未命中缓存的文本
+                missing = [j for j, vec in enumerate(vectors) if vec is None]
+                if missing:
+                    fetched = await self._request_embeddings(url, model, [batch_texts[j] for j in missing], len(missing))
+                    if fetched:
+                        for j, vec in zip(missing, fetched):
+                            vectors[j] = vec
+                        await asyncio.to_thread(EMBEDDING_CACHE.put_many, url, model, [(batch_texts[j], vec) for j, vec in zip(missing, fetched)])
+            return batch, vectors
+
+        tasks = [asyncio.create_task(_run(chunk)) for chunk in self.chunk_embedding_inputs(texts)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # The caller stopped early (or failed): do not leave batches running
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
 
- 
+    async def get_embeddings(self, texts: list[str], embedding_api_url: Optional[str] = None, model_name: Optional[str] = None) -> list[Optional[list[float]]]:
+        """Embed many texts with the OpenAI-compatible array `input`; one result (or None) per text, in order."""
+        results: list[Optional[list[float]]] = [None] * len(texts)
+        # 批次按原始下标回填
+        async for batch, vectors in self.iter_embeddings(texts, embedding_api_url=embedding_api_url, model_name=model_name):
+            for i, vec in zip(batch, vectors):
+                results[i] = vec
+        return results
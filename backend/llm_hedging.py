@@ -0,0 +1,71 @@
+import threading
+from collections import deque
+from .config import CONFIG
+from .http_pool import same_origin
+
+
+class HedgePolicy:
+    """Latency history per (api_url, model_name) and the hedge delay derived from it.
+
+    `call_llm(..., hedge=True)` sends a duplicate request when the first one has not answered after the
+    LLM_HEDGE_PERCENTILE-th percentile of the endpoint's recent successful latencies (clamped to
+    [LLM_HEDGE_MIN_DELAY, LLM_HEDGE_MAX_DELAY]; LLM_HEDGE_DEFAULT_DELAY until LLM_HEDGE_MIN_SAMPLES are known).
+    The duplicate goes to LLM_HEDGE_ENDPOINT when set, else to the same endpoint; whichever answers first wins
+    and the other is cancelled. Only about (100 - percentile)% of calls are hedged, so the extra load is small.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._latencies: dict[tuple[str, str], deque] = {}
+        self._stats = {"hedged_calls": 0, "not_needed": 0, "hedges_sent": 0, "primary_wins": 0, "hedge_wins": 0, "both_failed": 0}
+
+    def count(self, key: str) -> None:
+        with self._lock:
+            self._stats[key] += 1
+
+    def observe(self, api_url: str, model_name: str, latency: float) -> None:
+        with self._lock:
+            window = self._latencies.get((api_url, model_name))
+            if window is None:
+                window = deque(maxlen=max(1, CONFIG.LLM_HEDGE_WINDOW))
+                self._latencies[(api_url, model_name)] = window
+            window.append(latency)
+
+    def delay(self, api_url: str, model_name: str) -> float:
+        """Seconds to wait for the first request before sending the hedge."""
+        with self._lock:
+            samples = sorted(self._latencies.get((api_url, model_name)) or ())
+        if len(samples) < max(1, CONFIG.LLM_HEDGE_MIN_SAMPLES):
+            delay = CONFIG.LLM_HEDGE_DEFAULT_DELAY
+        else:
+            rank = min(len(samples) - 1, int(len(samples) * min(100.0, max(0.0, CONFIG.LLM_HEDGE_PERCENTILE)) / 100.0))
+            delay = samples[rank]
+        return min(max(delay, CONFIG.LLM_HEDGE_MIN_DELAY), max(CONFIG.LLM_HEDGE_MIN_DELAY, CONFIG.LLM_HEDGE_MAX_DELAY))
+
+    @staticmethod
+    def secondary(api_url: str, api_key: str, model_name: str) -> tuple[str, str, str]:
+        """Endpoint of the hedge request: LLM_HEDGE_ENDPOINT ("api_url|model_name") or the primary itself.
+
+        The caller's key is reused only when the hedge endpoint has the primary's origin; an endpoint on another
+        host needs LLM_HEDGE_API_KEY, otherwise the hedge goes to the primary endpoint instead.
+        """
+        hedge_url, _, hedge_model = (CONFIG.LLM_HEDGE_ENDPOINT or "").partition("|")
+        hedge_url, hedge_model = hedge_url.strip(), hedge_model.strip()
+        if not hedge_url or not hedge_model:
+            return api_url, api_key, model_name
+        hedge_key = CONFIG.LLM_HEDGE_API_KEY or (api_key if same_origin(hedge_url, api_url) else "")
+        if not hedge_key:
+            return api_url, api_key, model_name
+        return hedge_url, hedge_key, hedge_model
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            endpoints = list(self._latencies.keys())
+        stats["enabled"] = CONFIG.LLM_HEDGE_ENABLED
+        stats["percentile"] = CONFIG.LLM_HEDGE_PERCENTILE
+        stats["delays"] = {f"{model} @ {url}": round(self.delay(url, model), 3) for url, model in endpoints}
+        return stats
+
+
+HEDGING = HedgePolicy()
@@ -1,6 +1,8 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from database.database import init_db
+from database.database import init_db, report_database_settings, async_engine
+from .http_pool import HTTP_POOL
+from .job_queue import JOB_QUEUE
 
 app = FastAPI()
 from .routes.templates import router as templates_router
@@ -21,6 +23,17 @@ app.add_middleware(
 @app.on_event("startup")
 def on_startup():
     init_db()
+    report_database_settings()
+
+@app.on_event("startup")
+async def start_background_jobs():
+    JOB_QUEUE.start()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await JOB_QUEUE.stop()
+    await HTTP_POOL.aclose()
+    await async_engine.dispose()
 
 app.include_router(templates_router)
 app.include_router(auth_router)
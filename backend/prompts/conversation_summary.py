@@ -0,0 +1,19 @@
+conversation_summary_prompt = """
+# 职责：专业访谈记录整理专家
+# 背景：半结构化需求访谈进行中，单个主题下的对话轮次较多。为控制后续提示词长度，较早的对话轮次将以摘要形式保留，最近若干轮仍保留原文。
+# 任务：将[previous_summary]与[new_rounds]合并为一份新的滚动摘要，完整保留其中与需求相关的事实信息。
+
+# 输入：
+1. 已有摘要（可能为空） As [previous_summary]:
+  {previous_summary}
+2. 需要并入摘要的对话轮次 As [new_rounds]:
+  {new_rounds}
+
+# 摘要规则：
+  - 只保留受访者给出的事实、需求、约束、数据、偏好与明确的否定/拒答，以及访谈者已经问过的问题要点（避免后续重复提问）；
+  - 不得编造、推理或补充对话中不存在的信息；数字、名称、时间等细节须原样保留；
+  - 与[previous_summary]冲突时，以[new_rounds]中较新的信息为准；
+  - 语言凝练，使用中文，不超过500字。
+
+# 输出要求：仅输出摘要正文，无额外说明、无代码块标记。
+"""
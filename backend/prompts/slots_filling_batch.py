@@ -0,0 +1,44 @@
+slots_filling_batch_prompt = """
+# 职责：您是专业的信息提取专家。
+# 背景：半结构化访谈正在进行。当前我们基于“本次访谈的对话记录”（该记录来源于当前调度主题，可能同时涉及多个主题），一次性对多个目标主题的槽位进行填充、更新或扩展。
+# 任务：从本次访谈的对话记录中分别提取与每个目标主题相关的关键信息，并据此对各目标主题下的槽位进行填充/更新/扩展；若某个主题没有可用信息，则该主题不做任何修改。
+# 准则：若无法明确填充某个槽位的值，请尽量避免填充模糊的内容；而应填充具体、有实际意义的信息。
+
+# 输入：
+1. 本次访谈的对话记录 As [current_topic_conversation_record]：
+  {current_topic_conversation_record}
+2. 目标主题列表，每个元素包含主题编号、主题描述及其槽位清单（已填与未填） As [target_topics]:
+  {target_topics}
+3. 全项目其他主题的已收集信息概要 As [entire_project_info_slots]：
+  {entire_interview_info_slots}
+
+# 步骤：
+## 步骤1：对[最新一轮对话记录]进行审阅，针对[target_topics]中的每个主题，分别聚焦与该主题直接相关的新增/更明确/更细化的信息。
+## 步骤2：对该主题的槽位清单进行填充或更新；若需要承载新增信息而不存在合适槽位，则在该主题下创建“新槽位”。
+## 步骤3：若本轮对话未提供与某个主题相关的有效信息：
+  - 该主题对应的值输出空数组 []（不返回任何未变化的槽）。
+
+# 内容填充规则：
+  - 槽位值必须是直接从[最新一轮对话记录]中提取的、无任何逻辑演绎或推理，但要注意凝练信息而不是冗余填充。
+  - 同一条信息只填入最相关的一个主题，不要在多个主题中重复填充。
+  - 只填充与以提供信息强相关的槽位，不填充与信息无关的槽位。
+
+# 注意：
+1. 以最新一轮对话为主；允许参考上下文但不要臆造。
+2. 每个主题的填充/更新内容必须与该主题一致；槽位编号必须沿用该主题的编号规则。
+3. 创建新槽位时，确保粒度与现有槽一致、内容不与该主题槽位或[全项目信息概要]中的槽重复；命名与格式保持一致。
+4. 对无法确定的槽，slot_value 请标记为"None"（必须加引号）。
+5. 除固定格式外，slot_key、slot_value（除"None"）使用中文。
+
+# 输出格式：仅输出一个JSON对象（topic_results），键为[target_topics]中的topic_number，值为该主题需要“填充/更新/扩展”的槽数组；无额外文本、无代码块标记：
+{
+  "topic-1-1": [
+    {
+      "slot_number": "slot-1-1-1",
+      "slot_key": "XXX",
+      "slot_value": "XXX"
+    }
+  ],
+  "topic-2-3": []
+}
+"""
@@ -0,0 +1,187 @@
+import asyncio
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Optional, TypeVar
+import httpx
+from .config import CONFIG
+
+T = TypeVar("T")
+
+OUTCOMES = ("success", "success_after_retry", "retried", "retry_after_honored", "non_retryable", "exhausted", "deadline_exceeded")
+
+
+class RetryPolicy:
+    """When and how long to retry upstream LLM/embedding requests.
+
+    Only transport errors, malformed 200 responses and the statuses in LLM_RETRY_STATUSES are retried; other
+    statuses (400, 401, 403, 404, ...) fail at once. Delays grow exponentially from LLM_RETRY_BASE_DELAY up to
+    LLM_RETRY_MAX_DELAY with random jitter, except that an upstream Retry-After (or retry-after-ms) header is
+    honoured as given; a Retry-After longer than LLM_RETRY_AFTER_MAX is not waited for. No retry starts once
+    LLM_RETRY_MAX_ELAPSED seconds have passed since the first attempt or when it would end past the call's
+    deadline. Outcomes are counted per operation ("chat", "stream", "embeddings").
+    """
+
+    def __init__(self, max_attempts: int, base_delay: float, max_delay: float, max_elapsed: float, jitter: float,
+                 retryable_statuses: set[int], retry_after_max: float) -> None:
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = max(0.0, base_delay)
+        self.max_delay = max(self.base_delay, max_delay)
+        self.max_elapsed = max(0.0, max_elapsed)
+        self.jitter = min(1.0, max(0.0, jitter))
+        self.retryable_statuses = retryable_statuses
+        self.retry_after_max = max(0.0, retry_after_max)
+        self._lock = threading.Lock()
+        self._stats: dict[str, dict[str, int]] = {}
+
+    @staticmethod
+    def from_config() -> "RetryPolicy":
+        statuses = set()
+        for part in (CONFIG.LLM_RETRY_STATUSES or "").split(","):
+            part = part.strip()
+            if part.isdigit():
+                statuses.add(int(part))
+        return RetryPolicy(
+            max_attempts=CONFIG.LLM_RETRY_MAX_ATTEMPTS,
+            base_delay=CONFIG.LLM_RETRY_BASE_DELAY,
+            max_delay=CONFIG.LLM_RETRY_MAX_DELAY,
+            max_elapsed=CONFIG.LLM_RETRY_MAX_ELAPSED,
+            jitter=CONFIG.LLM_RETRY_JITTER,
+            retryable_statuses=statuses,
+            retry_after_max=CONFIG.LLM_RETRY_AFTER_MAX,
+        )
+
+    def count(self, operation: str, outcome: str) -> None:
+        with self._lock:
+            st = self._stats.setdefault(operation, {o: 0 for o in OUTCOMES})
+            st[outcome] += 1
+
+    def retryable(self, status_code: int) -> bool:
+        return status_code in self.retryable_statuses
+
+    @staticmethod
+    def retry_after(response: httpx.Response) -> Optional[float]:
+        """Seconds the upstream asked us to wait (retry-after-ms, or Retry-After as seconds or an HTTP date)."""
+        value = response.headers.get("retry-after-ms")
+        if value:
+            try:
+                return max(0.0, float(value) / 1000.0)
+            except ValueError:
+                pass
+        value = (response.headers.get("retry-after") or "").strip()
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            when = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=timezone.utc)
+        return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+    def backoff_delay(self, retry_number: int) -> float:
+        """Jittered exponential delay before retry `retry_number` (1-based)."""
+        delay = min(self.max_delay, self.base_delay * (2 ** max(0, retry_number - 1)))
+        return delay * (1.0 - self.jitter * random.random())
+
+    def begin(self, operation: str, deadline: Optional[float] = None, max_attempts: Optional[int] = None) -> "RetryState":
+        """Start the retry bookkeeping of one call; `deadline` is its total budget in seconds (None/0 = none).
+
+        `max_attempts` lowers the attempt limit for this call, e.g. before failing over to another endpoint.
+        """
+        if deadline is None:
+            deadline = CONFIG.LLM_CALL_DEADLINE_SECONDS
+        return RetryState(self, operation, deadline if deadline and deadline > 0 else None, max_attempts)
+
+    def stats(self) -> dict:
+        with self._lock:
+            operations = {op: dict(st) for op, st in self._stats.items()}
+        return {
+            "max_attempts": self.max_attempts,
+            "base_delay": self.base_delay,
+            "max_delay": self.max_delay,
+            "max_elapsed": self.max_elapsed,
+            "retryable_statuses": sorted(self.retryable_statuses),
+            "operations": operations,
+        }
+
+
+class RetryState:
+    """Attempt counter, elapsed time and deadline of one call made under a RetryPolicy."""
+
+    def __init__(self, policy: RetryPolicy, operation: str, deadline: Optional[float], max_attempts: Optional[int] = None) -> None:
+        self.policy = policy
+        self.operation = operation
+        self.max_attempts = max(1, min(max_attempts, policy.max_attempts)) if max_attempts else policy.max_attempts
+        self.attempt = 1
+        # Why the call stopped retrying: "non_retryable", "exhausted" or "deadline_exceeded"
+        self.gave_up: Optional[str] = None
+        self.started = time.monotonic()
+        self.deadline_at = self.started + deadline if deadline is not None else None
+
+    def remaining(self) -> Optional[float]:
+        if self.deadline_at is None:
+            return None
+        return max(0.0, self.deadline_at - time.monotonic())
+
+    def timeout(self, default: float) -> float:
+        """HTTP timeout of the next attempt: the pool default, cut short by the deadline."""
+        remaining = self.remaining()
+        return default if remaining is None else max(0.001, min(default, remaining))
+
+    async def run(self, awaitable: Awaitable[T]) -> T:
+        """Await one attempt, cancelled with asyncio.TimeoutError if it outlives the deadline."""
+        remaining = self.remaining()
+        if remaining is None:
+            return await awaitable
+        return await asyncio.wait_for(awaitable, timeout=max(0.001, remaining))
+
+    def succeeded(self) -> None:
+        self.policy.count(self.operation, "success")
+        if self.attempt > 1:
+            self.policy.count(self.operation, "success_after_retry")
+
+    def _give_up(self, outcome: str) -> bool:
+        self.gave_up = outcome
+        self.policy.count(self.operation, outcome)
+        return False
+
+    def deadline_exceeded(self) -> None:
+        print(f"The {self.operation} request gave up: deadline exceeded after {self.attempt} attempt(s)")
+        self._give_up("deadline_exceeded")
+
+    async def backoff(self, retryable: bool = True, response: Optional[httpx.Response] = None) -> bool:
+        """Sleep before the next attempt and return True, or return False when the call should give up."""
+        policy = self.policy
+        if response is not None and not policy.retryable(response.status_code):
+            retryable = False
+        if not retryable:
+            return self._give_up("non_retryable")
+        if self.attempt >= self.max_attempts:
+            return self._give_up("exhausted")
+        retry_after = policy.retry_after(response) if response is not None else None
+        if retry_after is not None and retry_after > policy.retry_after_max:
+            print(f"Not retrying the {self.operation} request: upstream asked to wait {retry_after:.1f}s")
+            return self._give_up("exhausted")
+        delay = retry_after if retry_after is not None else policy.backoff_delay(self.attempt)
+        if time.monotonic() + delay - self.started > policy.max_elapsed:
+            return self._give_up("exhausted")
+        remaining = self.remaining()
+        if remaining is not None and delay >= remaining:
+            self.deadline_exceeded()
+            return False
+        policy.count(self.operation, "retried")
+        if retry_after is not None:
+            policy.count(self.operation, "retry_after_honored")
+        await asyncio.sleep(delay)
+        self.attempt += 1
+        return True
+
+
+RETRY_POLICY = RetryPolicy.from_config()
@@ -3,6 +3,16 @@ from pydantic import BaseModel
 import json
 
 from ..llm_handler import LLMHandler
+from ..http_pool import HTTP_POOL
+from ..core.embedding_index import EMBEDDING_INDEX
+from ..core.conversation_record import CONVERSATION_RECORDS
+from ..embedding_cache import EMBEDDING_CACHE
+from ..llm_cache import LLM_CACHE
+from ..llm_admission import LLM_ADMISSION
+from ..job_queue import JOB_QUEUE
+from ..retry_policy import RETRY_POLICY
+from ..circuit_breaker import CIRCUIT_BREAKERS
+from ..llm_hedging import HEDGING
 from ..config import CONFIG
 from ..prompts.entropy_eval import entropy_eval_prompt
 
@@ -17,7 +27,7 @@ class EntropyEvaluateRequest(BaseModel):
 @router.post("/api/projects/entropy-evaluate")
 async def entropy_evaluate(payload: EntropyEvaluateRequest):
     llm = LLMHandler(api_url=payload.api_url, api_key=payload.api_key, model_name=payload.model_name)
-    response = await llm.call_llm(prompt=entropy_eval_prompt, query=payload.text)
+    response = await llm.call_llm(prompt=entropy_eval_prompt, query=payload.text, cache=True)
     data = {}
     if response:
         s = response.strip()
@@ -81,3 +91,19 @@ def get_config_values():
         "retrieval_cosine_threshold": CONFIG.RETRIEVAL_COSINE_THRESHOLD,
         "retrieval_top_k": CONFIG.RETRIEVAL_TOP_K,
     }
+
+@router.get("/api/metrics/llm")
+def get_llm_metrics():
+    return {
+        "success": True,
+        "http_pool": HTTP_POOL.stats(),
+        "embedding_index": EMBEDDING_INDEX.stats(),
+        "embedding_cache": EMBEDDING_CACHE.stats(),
+        "llm_cache": LLM_CACHE.stats(),
+        "conversation_records": CONVERSATION_RECORDS.stats(),
+        "llm_admission": LLM_ADMISSION.stats(),
+        "job_queue": JOB_QUEUE.stats(),
+        "retries": RETRY_POLICY.stats(),
+        "circuit_breakers": CIRCUIT_BREAKERS.stats(),
+        "hedging": HEDGING.stats(),
+    }
@@ -11,7 +11,10 @@ from typing import List
 
 from database.database import get_db
 from database.models import DomainExperience, User
+from database.embedding_codec import set_embedding
 from ..llm_handler import LLMHandler
+from ..config import CONFIG
+from ..core.embedding_index import EMBEDDING_INDEX
 from ..prompts.domain_ingest import domain_ingest_prompt
 
 router = APIRouter()
@@ -86,13 +89,15 @@ def create_domain_experience(payload: DomainExperienceCreate, db: Session = Depe
         domain_description=payload.domain_description,
         domain_experience_content=payload.domain_experience_content,
         tags=(json.dumps(payload.tags, ensure_ascii=False) if payload.tags is not None else None),
-        embedding=(json.dumps(payload.embedding) if payload.embedding is not None else None),
         user_id=user_id,
         updated_time=datetime.now(timezone.utc),
     )
+    if payload.embedding is not None:
+        set_embedding(d, payload.embedding, dtype=CONFIG.EMBEDDING_STORAGE_DTYPE)
     db.add(d)
     db.commit()
     db.refresh(d)
+    EMBEDDING_INDEX.upsert_domain(db, d)
     return {"success": True, "domain_id": d.domain_id}
 
 @router.patch("/api/domain-experiences/{domain_id}")
@@ -111,10 +116,11 @@ def update_domain_experience(domain_id: int, payload: DomainExperienceUpdate, db
     if payload.tags is not None:
         d.tags = json.dumps(payload.tags, ensure_ascii=False)
     if payload.embedding is not None:
-        d.embedding = json.dumps(payload.embedding)
+        set_embedding(d, payload.embedding, dtype=CONFIG.EMBEDDING_STORAGE_DTYPE)
     d.updated_time = datetime.now(timezone.utc)
     db.commit()
     db.refresh(d)
+    EMBEDDING_INDEX.upsert_domain(db, d)
     return {"success": True}
 
 @router.delete("/api/domain-experiences/{domain_id}")
@@ -124,6 +130,7 @@ def delete_domain_experience(domain_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="领域经验不存在")
     db.delete(d)
     db.commit()
+    EMBEDDING_INDEX.remove_domain(db, domain_id)
     return {"success": True}
 
 @router.post("/api/domain-experiences/{domain_id}/embedding/recompute")
@@ -138,31 +145,57 @@ async def recompute_domain_embedding(domain_id: int, payload: EmbeddingComputeRe
     vec = await handler.get_embedding(text, embedding_api_url=payload.api_url, model_name=payload.model_name)
     if vec is None:
         raise HTTPException(status_code=500, detail="嵌入计算失败")
-    d.embedding = json.dumps(vec)
+    set_embedding(d, vec, model_name=payload.model_name, dtype=CONFIG.EMBEDDING_STORAGE_DTYPE)
     d.updated_time = datetime.now(timezone.utc)
     db.commit()
     db.refresh(d)
+    EMBEDDING_INDEX.upsert_domain(db, d)
     return {"success": True}
 
 @router.post("/api/domain-experiences/embedding/recompute-all")
 async def recompute_all_domain_embeddings(payload: EmbeddingBatchComputeRequest, db: Session = Depends(get_db)):
-    query = db.query(DomainExperience)
-    if payload.user_id is not None:
-        query = query.filter(DomainExperience.user_id == payload.user_id)
-    items = query.all()
     if not payload.api_url or not payload.model_name:
         raise HTTPException(status_code=400, detail="缺少Embedding配置")
+    query = db.query(
+        DomainExperience.domain_id,
+        DomainExperience.user_id,
+        DomainExperience.domain_name,
+        DomainExperience.domain_description,
+        DomainExperience.domain_experience_content,
+    )
+    if payload.user_id is not None:
+        query = query.filter(DomainExperience.user_id == payload.user_id)
+    rows = query.order_by(DomainExperience.domain_id).all()
+    texts = [f"{r.domain_name}\n{r.domain_description}\n{r.domain_experience_content}" for r in rows]
     handler = LLMHandler(api_url=payload.api_url, api_key=payload.api_key, model_name=payload.model_name)
-    updated = 0
-    for d in items:
-        text = f"{d.domain_name}\n{d.domain_description}\n{d.domain_experience_content}"
-        vec = await handler.get_embedding(text, embedding_api_url=payload.api_url, model_name=payload.model_name)
-        if vec is not None:
-            d.embedding = json.dumps(vec)
-            d.updated_time = datetime.now(timezone.utc)
-            updated += 1
-    db.commit()
-    return {"success": True, "updated": updated}
+    counts = {"updated": 0, "failed": 0}
+    batches = 0
+
+    def _persist(done: dict) -> bool:
+        now = datetime.now(timezone.utc)
+        try:
+            for d in db.query(DomainExperience).filter(DomainExperience.domain_id.in_(list(done.keys()))).all():
+                set_embedding(d, done[d.domain_id][1], model_name=payload.model_name, dtype=CONFIG.EMBEDDING_STORAGE_DTYPE)
+                d.updated_time = now
+            db.commit()
+        except Exception:
+            db.rollback()
+            return False
+        EMBEDDING_INDEX.upsert_vectors(db, [(domain_id, user_id, vec) for domain_id, (user_id, vec) in done.items()])
+        return True
+
+    # 每批完成即提交（在线程中执行，不阻塞事件循环）：中途失败时已完成批次的结果保留
+    async for batch, vectors in handler.iter_embeddings(texts, embedding_api_url=payload.api_url, model_name=payload.model_name):
+        done = {rows[i].domain_id: (rows[i].user_id, vec) for i, vec in zip(batch, vectors) if vec is not None}
+        counts["failed"] += len(batch) - len(done)
+        if not done:
+            continue
+        batches += 1
+        if await asyncio.to_thread(_persist, done):
+            counts["updated"] += len(done)
+        else:
+            counts["failed"] += len(done)
+    return {"success": True, "updated": counts["updated"], "failed": counts["failed"], "batches": batches}
 
 @router.post("/api/domain-experiences/ingest-create")
 async def ingest_create_domain_experience(
@@ -274,10 +307,11 @@ async def ingest_create_domain_experience(
     vec = await handler.get_embedding(f"{d.domain_name}\n{d.domain_description}\n{d.domain_experience_content}", embedding_api_url=embed_api_url, model_name=embed_model_name)
     if vec is not None:
         try:
-            d.embedding = json.dumps(vec)
+            set_embedding(d, vec, model_name=embed_model_name, dtype=CONFIG.EMBEDDING_STORAGE_DTYPE)
         except Exception:
-            d.embedding = None
+            set_embedding(d, None)
         db.commit()
+    EMBEDDING_INDEX.upsert_domain(db, d)
 
     return {
         "success": True,
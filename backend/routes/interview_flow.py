@@ -1,11 +1,15 @@
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel, ConfigDict
 import json
 
-from database.database import get_db
-from database.models import Project, Section, Topic, Message
+from database.database import get_db, get_async_db, AsyncSessionLocal
+from database.models import Project, Topic, Message
 from ..llm_handler import LLMHandler
+from ..llm_admission import PRIORITY_REPORT
 from ..config import CONFIG
 from ..core.project_prefiller import ProjectPrefiller
 from ..core.framework_generator import FrameworkGenerator
@@ -14,10 +18,16 @@ from ..core.remarks_generator import RemarksGenerator
 from ..core.slot_filler import SlotFiller
 from ..core.operation_selector import OperationSelector
 from ..core.topic_operator import TopicOperator
-from ..prompts.affected_topic_detection import affected_topic_detection_prompt
+from ..core.affected_topic_detector import AffectedTopicDetector
+from ..core.task_graph import TaskGraph
+from ..core.conversation_record import CONVERSATION_RECORDS
+from ..core.conversation_summarizer import ConversationSummarizer
+from ..core.project_snapshot import ProjectSnapshot
 
 router = APIRouter()
 
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
 class SafeModel(BaseModel):
     model_config = ConfigDict(protected_namespaces=())
 
@@ -43,7 +53,7 @@ async def initialize_project_framework(project_id: int, payload: LLMConfig, db:
     if not project:
         raise HTTPException(status_code=404, detail="项目不存在")
     user_id = project.user_id
-    llm = LLMHandler(api_url=payload.api_url, api_key=payload.api_key, model_name=payload.model_name)
+    llm = LLMHandler(api_url=payload.api_url, api_key=payload.api_key, model_name=payload.model_name, priority=PRIORITY_REPORT)
     try:
         await FrameworkGenerator.generate_framework(db=db, llm_handler=llm, user_id=user_id, user_input=project.initial_requirements, project_id=project_id)
         return {"success": True}
@@ -51,17 +61,24 @@ async def initialize_project_framework(project_id: int, payload: LLMConfig, db:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"初始化访谈框架失败: {str(e)}")
 
+async def _first_topic(db: AsyncSession, project_id: int, ongoing: bool = False) -> Topic | None:
+    """First topic of the project by id, optionally only among the 'Ongoing' ones."""
+    stmt = select(Topic).where(Topic.project_id == project_id)
+    if ongoing:
+        stmt = stmt.where(Topic.topic_status == 'Ongoing')
+    return (await db.execute(stmt.order_by(Topic.topic_id).limit(1))).scalars().first()
+
 @router.post("/api/projects/{project_id}/interview/start")
-async def start_interview(project_id: int, payload: StartInterviewRequest, db: Session = Depends(get_db)):
-    project = db.query(Project).filter(Project.project_id == project_id).first()
+async def start_interview(project_id: int, payload: StartInterviewRequest, db: AsyncSession = Depends(get_async_db)):
+    project = await db.get(Project, project_id)
     if not project:
         raise HTTPException(status_code=404, detail="项目不存在")
     llm = LLMHandler(api_url=payload.api_url, api_key=payload.api_key, model_name=payload.model_name)
     first_time = (project.project_status == 'Pending')
     if first_time:
         project.project_status = 'Ongoing'
-        db.commit()
-    topic = db.query(Topic).join(Section).filter(Section.project_id == project_id, Topic.topic_status == 'Ongoing').order_by(Topic.topic_id).first()
+        await db.commit()
+    topic = await _first_topic(db, project_id, ongoing=True)
     if not topic:
         chosen_topic_number = None
         if first_time:
@@ -72,53 +89,47 @@ async def start_interview(project_id: int, payload: StartInterviewRequest, db: S
                         chosen_topic_number = str(stored[0].get("topic_number") or "")
                 except Exception:
                     project.priority_sequence = None
-                    db.commit()
+                    await db.commit()
             if not chosen_topic_number:
                 try:
                     seq = await PriorityBuilder.build(db=db, llm_handler=llm, project_id=project_id)
                     result = []
                     for item in seq:
-                        t = db.query(Topic).join(Section).filter(Topic.topic_number == item["topic_number"], Section.project_id == project_id).first()
+                        topic_content = await db.scalar(select(Topic.topic_content).where(Topic.topic_number == item["topic_number"], Topic.project_id == project_id).limit(1))
                         result.append({
                             "topic_number": item["topic_number"],
-                            "topic_content": (t.topic_content if t else None),
+                            "topic_content": topic_content,
                             "status": item.get("status"),
                             "core": item.get("core"),
                         })
                     project.priority_sequence = json.dumps(result, ensure_ascii=False)
-                    db.commit()
+                    await db.commit()
                     if len(result) > 0:
                         chosen_topic_number = str(result[0]["topic_number"])
                 except Exception:
                     chosen_topic_number = None
         if chosen_topic_number:
-            topic = db.query(Topic).join(Section).filter(Section.project_id == project_id, Topic.topic_number == chosen_topic_number).order_by(Topic.topic_id).first()
+            topic = (await db.execute(select(Topic).where(Topic.project_id == project_id, Topic.topic_number == chosen_topic_number).order_by(Topic.topic_id))).scalars().first()
         if not topic:
-            topic = db.query(Topic).join(Section).filter(Section.project_id == project_id).order_by(Topic.topic_id).first()
+            topic = await _first_topic(db, project_id)
             if not topic:
                 raise HTTPException(status_code=400, detail="项目无主题")
         topic.topic_status = 'Ongoing'
-        db.commit()
+        await db.commit()
     try:
-        await ProjectPrefiller.prefill_all_from_initial(db=db, llm_handler=llm, project_id=project_id)
+        # 仅当初始需求或槽位结构变化时才重新预填，且在后台进行，不阻塞首个问题的生成
+        if await db.run_sync(ProjectPrefiller.needs_prefill, project):
+            ProjectPrefiller.schedule_prefill(llm_handler=llm, project_id=project_id)
     except Exception:
         pass
     current_topic = {"topic_number": topic.topic_number, "topic_content": topic.topic_content}
+    snapshot = await db.run_sync(ProjectSnapshot.load, project_id)
     topics_list = [
-        {"topic_number": t.topic_number, "topic_content": t.topic_content}
-        for t in db.query(Topic).join(Section).filter(Section.project_id == project_id).order_by(Topic.topic_id).all()
+        {"topic_number": t["topic_number"], "topic_content": t["topic_content"]}
+        for t in snapshot.topics.values()
     ]
-    messages = db.query(Message).filter(Message.topic_id == topic.topic_id).order_by(Message.message_id).all()
-    current_topic_conversation_record = []
-    round_num = 0
-    for m in messages:
-        if m.role == 'Interviewer':
-            round_num += 1
-            current_topic_conversation_record.append({"Round": round_num, "Interviewer": m.message_content})
-        else:
-            if current_topic_conversation_record:
-                current_topic_conversation_record[-1]["Interviewee"] = m.message_content
-    last_interviewer = db.query(Message).filter(Message.topic_id == topic.topic_id, Message.role == 'Interviewer').order_by(Message.message_id.desc()).first()
+    current_topic_conversation_record = await db.run_sync(CONVERSATION_RECORDS.prompt_record, topic)
+    last_interviewer = (await db.execute(select(Message).where(Message.topic_id == topic.topic_id, Message.role == 'Interviewer').order_by(Message.message_id.desc()).limit(1))).scalars().first()
     if last_interviewer is None:
         interviewer_remarks = await RemarksGenerator.generate_remarks(
             db=db,
@@ -128,11 +139,12 @@ async def start_interview(project_id: int, payload: StartInterviewRequest, db: S
             current_topic_conversation_record=current_topic_conversation_record,
             topics_list=topics_list,
             scheduling_log="",
+            snapshot=snapshot,
         )
         new_msg = Message(role='Interviewer', message_type='Text', message_content=interviewer_remarks, audio_path=None, topic_id=topic.topic_id)
         db.add(new_msg)
-        db.commit()
-        db.refresh(new_msg)
+        await db.commit()
+        await db.refresh(new_msg)
     else:
         new_msg = last_interviewer
     return {
@@ -152,78 +164,63 @@ async def start_interview(project_id: int, payload: StartInterviewRequest, db: S
         },
     }
 
-@router.post("/api/projects/{project_id}/interview/reply")
-async def interview_reply(project_id: int, payload: ReplyRequest, db: Session = Depends(get_db)):
-    project = db.query(Project).filter(Project.project_id == project_id).first()
+async def _advance_interview(project_id: int, payload: ReplyRequest, db: AsyncSession) -> dict:
+    """Store the interviewee's reply, fill slots, run the topic operation and return what the next remarks need.
+
+    Returns {"end_response": ...} when the interview is over, otherwise the llm handler, the next topic, its
+    conversation record, the topics list, the scheduling log and the project snapshot.
+    """
+    project = await db.get(Project, project_id)
     if not project:
         raise HTTPException(status_code=404, detail="项目不存在")
     llm = LLMHandler(api_url=payload.api_url, api_key=payload.api_key, model_name=payload.model_name)
-    topic = db.query(Topic).join(Section).filter(Section.project_id == project_id, Topic.topic_status == 'Ongoing').order_by(Topic.topic_id).first()
+    topic = await _first_topic(db, project_id, ongoing=True)
     if not topic:
-        topic = db.query(Topic).join(Section).filter(Section.project_id == project_id).order_by(Topic.topic_id).first()
+        topic = await _first_topic(db, project_id)
         if not topic:
             raise HTTPException(status_code=400, detail="项目无主题")
         topic.topic_status = 'Ongoing'
-        db.commit()
+        await db.commit()
     user_msg = Message(role='Interviewee', message_type='Text', message_content=payload.text, audio_path=None, topic_id=topic.topic_id)
     db.add(user_msg)
-    db.commit()
-    db.refresh(user_msg)
-    messages = (
-        db.query(Message)
-        .filter(Message.topic_id == topic.topic_id)
-        .order_by(Message.message_id)
-        .all()
-    )
-    current_topic_conversation_record = []
-    round_num = 0
-    for m in messages:
-        if m.role == 'Interviewer':
-            round_num += 1
-            current_topic_conversation_record.append({
-                "Round": round_num,
-                "Interviewer_id": m.message_id,
-                "Interviewer": m.message_content
-            })
-        else:
-            if current_topic_conversation_record:
-                current_topic_conversation_record[-1]["Interviewee_id"] = m.message_id
-                current_topic_conversation_record[-1]["Interviewee"] = m.message_content
+    await db.commit()
+    await db.refresh(user_msg)
+    current_topic_conversation_record = await db.run_sync(CONVERSATION_RECORDS.prompt_record, topic, True)
     current_topic = {"topic_number": topic.topic_number, "topic_content": topic.topic_content}
+    snapshot = await db.run_sync(ProjectSnapshot.load, project_id)
     topics_list = [
-        {"topic_number": t.topic_number, "topic_content": t.topic_content}
-        for t in db.query(Topic).join(Section).filter(Section.project_id == project_id).order_by(Topic.topic_id).all()
+        {"topic_number": t["topic_number"], "topic_content": t["topic_content"]}
+        for t in snapshot.topics.values()
     ]
-    try:
-        detection_resp = await llm.call_llm(
-            prompt=affected_topic_detection_prompt.replace("{current_topic_content}", str(current_topic["topic_content"]))
-                                              .replace("{current_topic_conversation_record}", str(current_topic_conversation_record))
-                                              .replace("{topics_list}", str(topics_list))
-        )
-        affected_list = []
-        if detection_resp:
-            try:
-                parsed = json.loads(detection_resp)
-                if isinstance(parsed, list):
-                    affected_list = [str(x) for x in parsed]
-            except json.JSONDecodeError:
-                affected_list = []
-        if not affected_list:
-            affected_list = [current_topic["topic_number"]]
-    except Exception:
-        affected_list = [current_topic["topic_number"]]
-    for tn in affected_list:
-        t_obj = (
-            db.query(Topic)
-            .join(Section)
-            .filter(Topic.topic_number == tn, Section.project_id == project_id)
-            .first()
-        )
-        if not t_obj:
-            continue
-        target = {"topic_number": t_obj.topic_number, "topic_content": t_obj.topic_content}
-        await SlotFiller.fill_slot(db=db, llm_handler=llm, project_id=project_id, current_topic=target, current_topic_conversation_record=current_topic_conversation_record)
-    op_data = await OperationSelector.select_operation(llm_handler=llm, current_topic=current_topic, current_topic_conversation_record=current_topic_conversation_record, topics_list=topics_list)
+
+    async def _detect() -> list[str]:
+        return await AffectedTopicDetector.detect(llm_handler=llm, current_topic=current_topic, current_topic_conversation_record=current_topic_conversation_record, topics_list=topics_list)
+
+    async def _fill(detect: list[str]) -> None:
+        targets = []
+        seen_topic_ids = set()
+        for tn in detect:
+            t_obj = (await db.execute(
+                select(Topic).where(Topic.topic_number == tn, Topic.project_id == project_id)
+            )).scalars().first()
+            if not t_obj or t_obj.topic_id in seen_topic_ids:
+                continue
+            seen_topic_ids.add(t_obj.topic_id)
+            targets.append({"topic_id": t_obj.topic_id, "topic_number": t_obj.topic_number, "topic_content": t_obj.topic_content})
+        await SlotFiller.fill_affected_topics(db=db, llm_handler=llm, project_id=project_id, target_topics=targets, current_topic_conversation_record=current_topic_conversation_record, snapshot=snapshot)
+
+    async def _operation() -> object:
+        return await OperationSelector.select_operation(llm_handler=llm, current_topic=current_topic, current_topic_conversation_record=current_topic_conversation_record, topics_list=topics_list)
+
+    # Operation selection only depends on the conversation record, so it runs alongside detection -> slot filling
+    graph = TaskGraph()
+    graph.add("detect", _detect)
+    graph.add("fill", _fill, deps=["detect"])
+    graph.add("operation", _operation)
+    results = await graph.run()
+    # Fold rounds that left the verbatim window into the topic's rolling summary, off the request path
+    ConversationSummarizer.schedule(llm_handler=llm, topic_id=topic.topic_id)
+    op_data = results["operation"]
     if isinstance(op_data, str):
         op_data = {"best_operation": op_data, "confidence_scores": [{"operation": op_data, "score": 1.0}]}
     best_op = str(op_data.get("best_operation", "maintain_current_topic"))
@@ -255,14 +252,17 @@ async def interview_reply(project_id: int, payload: ReplyRequest, db: Session =
             next_topic = await TopicOperator.end_current_topic(db=db, llm_handler=llm, project_id=project_id, current_topic=current_topic, topics_list=topics_list)
             if next_topic is None:
                 project.project_status = 'Completed'
-                db.commit()
+                await db.commit()
                 end_message = "我们的访谈可以结束了，感谢您抽出时间，现在将生成需求报告。"
-                return {
+                return {"end_response": {
                     "success": True,
                     "end": True,
                     "end_message": end_message,
                     "current_topic": None,
-                }
+                }}
+        if best_op in ("create_new_topic", "refuse_current_topic_and_create_new_topic"):
+            # The new topic and its slots are not part of the snapshot yet
+            snapshot = await db.run_sync(ProjectSnapshot.load, project_id)
         if next_topic and next_topic.get("topic_number") != current_topic.get("topic_number"):
             scheduling_log = CONFIG.format_scheduling_log(
                 best_op,
@@ -278,64 +278,116 @@ async def interview_reply(project_id: int, payload: ReplyRequest, db: Session =
             current_topic.get("topic_content"),
             None,
         )
-    next_messages = (
-        db.query(Message)
-        .join(Topic, Message.topic_id == Topic.topic_id)
-        .join(Section, Topic.section_id == Section.section_id)
-        .filter(Topic.topic_number == next_topic["topic_number"], Section.project_id == project_id)
-        .order_by(Message.message_id)
-        .all()
-    )
-    current_topic_conversation_record = []
-    round_num = 0
-    for m in next_messages:
-        if m.role == 'Interviewer':
-            round_num += 1
-            current_topic_conversation_record.append({"Round": round_num, "Interviewer": m.message_content})
-        else:
-            if current_topic_conversation_record:
-                current_topic_conversation_record[-1]["Interviewee"] = m.message_content
-    interviewer_remarks = await RemarksGenerator.generate_remarks(db=db, llm_handler=llm, project_id=project_id, current_topic=next_topic, current_topic_conversation_record=current_topic_conversation_record, topics_list=topics_list, scheduling_log=scheduling_log)
-    next_topic_obj = db.query(Topic).join(Section).filter(Topic.topic_number == next_topic["topic_number"], Section.project_id == project_id).first()
+    next_topic_obj = (await db.execute(
+        select(Topic).where(Topic.topic_number == next_topic["topic_number"], Topic.project_id == project_id)
+    )).scalars().first()
+    current_topic_conversation_record = await db.run_sync(CONVERSATION_RECORDS.prompt_record, next_topic_obj) if next_topic_obj else []
+    return {
+        "llm": llm,
+        "next_topic": next_topic,
+        "next_topic_obj": next_topic_obj,
+        "current_topic_conversation_record": current_topic_conversation_record,
+        "topics_list": topics_list,
+        "scheduling_log": scheduling_log,
+        "snapshot": snapshot,
+    }
+
+def _topic_payload(topic: Topic) -> dict:
+    return {
+        "topic_id": topic.topic_id,
+        "topic_number": topic.topic_number,
+        "topic_content": topic.topic_content,
+        "topic_status": topic.topic_status,
+    }
+
+def _message_payload(msg: Message) -> dict:
+    return {
+        "message_id": msg.message_id,
+        "role": msg.role,
+        "message_type": msg.message_type,
+        "message_content": msg.message_content,
+        "created_time": msg.created_time.isoformat(),
+    }
+
+@router.post("/api/projects/{project_id}/interview/reply")
+async def interview_reply(project_id: int, payload: ReplyRequest, db: AsyncSession = Depends(get_async_db)):
+    state = await _advance_interview(project_id, payload, db)
+    if "end_response" in state:
+        return state["end_response"]
+    next_topic_obj = state["next_topic_obj"]
+    interviewer_remarks = await RemarksGenerator.generate_remarks(db=db, llm_handler=state["llm"], project_id=project_id, current_topic=state["next_topic"], current_topic_conversation_record=state["current_topic_conversation_record"], topics_list=state["topics_list"], scheduling_log=state["scheduling_log"], snapshot=state["snapshot"])
     new_msg = Message(role='Interviewer', message_type='Text', message_content=interviewer_remarks, audio_path=None, topic_id=next_topic_obj.topic_id)
     db.add(new_msg)
-    db.commit()
-    db.refresh(new_msg)
+    await db.commit()
+    await db.refresh(new_msg)
     return {
         "success": True,
-        "current_topic": {
-            "topic_id": next_topic_obj.topic_id,
-            "topic_number": next_topic_obj.topic_number,
-            "topic_content": next_topic_obj.topic_content,
-            "topic_status": next_topic_obj.topic_status,
-        },
-        "message": {
-            "message_id": new_msg.message_id,
-            "role": new_msg.role,
-            "message_type": new_msg.message_type,
-            "message_content": new_msg.message_content,
-            "created_time": new_msg.created_time.isoformat(),
-        },
+        "current_topic": _topic_payload(next_topic_obj),
+        "message": _message_payload(new_msg),
     }
 
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@router.post("/api/projects/{project_id}/interview/reply/stream")
+async def interview_reply_stream(project_id: int, payload: ReplyRequest, db: AsyncSession = Depends(get_async_db)):
+    """Same as /interview/reply, but the interviewer remarks are streamed as server-sent events:
+    `topic` (the topic the remarks belong to), repeated `delta` ({"content": ...}), then `done` with the
+    stored message; `end` replaces all of them when the interview is over, `error` reports a failed generation.
+    """
+    state = await _advance_interview(project_id, payload, db)
+    if "end_response" in state:
+        end_response = state["end_response"]
+
+        async def _end_events():
+            yield _sse("end", end_response)
+
+        return StreamingResponse(_end_events(), media_type="text/event-stream", headers=SSE_HEADERS)
+    next_topic_obj = state["next_topic_obj"]
+    topic_payload = _topic_payload(next_topic_obj)
+    prompt = await RemarksGenerator.build_prompt(db=db, project_id=project_id, current_topic=state["next_topic"], current_topic_conversation_record=state["current_topic_conversation_record"], topics_list=state["topics_list"], scheduling_log=state["scheduling_log"], snapshot=state["snapshot"])
+    llm = state["llm"]
+
+    async def _events():
+        yield _sse("topic", {"current_topic": topic_payload})
+        parts = []
+        try:
+            async for delta in llm.stream_llm(prompt=prompt):
+                parts.append(delta)
+                yield _sse("delta", {"content": delta})
+        except Exception as e:
+            print(f"Streaming interviewer remarks failed: {e}")
+        interviewer_remarks = "".join(parts).strip()
+        if not interviewer_remarks:
+            yield _sse("error", {"success": False, "detail": "采访者发言生成失败"})
+            return
+        # The request-scoped session may already be closed once the response is streaming
+        async with AsyncSessionLocal() as session:
+            new_msg = Message(role='Interviewer', message_type='Text', message_content=interviewer_remarks, audio_path=None, topic_id=topic_payload["topic_id"])
+            session.add(new_msg)
+            await session.commit()
+            await session.refresh(new_msg)
+            yield _sse("done", {"success": True, "current_topic": topic_payload, "message": _message_payload(new_msg)})
+
+    return StreamingResponse(_events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
 @router.get("/api/projects/{project_id}/chat")
 def get_project_chat(project_id: int, db: Session = Depends(get_db)):
     project = db.query(Project).filter(Project.project_id == project_id).first()
     if not project:
         raise HTTPException(status_code=404, detail="项目不存在")
-    ongoing_topic = db.query(Topic).join(Section).filter(Section.project_id == project_id, Topic.topic_status == 'Ongoing').order_by(Topic.topic_id).first()
+    ongoing_topic = db.query(Topic).filter(Topic.project_id == project_id, Topic.topic_status == 'Ongoing').order_by(Topic.topic_id).first()
     if not ongoing_topic:
         if project.project_status == 'Completed':
             ongoing_topic = None
         else:
-            ongoing_topic = db.query(Topic).join(Section).filter(Section.project_id == project_id).order_by(Topic.topic_id).first()
+            ongoing_topic = db.query(Topic).filter(Topic.project_id == project_id).order_by(Topic.topic_id).first()
             if not ongoing_topic:
                 raise HTTPException(status_code=400, detail="项目无主题")
     msgs = (
         db.query(Message, Topic)
         .join(Topic, Message.topic_id == Topic.topic_id)
-        .join(Section, Topic.section_id == Section.section_id)
-        .filter(Section.project_id == project_id)
+        .filter(Topic.project_id == project_id)
         .order_by(Message.created_time, Message.message_id)
         .all()
     )
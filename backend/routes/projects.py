@@ -3,12 +3,15 @@ from sqlalchemy.orm import Session, joinedload
 from pydantic import BaseModel
 from datetime import datetime, timezone
 import json
+import asyncio
 
 from database.database import get_db
 from database.models import User, Project, Section, Topic, Slot, Message
 from ..core.info_summarizer import InfoSummarizer
-from ..core.domain_self_learning import DomainSelfLearner
+from ..core.domain_self_learning import DOMAIN_LEARNING_JOB
+from ..job_queue import JOB_QUEUE
 from ..llm_handler import LLMHandler
+from ..llm_admission import PRIORITY_REPORT
 from ..core.framework_generator import FrameworkGenerator
 
 from .interview_flow import router as interview_flow_router
@@ -126,7 +129,7 @@ async def create_and_initialize(payload: CreateAndInitializeRequest, db: Session
     db.add(project)
     db.commit()
     db.refresh(project)
-    llm = LLMHandler(api_url=payload.api_url, api_key=payload.api_key, model_name=payload.model_name)
+    llm = LLMHandler(api_url=payload.api_url, api_key=payload.api_key, model_name=payload.model_name, priority=PRIORITY_REPORT)
     try:
         await FrameworkGenerator.generate_framework_with_content(db=db, llm_handler=llm, user_input=payload.initial_requirements, project_id=project.project_id, domain_content=(payload.fused_text or ""))
         return {
@@ -202,18 +205,19 @@ async def regenerate_report(project_id: int, payload: ReportRegenerateRequest |
         raise HTTPException(status_code=404, detail="项目不存在")
     await InfoSummarizer.summarize_info(db=db, project_id=project_id)
     project = db.query(Project).filter(Project.project_id == project_id).first()
-    try:
-        import asyncio
-        llm_cfg = None
-        embed_cfg = None
-        if payload is not None:
-            if payload.llm_api_url and payload.llm_api_key and payload.llm_model_name:
-                llm_cfg = {"api_url": payload.llm_api_url, "api_key": payload.llm_api_key, "model_name": payload.llm_model_name}
-            if payload.embed_api_url and payload.embed_api_key and payload.embed_model_name:
-                embed_cfg = {"api_url": payload.embed_api_url, "api_key": payload.embed_api_key, "model_name": payload.embed_model_name}
-        asyncio.create_task(DomainSelfLearner.learn_if_contributing(db=db, project_id=project_id, llm_config=llm_cfg, embed_config=embed_cfg))
-    except Exception:
-        pass
+    llm_cfg = None
+    embed_cfg = None
+    if payload is not None:
+        if payload.llm_api_url and payload.llm_api_key and payload.llm_model_name:
+            llm_cfg = {"api_url": payload.llm_api_url, "api_key": payload.llm_api_key, "model_name": payload.llm_model_name}
+        if payload.embed_api_url and payload.embed_api_key and payload.embed_model_name:
+            embed_cfg = {"api_url": payload.embed_api_url, "api_key": payload.embed_api_key, "model_name": payload.embed_model_name}
+    # Self-learning runs later on the background job queue with its own session; the API keys stay in memory
+    if llm_cfg is not None:
+        secrets = {"llm_api_key": llm_cfg.pop("api_key")}
+        if embed_cfg is not None:
+            secrets["embed_api_key"] = embed_cfg.pop("api_key")
+        await asyncio.to_thread(JOB_QUEUE.enqueue, DOMAIN_LEARNING_JOB, project_id, {"llm_config": llm_cfg, "embed_config": embed_cfg}, secrets=secrets)
     return {"success": True, "interview_report": project.interview_report}
 
 @router.get("/api/projects/{project_id}/report/download")
@@ -1,17 +1,20 @@
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel, ConfigDict
 from typing import List
 import json
-import math
 
-from database.database import get_db
-from database.models import DomainExperience, Project, Section, Topic, Slot
+from database.database import get_db, get_async_db
+from database.models import DomainExperience, Project, Topic, Slot
 from ..llm_handler import LLMHandler
+from ..llm_admission import PRIORITY_REPORT
 from ..config import CONFIG
 from ..core.priority_builder import PriorityBuilder
 from ..prompts.domain_fusion import domain_fusion_prompt
 from ..core.framework_generator import FrameworkGenerator
+from ..core.embedding_index import EMBEDDING_INDEX
 
 router = APIRouter()
 
@@ -52,56 +55,13 @@ class PriorityRequest(SafeModel):
     api_key: str
     model_name: str
 
-def _cosine(a: list[float], b: list[float]) -> float:
-    if not a or not b or len(a) != len(b):
-        return 0.0
-    s = 0.0
-    na = 0.0
-    nb = 0.0
-    for i in range(len(a)):
-        s += a[i] * b[i]
-        na += a[i] * a[i]
-        nb += b[i] * b[i]
-    den = (math.sqrt(na) * math.sqrt(nb))
-    if den == 0:
-        return 0.0
-    return s / den
-
-def await_or_sync_call_llm(llm: LLMHandler, prompt: str, items: List[dict]) -> str:
-    try:
-        content = json.dumps(items, ensure_ascii=False)
-        resp = llm.call_llm(prompt=prompt.replace("{items}", content), query="")
-        if hasattr(resp, "__await__"):
-            r = _async_await(resp)
-        else:
-            r = resp
-        return (r or "").strip()
-    except Exception:
-        return ""
-
-def _async_await(coro):
-    import asyncio
-    try:
-        loop = asyncio.get_event_loop()
-    except RuntimeError:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-    return loop.run_until_complete(coro)
-
-@router.post("/api/projects/{project_id}/retrieval/suggest")
-async def retrieval_suggest(project_id: int, payload: RetrievalSuggestRequest, db: Session = Depends(get_db)):
-    project = db.query(Project).filter(Project.project_id == project_id).first()
-    if not project:
-        raise HTTPException(status_code=404, detail="项目不存在")
-    qtext = project.initial_requirements or ""
-    llm = LLMHandler(api_url=payload.api_url, api_key=payload.api_key, model_name=payload.model_name)
-    qvec = await llm.get_embedding(qtext, embedding_api_url=payload.api_url, model_name=payload.model_name)
-    if qvec is None:
-        raise HTTPException(status_code=500, detail="项目信息嵌入失败")
-    dq = db.query(DomainExperience)
-    if payload.user_id is not None:
-        dq = dq.filter(DomainExperience.user_id == payload.user_id)
+def _rank_candidates(db: Session, qtext: str, qvec: list[float], thr: float, top_k: int, user_id: int | None) -> list[dict]:
+    # Cosine similarities come from the in-memory embedding index; only the light columns are read here
+    dq = db.query(DomainExperience.domain_id, DomainExperience.domain_name, DomainExperience.domain_description, DomainExperience.tags)
+    if user_id is not None:
+        dq = dq.filter(DomainExperience.user_id == user_id)
     items = dq.all()
+    cosines = EMBEDDING_INDEX.scores(db, qvec, user_id=user_id)
     text_lower = qtext.lower()
     rows = []
     for d in items:
@@ -114,14 +74,6 @@ async def retrieval_suggest(project_id: int, payload: RetrievalSuggestRequest, d
         matched = [t for t in tags if isinstance(t, str) and t.lower() in text_lower]
         tag_total = len(tags)
         tag_score = (len(matched) / tag_total) if tag_total > 0 else 0.0
-        cos = 0.0
-        try:
-            if d.embedding:
-                vec = json.loads(d.embedding)
-                if isinstance(vec, list):
-                    cos = _cosine(qvec, vec)
-        except Exception:
-            cos = 0.0
         rows.append({
             "domain_id": d.domain_id,
             "domain_name": d.domain_name,
@@ -129,12 +81,14 @@ async def retrieval_suggest(project_id: int, payload: RetrievalSuggestRequest, d
             "tags": tags,
             "matched_tags": matched,
             "tag_score": tag_score,
-            "cosine": cos,
+            "cosine": cosines.get(int(d.domain_id), 0.0),
         })
-    thr = CONFIG.RETRIEVAL_COSINE_THRESHOLD
     filtered = [r for r in rows if r["tag_score"] > 0 or r["cosine"] >= thr]
     if not filtered:
-        filtered = sorted(rows, key=lambda x: x["cosine"], reverse=True)[:payload.top_k]
+        by_id = {r["domain_id"]: r for r in rows}
+        ranked = [by_id[i] for i, _ in EMBEDDING_INDEX.top_k(db, qvec, top_k, user_id=user_id) if i in by_id]
+        ranked_ids = {r["domain_id"] for r in ranked}
+        filtered = (ranked + [r for r in rows if r["domain_id"] not in ranked_ids])[:top_k]
     max_tag = max((r["tag_score"] for r in filtered), default=0.0)
     max_cos = max((r["cosine"] for r in filtered), default=0.0)
     def norm(x, m):
@@ -144,81 +98,54 @@ async def retrieval_suggest(project_id: int, payload: RetrievalSuggestRequest, d
         wt = 0.5 * norm(r["tag_score"], max_tag) + 0.5 * norm(r["cosine"], max_cos)
         scored.append({**r, "weight": wt})
     scored = sorted(scored, key=lambda x: x["weight"], reverse=True)
-    if len(scored) > payload.top_k:
-        scored = scored[:payload.top_k]
+    if len(scored) > top_k:
+        scored = scored[:top_k]
     total_w = sum((x["weight"] for x in scored), 0.0)
     for x in scored:
         x["weight"] = (x["weight"] / total_w) if total_w > 0 else 0.0
+    return scored
+
+async def _fuse_with_llm(llm: LLMHandler, prompt: str, items: List[dict]) -> str:
+    content = json.dumps(items, ensure_ascii=False)
+    fused = ((await llm.call_llm(prompt=prompt.replace("{items}", content), query="")) or "").strip()
+    if not fused:
+        # Let the route fall back to concatenating the experiences by weight
+        raise ValueError("领域经验融合失败")
+    return fused
+
+@router.post("/api/projects/{project_id}/retrieval/suggest")
+async def retrieval_suggest(project_id: int, payload: RetrievalSuggestRequest, db: AsyncSession = Depends(get_async_db)):
+    project = await db.get(Project, project_id)
+    if not project:
+        raise HTTPException(status_code=404, detail="项目不存在")
+    qtext = project.initial_requirements or ""
+    llm = LLMHandler(api_url=payload.api_url, api_key=payload.api_key, model_name=payload.model_name)
+    qvec = await llm.get_embedding(qtext, embedding_api_url=payload.api_url, model_name=payload.model_name)
+    if qvec is None:
+        raise HTTPException(status_code=500, detail="项目信息嵌入失败")
+    thr = CONFIG.RETRIEVAL_COSINE_THRESHOLD
+    scored = await db.run_sync(_rank_candidates, qtext, qvec, thr, payload.top_k, payload.user_id)
     matching_domain_ids = [int(r["domain_id"]) for r in scored if r["cosine"] >= thr]
     return {"success": True, "candidates": scored, "threshold_used": thr, "top_k_used": payload.top_k, "matching_domain_ids": matching_domain_ids}
 
 @router.post("/api/retrieval/suggest-text")
-async def retrieval_suggest_text(payload: RetrievalSuggestFromTextRequest, db: Session = Depends(get_db)):
+async def retrieval_suggest_text(payload: RetrievalSuggestFromTextRequest, db: AsyncSession = Depends(get_async_db)):
     qtext = payload.text or ""
     llm = LLMHandler(api_url=payload.api_url, api_key=payload.api_key, model_name=payload.model_name)
     qvec = await llm.get_embedding(qtext, embedding_api_url=payload.api_url, model_name=payload.model_name)
     if qvec is None:
         raise HTTPException(status_code=500, detail="文本嵌入失败")
-    dq = db.query(DomainExperience)
-    if payload.user_id is not None:
-        dq = dq.filter(DomainExperience.user_id == payload.user_id)
-    items = dq.all()
-    text_lower = qtext.lower()
-    rows = []
-    for d in items:
-        tags = []
-        try:
-            if d.tags:
-                tags = json.loads(d.tags)
-        except Exception:
-            tags = []
-        matched = [t for t in tags if isinstance(t, str) and t.lower() in text_lower]
-        tag_total = len(tags)
-        tag_score = (len(matched) / tag_total) if tag_total > 0 else 0.0
-        cos = 0.0
-        try:
-            if d.embedding:
-                vec = json.loads(d.embedding)
-                if isinstance(vec, list):
-                    cos = _cosine(qvec, vec)
-        except Exception:
-            cos = 0.0
-        rows.append({
-            "domain_id": d.domain_id,
-            "domain_name": d.domain_name,
-            "domain_description": d.domain_description,
-            "tags": tags,
-            "matched_tags": matched,
-            "tag_score": tag_score,
-            "cosine": cos,
-        })
     thr = payload.threshold or CONFIG.RETRIEVAL_COSINE_THRESHOLD
-    filtered = [r for r in rows if r["tag_score"] > 0 or r["cosine"] >= thr]
-    if not filtered:
-        filtered = sorted(rows, key=lambda x: x["cosine"], reverse=True)[:payload.top_k]
-    max_tag = max((r["tag_score"] for r in filtered), default=0.0)
-    max_cos = max((r["cosine"] for r in filtered), default=0.0)
-    def norm(x, m):
-        return (x / m) if m > 0 else 0.0
-    scored = []
-    for r in filtered:
-        wt = 0.5 * norm(r["tag_score"], max_tag) + 0.5 * norm(r["cosine"], max_cos)
-        scored.append({**r, "weight": wt})
-    scored = sorted(scored, key=lambda x: x["weight"], reverse=True)
-    if len(scored) > payload.top_k:
-        scored = scored[:payload.top_k]
-    total_w = sum((x["weight"] for x in scored), 0.0)
-    for x in scored:
-        x["weight"] = (x["weight"] / total_w) if total_w > 0 else 0.0
+    scored = await db.run_sync(_rank_candidates, qtext, qvec, thr, payload.top_k, payload.user_id)
     matching_domain_ids = [int(r["domain_id"]) for r in scored if r["cosine"] >= thr]
     return {"success": True, "candidates": scored, "threshold_used": thr, "top_k_used": payload.top_k, "matching_domain_ids": matching_domain_ids}
 
 @router.post("/api/projects/{project_id}/retrieval/fuse")
-def retrieval_fuse(project_id: int, payload: FuseRequest, db: Session = Depends(get_db)):
+async def retrieval_fuse(project_id: int, payload: FuseRequest, db: AsyncSession = Depends(get_async_db)):
     ids = [int(i.get("domain_id")) for i in payload.items if i.get("domain_id") is not None]
     if not ids:
         return {"success": True, "fused_text": ""}
-    ds = db.query(DomainExperience).filter(DomainExperience.domain_id.in_(ids)).all()
+    ds = (await db.execute(select(DomainExperience).where(DomainExperience.domain_id.in_(ids)))).scalars().all()
     id_to_w = {int(i.get("domain_id")): float(i.get("weight", 0.0)) for i in payload.items}
     ds = [d for d in ds if (id_to_w.get(d.domain_id, 0.0) > 0.0)]
     if not ds:
@@ -234,7 +161,7 @@ def retrieval_fuse(project_id: int, payload: FuseRequest, db: Session = Depends(
                 "content": d.domain_experience_content or "",
             })
         try:
-            fused_text = await_or_sync_call_llm(llm, domain_fusion_prompt, items_for_llm)
+            fused_text = await _fuse_with_llm(llm, domain_fusion_prompt, items_for_llm)
         except Exception:
             ds_sorted = sorted(ds, key=lambda d: id_to_w.get(d.domain_id, 0.0), reverse=True)
             parts = [(d.domain_experience_content or "") for d in ds_sorted]
@@ -248,11 +175,11 @@ def retrieval_fuse(project_id: int, payload: FuseRequest, db: Session = Depends(
         return {"success": True, "fused_text": fused}
 
 @router.post("/api/retrieval/fuse")
-def retrieval_fuse_global(payload: FuseRequest, db: Session = Depends(get_db)):
+async def retrieval_fuse_global(payload: FuseRequest, db: AsyncSession = Depends(get_async_db)):
     ids = [int(i.get("domain_id")) for i in payload.items if i.get("domain_id") is not None]
     if not ids:
         return {"success": True, "fused_text": ""}
-    ds = db.query(DomainExperience).filter(DomainExperience.domain_id.in_(ids)).all()
+    ds = (await db.execute(select(DomainExperience).where(DomainExperience.domain_id.in_(ids)))).scalars().all()
     id_to_w = {int(i.get("domain_id")): float(i.get("weight", 0.0)) for i in payload.items}
     ds = [d for d in ds if (id_to_w.get(d.domain_id, 0.0) > 0.0)]
     if not ds:
@@ -268,7 +195,7 @@ def retrieval_fuse_global(payload: FuseRequest, db: Session = Depends(get_db)):
                 "content": d.domain_experience_content or "",
             })
         try:
-            fused_text = await_or_sync_call_llm(llm, domain_fusion_prompt, items_for_llm)
+            fused_text = await _fuse_with_llm(llm, domain_fusion_prompt, items_for_llm)
         except Exception:
             ds_sorted = sorted(ds, key=lambda d: id_to_w.get(d.domain_id, 0.0), reverse=True)
             parts = [(d.domain_experience_content or "") for d in ds_sorted]
@@ -285,7 +212,7 @@ async def initialize_with_fused(project_id: int, payload: FusedInitializeRequest
     project = db.query(Project).filter(Project.project_id == project_id).first()
     if not project:
         raise HTTPException(status_code=404, detail="项目不存在")
-    llm = LLMHandler(api_url=payload.api_url, api_key=payload.api_key, model_name=payload.model_name)
+    llm = LLMHandler(api_url=payload.api_url, api_key=payload.api_key, model_name=payload.model_name, priority=PRIORITY_REPORT)
     try:
         await FrameworkGenerator.generate_framework_with_content(db=db, llm_handler=llm, user_input=project.initial_requirements, project_id=project_id, domain_content=payload.fused_text)
         return {"success": True}
@@ -294,8 +221,8 @@ async def initialize_with_fused(project_id: int, payload: FusedInitializeRequest
         raise HTTPException(status_code=500, detail=f"初始化访谈框架失败: {str(e)}")
 
 @router.post("/api/projects/{project_id}/topics/priority")
-async def build_priority(project_id: int, payload: PriorityRequest, db: Session = Depends(get_db)):
-    project = db.query(Project).filter(Project.project_id == project_id).first()
+async def build_priority(project_id: int, payload: PriorityRequest, db: AsyncSession = Depends(get_async_db)):
+    project = await db.get(Project, project_id)
     if not project:
         raise HTTPException(status_code=404, detail="项目不存在")
     if project.priority_sequence:
@@ -304,18 +231,18 @@ async def build_priority(project_id: int, payload: PriorityRequest, db: Session
             return {"success": True, "priority": stored}
         except Exception:
             project.priority_sequence = None
-            db.commit()
+            await db.commit()
     llm = LLMHandler(api_url=payload.api_url, api_key=payload.api_key, model_name=payload.model_name)
     seq = await PriorityBuilder.build(db, llm, project_id)
     result = []
     for item in seq:
-        t = db.query(Topic).join(Section).filter(Topic.topic_number == item["topic_number"], Section.project_id == project_id).first()
+        topic_content = await db.scalar(select(Topic.topic_content).where(Topic.topic_number == item["topic_number"], Topic.project_id == project_id).limit(1))
         result.append({
             "topic_number": item["topic_number"],
-            "topic_content": (t.topic_content if t else None),
+            "topic_content": topic_content,
             "status": item.get("status"),
             "core": item.get("core"),
         })
     project.priority_sequence = json.dumps(result, ensure_ascii=False)
-    db.commit()
+    await db.commit()
     return {"success": True, "priority": result}
@@ -136,6 +136,8 @@ def delete_topic(topic_id: int, db: Session = Depends(get_db)):
 
 @router.post("/api/topics/{topic_id}/slots")
 def create_slot(topic_id: int, payload: SlotCreate, db: Session = Depends(get_db)):
+    if db.query(Slot.slot_id).filter(Slot.topic_id == topic_id, Slot.slot_number == payload.slot_number).first():
+        raise HTTPException(status_code=400, detail="该主题下槽位编号已存在")
     slot = Slot(slot_number=payload.slot_number, slot_key=payload.slot_key, slot_value=payload.slot_value, is_necessary=payload.is_necessary, topic_id=topic_id)
     db.add(slot)
     db.commit()
@@ -148,6 +150,8 @@ def update_slot(slot_id: int, payload: SlotUpdate, db: Session = Depends(get_db)
     if not slot:
         raise HTTPException(status_code=404, detail="槽位不存在")
     if payload.slot_number is not None:
+        if payload.slot_number != slot.slot_number and db.query(Slot.slot_id).filter(Slot.topic_id == slot.topic_id, Slot.slot_number == payload.slot_number).first():
+            raise HTTPException(status_code=400, detail="该主题下槽位编号已存在")
         slot.slot_number = payload.slot_number
     if payload.slot_key is not None:
         slot.slot_key = payload.slot_key
@@ -148,8 +148,12 @@ def initialize_with_template(project_id: int, payload: dict, db: Session = Depen
                 topic = Topic(topic_number=topic_number, topic_content=topic_content, topic_status='Pending', is_necessary=is_necessary, section_id=section.section_id)
                 db.add(topic)
                 db.flush()
+                seen_slot_numbers = set()
                 for sl_idx, sl in enumerate(top.get("slots") or []):
                     slot_number = str(sl.get("slot_number") or f"slot-{sec_idx+1}-{top_idx+1}-{sl_idx+1}")
+                    if slot_number in seen_slot_numbers:
+                        continue
+                    seen_slot_numbers.add(slot_number)
                     slot_key = str(sl.get("slot_key") or "")
                     is_necessary_slot = bool(sl.get("is_necessary") if sl.get("is_necessary") is not None else False)
                     slot = Slot(slot_number=slot_number, slot_key=slot_key, slot_value=None, is_necessary=is_necessary_slot, topic_id=topic.topic_id)
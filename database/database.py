@@ -1,47 +1,228 @@
 import os
-from sqlalchemy import create_engine, event
+import json
+from sqlalchemy import create_engine, event, inspect, text, true
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.engine import Engine
+from sqlalchemy.dialects import mysql, postgresql, sqlite
 import sqlite3
 from .models import Base
+from .embedding_codec import pack_embedding
+from backend.config import CONFIG
 
-# Database configuration
+# Database configuration: DATABASE_URL selects the backend (e.g. postgresql+psycopg2://...); default is a local SQLite file
 current_dir = os.path.dirname(os.path.abspath(__file__))
 database_path = os.path.join(current_dir, 'database.db')
-DATABASE_URL = f'sqlite:///{database_path}'
+DATABASE_URL = CONFIG.DATABASE_URL or f'sqlite:///{database_path}'
 
-engine = create_engine(DATABASE_URL)
+def _async_url(url: str) -> str:
+    """Async driver counterpart of a sync URL: sqlite -> aiosqlite, postgresql -> asyncpg (psycopg 3 serves both),
+    mysql/mariadb -> aiomysql (asyncmy is kept as is)."""
+    u = make_url(url)
+    backend, _, driver = u.drivername.partition("+")
+    if backend == "sqlite":
+        return u.set(drivername="sqlite+aiosqlite").render_as_string(hide_password=False)
+    if backend == "postgresql" and driver != "psycopg":
+        return u.set(drivername="postgresql+asyncpg").render_as_string(hide_password=False)
+    if backend in ("mysql", "mariadb") and driver not in ("aiomysql", "asyncmy"):
+        return u.set(drivername=f"{backend}+aiomysql").render_as_string(hide_password=False)
+    return url
+
+# Extra requirements files with the drivers of each server database
+_DRIVER_REQUIREMENTS = {"postgresql": "requirements-postgres.txt", "mysql": "requirements-mysql.txt", "mariadb": "requirements-mysql.txt"}
+
+def _create(factory, url: str, **options):
+    """create_engine / create_async_engine, with an install hint when the database driver is missing."""
+    try:
+        return factory(url, **options)
+    except ModuleNotFoundError as e:
+        backend = make_url(url).get_backend_name()
+        hint = f"pip install -r {_DRIVER_REQUIREMENTS[backend]}" if backend in _DRIVER_REQUIREMENTS else "install it"
+        raise RuntimeError(f"The database driver for {make_url(url).drivername} is not installed ({e.name}); {hint}") from e
+
+def _engine_options(url: str) -> dict:
+    # SQLite keeps SQLAlchemy's default per-file pooling; server databases get a sized, self-healing pool
+    if make_url(url).get_backend_name() == "sqlite":
+        return {}
+    return {
+        "pool_size": max(1, CONFIG.DB_POOL_SIZE),
+        "max_overflow": max(0, CONFIG.DB_MAX_OVERFLOW),
+        "pool_pre_ping": CONFIG.DB_POOL_PRE_PING,
+        "pool_recycle": CONFIG.DB_POOL_RECYCLE_SECONDS,
+        "pool_timeout": CONFIG.DB_POOL_TIMEOUT_SECONDS,
+    }
+
+engine = _create(create_engine, DATABASE_URL, **_engine_options(DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+def with_session(fn, *args, **kwargs):
+    """Call fn(db, *args, **kwargs) with a fresh SessionLocal, rolled back on error and always closed.
+
+    Background work runs it as `await asyncio.to_thread(with_session, fn, ...)` so that sync commits never block
+    the event loop (a blocked loop cannot finish an async-session transaction holding the SQLite write lock).
+    """
+    db = SessionLocal()
+    try:
+        return fn(db, *args, **kwargs)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+# Async engine over the same database for async routes, so queries do not block the event loop.
+# Objects stay loaded after commit: an expired attribute would need a lazy load, which async sessions cannot do implicitly.
+ASYNC_DATABASE_URL = CONFIG.ASYNC_DATABASE_URL or _async_url(DATABASE_URL)
+async_engine = _create(create_async_engine, ASYNC_DATABASE_URL, **_engine_options(ASYNC_DATABASE_URL))
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+def upsert_statement(dialect_name: str, model, rows: list[dict], index_elements: list, update_columns: list[str]):
+    """INSERT of `rows` that updates `update_columns` of the rows already holding the unique key `index_elements`.
+
+    SQLite and PostgreSQL use ON CONFLICT DO UPDATE; MySQL/MariaDB use ON DUPLICATE KEY UPDATE, which matches any
+    unique key, so `index_elements` must be the only one the rows can collide on there. Other dialects are refused.
+    """
+    if dialect_name in ("mysql", "mariadb"):
+        stmt = mysql.insert(model).values(rows)
+        return stmt.on_duplicate_key_update({c: stmt.inserted[c] for c in update_columns})
+    if dialect_name == "postgresql":
+        insert = postgresql.insert
+    elif dialect_name == "sqlite":
+        insert = sqlite.insert
+    else:
+        raise NotImplementedError(f"Upserts are not supported on the {dialect_name} dialect")
+    stmt = insert(model).values(rows)
+    return stmt.on_conflict_do_update(index_elements=index_elements, set_={c: stmt.excluded[c] for c in update_columns})
+
 def init_db():
     """Initialize the database by creating all tables."""
     Base.metadata.create_all(bind=engine)
     # Lightweight schema migration: ensure newly added columns exist
     try:
-        with engine.connect() as conn:
-            rows = conn.exec_driver_sql("PRAGMA table_info(slots)").fetchall()
-            names = [r[1] for r in rows] if rows else []
+        with engine.begin() as conn:
+            names = _column_names(conn, "slots")
             if "evidence_message_ids" not in names:
-                conn.exec_driver_sql("ALTER TABLE slots ADD COLUMN evidence_message_ids TEXT")
+                _add_column(conn, "slots", "evidence_message_ids")
 
-            rows = conn.exec_driver_sql("PRAGMA table_info(projects)").fetchall()
-            names = [r[1] for r in rows] if rows else []
+            names = _column_names(conn, "projects")
             if "domain_ids" not in names:
-                conn.exec_driver_sql("ALTER TABLE projects ADD COLUMN domain_ids TEXT")
-            rows = conn.exec_driver_sql("PRAGMA table_info(projects)").fetchall()
-            names = [r[1] for r in rows] if rows else []
+                _add_column(conn, "projects", "domain_ids")
             if "priority_sequence" not in names:
-                conn.exec_driver_sql("ALTER TABLE projects ADD COLUMN priority_sequence TEXT")
+                _add_column(conn, "projects", "priority_sequence")
+            if "prefill_fingerprint" not in names:
+                _add_column(conn, "projects", "prefill_fingerprint")
 
-            rows = conn.exec_driver_sql("PRAGMA table_info(topics)").fetchall()
-            names = [r[1] for r in rows] if rows else []
+            names = _column_names(conn, "topics")
             if "is_necessary" not in names:
-                conn.exec_driver_sql("ALTER TABLE topics ADD COLUMN is_necessary BOOLEAN DEFAULT 1")
-                # Ensure existing rows have True (1)
-                conn.exec_driver_sql("UPDATE topics SET is_necessary=1 WHERE is_necessary IS NULL")
+                _add_column(conn, "topics", "is_necessary", f"DEFAULT {true().compile(dialect=conn.dialect)}")
+                # Ensure existing rows have True
+                conn.execute(text("UPDATE topics SET is_necessary = :v WHERE is_necessary IS NULL"), {"v": True})
+            if "conversation_summary" not in names:
+                _add_column(conn, "topics", "conversation_summary")
+            if "summary_through_round" not in names:
+                _add_column(conn, "topics", "summary_through_round")
+            if "project_id" not in names:
+                _add_column(conn, "topics", "project_id", "REFERENCES projects(project_id) ON DELETE CASCADE")
+
+            names = _column_names(conn, "domain_experiences")
+            if "embedding_blob" not in names:
+                _add_column(conn, "domain_experiences", "embedding_blob")
+            if "embedding_dim" not in names:
+                _add_column(conn, "domain_experiences", "embedding_dim")
+            if "embedding_dtype" not in names:
+                _add_column(conn, "domain_experiences", "embedding_dtype")
+            if "embedding_model" not in names:
+                _add_column(conn, "domain_experiences", "embedding_model")
     except Exception:
         # Silently ignore to avoid startup failure; errors will surface in query if unresolved
         pass
+    _migrate_json_embeddings()
+    _ensure_unique_slot_numbers()
+    _ensure_hot_path_indexes()
+
+def _column_names(conn, table: str) -> set[str]:
+    return {c["name"] for c in inspect(conn).get_columns(table)}
+
+def _add_column(conn, table: str, column: str, extra: str = ""):
+    """ALTER TABLE ... ADD COLUMN with the model's column type rendered for the connected dialect."""
+    col_type = Base.metadata.tables[table].c[column].type.compile(dialect=conn.dialect)
+    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {col_type} {extra}".rstrip()))
+
+def _migrate_json_embeddings():
+    """Convert legacy JSON-text embeddings into the packed embedding_blob column."""
+    try:
+        with engine.begin() as conn:
+            rows = conn.exec_driver_sql(
+                "SELECT domain_id, embedding FROM domain_experiences WHERE embedding IS NOT NULL AND embedding_blob IS NULL"
+            ).fetchall()
+            dtype = CONFIG.EMBEDDING_STORAGE_DTYPE
+            converted = 0
+            for domain_id, raw in rows:
+                try:
+                    vec = json.loads(raw)
+                    if not isinstance(vec, list) or not vec:
+                        continue
+                    blob = pack_embedding(vec, dtype)
+                except Exception:
+                    continue
+                conn.execute(
+                    text("UPDATE domain_experiences SET embedding_blob = :blob, embedding_dim = :dim, embedding_dtype = :dtype, embedding = NULL WHERE domain_id = :domain_id"),
+                    {"blob": blob, "dim": len(vec), "dtype": dtype, "domain_id": domain_id},
+                )
+                converted += 1
+            if converted:
+                print(f"Migrated {converted} domain experience embeddings from JSON text to packed {dtype}")
+    except Exception as e:
+        print(f"Embedding storage migration skipped: {e}")
+
+def _ensure_unique_slot_numbers():
+    """Merge duplicate (topic_id, slot_number) slots, then create the unique index the slot upsert relies on."""
+    try:
+        with engine.begin() as conn:
+            groups = conn.exec_driver_sql(
+                "SELECT topic_id, slot_number FROM slots GROUP BY topic_id, slot_number HAVING COUNT(*) > 1"
+            ).fetchall()
+            removed = 0
+            for topic_id, slot_number in groups:
+                rows = conn.execute(
+                    text("SELECT slot_id, slot_value FROM slots WHERE topic_id = :topic_id AND slot_number = :slot_number ORDER BY slot_id"),
+                    {"topic_id": topic_id, "slot_number": slot_number},
+                ).fetchall()
+                # Keep the most recent row that carries a value, otherwise the oldest one
+                filled = [r[0] for r in rows if r[1] not in (None, "")]
+                keep = filled[-1] if filled else rows[0][0]
+                for r in rows:
+                    if r[0] != keep:
+                        conn.execute(text("DELETE FROM slots WHERE slot_id = :slot_id"), {"slot_id": r[0]})
+                        removed += 1
+            if removed:
+                print(f"Removed {removed} duplicate slots before creating the (topic_id, slot_number) unique index")
+            conn.exec_driver_sql(
+                "CREATE UNIQUE INDEX IF NOT EXISTS ux_slots_topic_slot_number ON slots (topic_id, slot_number)"
+            )
+    except Exception as e:
+        print(f"Slot unique index migration skipped: {e}")
+
+def _ensure_hot_path_indexes():
+    """Backfill topics.project_id and create the model indexes missing from tables created by older versions."""
+    try:
+        with engine.begin() as conn:
+            result = conn.exec_driver_sql(
+                "UPDATE topics SET project_id = (SELECT sections.project_id FROM sections WHERE sections.section_id = topics.section_id) "
+                "WHERE project_id IS NULL"
+            )
+            if result.rowcount:
+                print(f"Backfilled project_id on {result.rowcount} topics")
+    except Exception as e:
+        print(f"Topic project_id backfill skipped: {e}")
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                with engine.begin() as conn:
+                    index.create(bind=conn, checkfirst=True)
+            except Exception as e:
+                print(f"Index {index.name} creation skipped: {e}")
 
 def get_db():
     """Dependency to get database session."""
@@ -51,9 +232,65 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    """Dependency to get an async database session, for async routes that await between queries."""
+    async with AsyncSessionLocal() as db:
+        yield db
+
 @event.listens_for(Engine, "connect")
 def set_sqlite_pragma(dbapi_connection, connection_record):
     if isinstance(dbapi_connection, sqlite3.Connection):
-        cursor = dbapi_connection.cursor()
-        cursor.execute("PRAGMA foreign_keys=ON")
-        cursor.close()
+        _apply_sqlite_pragmas(dbapi_connection)
+
+@event.listens_for(async_engine.sync_engine, "connect")
+def set_async_sqlite_pragma(dbapi_connection, connection_record):
+    # aiosqlite connections arrive wrapped in SQLAlchemy's adapter, which the sqlite3 check above skips
+    if async_engine.dialect.name == "sqlite":
+        _apply_sqlite_pragmas(dbapi_connection)
+
+def _apply_sqlite_pragmas(dbapi_connection):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA foreign_keys=ON")
+    # busy_timeout first so switching the journal mode waits for other connections instead of failing
+    cursor.execute(f"PRAGMA busy_timeout={max(0, int(CONFIG.SQLITE_BUSY_TIMEOUT_MS))}")
+    cursor.execute(f"PRAGMA journal_mode={CONFIG.SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={CONFIG.SQLITE_SYNCHRONOUS}")
+    # Negative cache_size is in KiB rather than pages
+    cursor.execute(f"PRAGMA cache_size={-max(0, int(CONFIG.SQLITE_CACHE_SIZE_KB))}")
+    cursor.execute(f"PRAGMA mmap_size={max(0, int(CONFIG.SQLITE_MMAP_SIZE))}")
+    cursor.close()
+
+def sqlite_settings() -> dict:
+    """Effective pragma values of a pooled connection, as applied by set_sqlite_pragma."""
+    synchronous_names = {0: "off", 1: "normal", 2: "full", 3: "extra"}
+    with engine.connect() as conn:
+        journal_mode = conn.exec_driver_sql("PRAGMA journal_mode").scalar()
+        synchronous = conn.exec_driver_sql("PRAGMA synchronous").scalar()
+        return {
+            "journal_mode": str(journal_mode).lower(),
+            "synchronous": synchronous_names.get(synchronous, synchronous),
+            "busy_timeout_ms": conn.exec_driver_sql("PRAGMA busy_timeout").scalar(),
+            "cache_size_kb": -conn.exec_driver_sql("PRAGMA cache_size").scalar(),
+            "mmap_size": conn.exec_driver_sql("PRAGMA mmap_size").scalar(),
+            "foreign_keys": bool(conn.exec_driver_sql("PRAGMA foreign_keys").scalar()),
+        }
+
+def report_database_settings() -> dict:
+    """Print the database backend at startup; for SQLite, the effective pragmas plus a warning when a requested one did not take effect."""
+    if engine.dialect.name != "sqlite":
+        pool = _engine_options(DATABASE_URL)
+        print(f"Database: {engine.url.render_as_string(hide_password=True)} (async: {async_engine.url.drivername}), pool: {pool}")
+        return pool
+    try:
+        settings = sqlite_settings()
+    except Exception as e:
+        print(f"SQLite settings check skipped: {e}")
+        return {}
+    print(f"SQLite settings: {settings}")
+    if settings["journal_mode"] != CONFIG.SQLITE_JOURNAL_MODE:
+        print(f"SQLite journal_mode is {settings['journal_mode']}, requested {CONFIG.SQLITE_JOURNAL_MODE} (unsupported by the filesystem?)")
+    if settings["synchronous"] != CONFIG.SQLITE_SYNCHRONOUS:
+        print(f"SQLite synchronous is {settings['synchronous']}, requested {CONFIG.SQLITE_SYNCHRONOUS}")
+    if settings["mmap_size"] != max(0, int(CONFIG.SQLITE_MMAP_SIZE)):
+        print(f"SQLite mmap_size is {settings['mmap_size']}, requested {CONFIG.SQLITE_MMAP_SIZE} (capped by the build?)")
+    return settings
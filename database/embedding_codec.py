@@ -0,0 +1,67 @@
+import json
+import numpy as np
+
+# Supported storage formats for DomainExperience.embedding_blob (little-endian packed floats)
+EMBEDDING_DTYPES = {"float32": np.dtype("<f4"), "float16": np.dtype("<f2")}
+DEFAULT_EMBEDDING_DTYPE = "float32"
+
+
+def _dtype(name: str | None) -> np.dtype:
+    return EMBEDDING_DTYPES.get((name or DEFAULT_EMBEDDING_DTYPE).lower(), EMBEDDING_DTYPES[DEFAULT_EMBEDDING_DTYPE])
+
+
+def pack_embedding(vec, dtype: str | None = None) -> bytes:
+    return np.asarray(vec, dtype=_dtype(dtype)).reshape(-1).tobytes()
+
+
+def unpack_embedding(blob: bytes | None, dtype: str | None = None, dim: int | None = None) -> np.ndarray | None:
+    """Zero-copy view over a packed embedding (read-only); None if the blob is missing or malformed."""
+    if not blob:
+        return None
+    dt = _dtype(dtype)
+    if len(blob) % dt.itemsize != 0:
+        return None
+    arr = np.frombuffer(blob, dtype=dt)
+    if dim is not None and arr.shape[0] != int(dim):
+        return None
+    return arr
+
+
+def set_embedding(row, vec, model_name: str | None = None, dtype: str | None = None) -> None:
+    """Store a vector on a DomainExperience row in packed form (clears the legacy JSON column)."""
+    if vec is None:
+        row.embedding_blob = None
+        row.embedding_dim = None
+        row.embedding_dtype = None
+        row.embedding_model = None
+        row.embedding = None
+        return
+    name = (dtype or DEFAULT_EMBEDDING_DTYPE).lower()
+    if name not in EMBEDDING_DTYPES:
+        name = DEFAULT_EMBEDDING_DTYPE
+    blob = pack_embedding(vec, name)
+    row.embedding_blob = blob
+    row.embedding_dim = len(blob) // EMBEDDING_DTYPES[name].itemsize
+    row.embedding_dtype = name
+    row.embedding_model = model_name
+    row.embedding = None
+
+
+def get_embedding(row) -> np.ndarray | None:
+    """Read a DomainExperience row's vector, falling back to the legacy JSON text for unmigrated rows."""
+    arr = unpack_embedding(getattr(row, "embedding_blob", None), getattr(row, "embedding_dtype", None), getattr(row, "embedding_dim", None))
+    if arr is not None:
+        return arr
+    raw = getattr(row, "embedding", None)
+    if not raw:
+        return None
+    try:
+        vec = json.loads(raw)
+    except Exception:
+        return None
+    if not isinstance(vec, list) or not vec:
+        return None
+    try:
+        return np.asarray(vec, dtype=np.float32)
+    except Exception:
+        return None
@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Enum, Boolean
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Enum, Boolean, LargeBinary, Index, event, inspect, select
 from sqlalchemy.orm import declarative_base, relationship
 from datetime import datetime, timezone
+from .types import JSONText
 
 Base = declarative_base()
 
@@ -27,8 +28,9 @@ class Project(Base):
     interview_report = Column(Text, nullable=True)
     created_time = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
     user_id = Column(Integer, ForeignKey('users.user_id', ondelete='CASCADE'), nullable=False)
-    domain_ids = Column(Text, nullable=True)  # JSON array of domain_id integers
-    priority_sequence = Column(Text, nullable=True)  # JSON array of priority items
+    domain_ids = Column(JSONText, nullable=True)  # JSON array of domain_id integers
+    priority_sequence = Column(JSONText, nullable=True)  # JSON array of priority items
+    prefill_fingerprint = Column(String(64), nullable=True)  # sha256 of initial_requirements + slot schema at last prefill
 
     user = relationship("User", back_populates="projects")
     sections = relationship("Section", back_populates="project", cascade="all, delete-orphan", passive_deletes=True)
@@ -44,6 +46,8 @@ class Section(Base):
     project = relationship("Project", back_populates="sections")
     topics = relationship("Topic", back_populates="section", cascade="all, delete-orphan", passive_deletes=True)
 
+    __table_args__ = (Index('ix_sections_project_id', 'project_id'),)
+
 class Topic(Base):
     __tablename__ = 'topics'
     
@@ -52,12 +56,37 @@ class Topic(Base):
     topic_content = Column(Text, nullable=False)
     topic_status = Column(Enum('Pending', 'Ongoing', 'Completed', 'SystemInterrupted', 'UserInterrupted', 'Failed', name='topic_status_enum'), nullable=False)
     is_necessary = Column(Boolean, nullable=False, default=True)
+    conversation_summary = Column(Text, nullable=True)  # Rolling summary of the rounds older than the verbatim window
+    summary_through_round = Column(Integer, nullable=True)  # Last round folded into conversation_summary
     section_id = Column(Integer, ForeignKey('sections.section_id', ondelete='CASCADE'), nullable=False)
+    project_id = Column(Integer, ForeignKey('projects.project_id', ondelete='CASCADE'), nullable=True)  # Denormalized from sections.project_id; set on insert
 
     section = relationship("Section", back_populates="topics")
     slots = relationship("Slot", back_populates="topic", cascade="all, delete-orphan", passive_deletes=True)
     messages = relationship("Message", back_populates="topic", cascade="all, delete-orphan", passive_deletes=True)
 
+    __table_args__ = (
+        Index('ix_topics_section_number', 'section_id', 'topic_number'),
+        Index('ix_topics_project_number', 'project_id', 'topic_number'),
+        Index('ix_topics_project_status', 'project_id', 'topic_status'),
+        Index('ix_topics_status', 'topic_status'),
+    )
+
+def _section_project_id(connection, section_id):
+    return connection.execute(select(Section.project_id).where(Section.section_id == section_id)).scalar()
+
+
+@event.listens_for(Topic, "before_insert")
+def _topic_project_id_on_insert(mapper, connection, target):
+    # topics.project_id mirrors sections.project_id so project-wide topic queries skip the join
+    if target.project_id is None and target.section_id is not None:
+        target.project_id = _section_project_id(connection, target.section_id)
+
+@event.listens_for(Topic, "before_update")
+def _topic_project_id_on_update(mapper, connection, target):
+    if inspect(target).attrs.section_id.history.has_changes():
+        target.project_id = _section_project_id(connection, target.section_id)
+
 class Slot(Base):
     __tablename__ = 'slots'
     
@@ -67,10 +96,13 @@ class Slot(Base):
     slot_value = Column(Text, nullable=True)
     is_necessary = Column(Boolean, nullable=False)
     topic_id = Column(Integer, ForeignKey('topics.topic_id', ondelete='CASCADE'), nullable=False)
-    evidence_message_ids = Column(Text, nullable=True)
+    evidence_message_ids = Column(JSONText, nullable=True)
 
     topic = relationship("Topic", back_populates="slots")
 
+    # slot_number is unique within a topic; SlotFiller upserts on this key
+    __table_args__ = (Index('ux_slots_topic_slot_number', 'topic_id', 'slot_number', unique=True),)
+
 class Message(Base):
     __tablename__ = 'messages'
     
@@ -84,6 +116,8 @@ class Message(Base):
 
     topic = relationship("Topic", back_populates="messages")
 
+    __table_args__ = (Index('ix_messages_topic_message', 'topic_id', 'message_id'),)
+
 class DomainExperience(Base):
     __tablename__ = 'domain_experiences'
     
@@ -94,11 +128,17 @@ class DomainExperience(Base):
     domain_experience_content = Column(Text, nullable=False)
     user_id = Column(Integer, ForeignKey('users.user_id', ondelete='CASCADE'), nullable=False)
     updated_time = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
-    tags = Column(Text, nullable=True)
-    embedding = Column(Text, nullable=True)
+    tags = Column(JSONText, nullable=True)
+    embedding = Column(Text, nullable=True)  # Legacy JSON array; migrated into embedding_blob by init_db
+    embedding_blob = Column(LargeBinary, nullable=True)  # Packed little-endian float32/float16 vector
+    embedding_dim = Column(Integer, nullable=True)
+    embedding_dtype = Column(String(16), nullable=True)  # 'float32' or 'float16'
+    embedding_model = Column(String(255), nullable=True)
     
     user = relationship("User")
 
+    __table_args__ = (Index('ix_domain_experiences_user_id', 'user_id'),)
+
 class FrameworkTemplate(Base):
     __tablename__ = 'framework_templates'
 
@@ -110,3 +150,43 @@ class FrameworkTemplate(Base):
     updated_time = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
 
     user = relationship("User")
+
+class EmbeddingCacheEntry(Base):
+    __tablename__ = 'embedding_cache'
+
+    model_name = Column(String(255), primary_key=True)
+    text_hash = Column(String(64), primary_key=True)  # sha256 hex digest of the embedded text
+    embedding_blob = Column(LargeBinary, nullable=False)  # Packed little-endian float32 vector
+    embedding_dim = Column(Integer, nullable=False)
+    created_time = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    last_used_time = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False, index=True)
+
+class LLMResponseCacheEntry(Base):
+    __tablename__ = 'llm_response_cache'
+
+    model_name = Column(String(255), primary_key=True)
+    prompt_hash = Column(String(64), primary_key=True)  # sha256 hex digest of the system prompt
+    query_hash = Column(String(64), primary_key=True)  # sha256 hex digest of the user query
+    response = Column(Text, nullable=False)
+    created_time = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False, index=True)
+    last_used_time = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False, index=True)
+
+class BackgroundJob(Base):
+    __tablename__ = 'background_jobs'
+
+    job_id = Column(Integer, primary_key=True)
+    job_type = Column(String(50), nullable=False)
+    project_id = Column(Integer, ForeignKey('projects.project_id', ondelete='CASCADE'), nullable=True)
+    payload = Column(Text, nullable=True)  # JSON arguments of the handler; cleared once the job is finished
+    job_status = Column(Enum('Pending', 'Running', 'Completed', 'Failed', name='job_status_enum'), nullable=False, default='Pending')
+    attempts = Column(Integer, nullable=False, default=0)
+    next_run_time = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    locked_until = Column(DateTime, nullable=True)  # Lease of the worker running the job; expired leases are picked up again
+    last_error = Column(Text, nullable=True)
+    created_time = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    updated_time = Column(DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+
+    __table_args__ = (
+        Index('ix_background_jobs_status_next_run', 'job_status', 'next_run_time'),
+        Index('ix_background_jobs_type_project', 'job_type', 'project_id'),
+    )
@@ -0,0 +1,41 @@
+import json
+from sqlalchemy.types import TypeDecorator, Text, JSON
+from sqlalchemy.dialects.postgresql import JSONB
+
+
+class JSONText(TypeDecorator):
+    """JSON document exposed to the application as its serialized text.
+
+    The code reads and writes these columns as JSON strings (json.loads / json.dumps). On PostgreSQL the value
+    is stored as JSONB, on MySQL as JSON, elsewhere as plain TEXT; the conversion happens here, so callers keep
+    working with strings on every backend.
+    """
+
+    impl = Text
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "postgresql":
+            return dialect.type_descriptor(JSONB())
+        if dialect.name in ("mysql", "mariadb"):
+            return dialect.type_descriptor(JSON())
+        return dialect.type_descriptor(Text())
+
+    def _native(self, dialect) -> bool:
+        return dialect.name in ("postgresql", "mysql", "mariadb")
+
+    def process_bind_param(self, value, dialect):
+        if value is None or not self._native(dialect):
+            return value
+        if isinstance(value, str):
+            try:
+                return json.loads(value)
+            except (TypeError, ValueError):
+                # Not JSON text: keep it as a JSON string rather than failing the write
+                return value
+        return value
+
+    def process_result_value(self, value, dialect):
+        if value is None or not self._native(dialect):
+            return value
+        return json.dumps(value, ensure_ascii=False)
@@ -0,0 +1,97 @@
+import pytest
+
+from backend import circuit_breaker
+from backend.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreakerRegistry
+from backend.config import CONFIG
+
+URL = "http://llm/v1/chat/completions"
+
+
+@pytest.fixture(autouse=True)
+def settings(monkeypatch, clock):
+    monkeypatch.setattr(circuit_breaker, "time", clock)
+    monkeypatch.setattr(CONFIG, "LLM_BREAKER_ENABLED", True)
+    monkeypatch.setattr(CONFIG, "LLM_BREAKER_FAILURE_THRESHOLD", 3)
+    monkeypatch.setattr(CONFIG, "LLM_BREAKER_OPEN_SECONDS", 30.0)
+    monkeypatch.setattr(CONFIG, "LLM_BREAKER_SLOW_CALL_SECONDS", 0.0)
+
+
+def _state(registry: CircuitBreakerRegistry, model: str = "m") -> str:
+    return registry._get(URL, model).state
+
+
+def test_opens_after_consecutive_failures_only():
+    registry = CircuitBreakerRegistry()
+    registry.record_failure(URL, "m")
+    registry.record_failure(URL, "m")
+    registry.record_success(URL, "m", 0.1)
+    registry.record_failure(URL, "m")
+    registry.record_failure(URL, "m")
+    assert _state(registry) == CLOSED
+    registry.record_failure(URL, "m")
+    assert _state(registry) == OPEN
+    assert not registry.allow(URL, "m")
+    # Other models on the same URL keep their own breaker
+    assert registry.allow(URL, "other")
+
+
+def test_open_half_open_closed(clock):
+    registry = CircuitBreakerRegistry()
+    for _ in range(3):
+        registry.record_failure(URL, "m")
+    clock.advance(29.9)
+    assert not registry.allow(URL, "m")
+    clock.advance(0.1)
+    # One probe is let through once the open period is over
+    assert registry.allow(URL, "m")
+    assert _state(registry) == HALF_OPEN
+    assert not registry.allow(URL, "m")
+    registry.record_success(URL, "m", 0.2)
+    assert _state(registry) == CLOSED
+    assert registry.allow(URL, "m")
+    stats = registry.stats()["endpoints"][f"m @ {URL}"]
+    assert stats["opened"] == 1 and stats["probes"] == 1 and stats["short_circuited"] == 2
+
+
+def test_failed_probe_opens_the_breaker_again(clock):
+    registry = CircuitBreakerRegistry()
+    for _ in range(3):
+        registry.record_failure(URL, "m")
+    clock.advance(30)
+    assert registry.allow(URL, "m")
+    registry.record_failure(URL, "m")
+    assert _state(registry) == OPEN
+    clock.advance(10)
+    assert not registry.allow(URL, "m")
+    clock.advance(20)
+    assert registry.allow(URL, "m")
+
+
+def test_lost_probe_is_replaced_after_another_open_period(clock):
+    registry = CircuitBreakerRegistry()
+    for _ in range(3):
+        registry.record_failure(URL, "m")
+    clock.advance(30)
+    assert registry.allow(URL, "m")
+    # The probe never reports back
+    clock.advance(29)
+    assert not registry.allow(URL, "m")
+    clock.advance(1)
+    assert registry.allow(URL, "m")
+
+
+def test_slow_calls_count_as_failures(monkeypatch):
+    monkeypatch.setattr(CONFIG, "LLM_BREAKER_SLOW_CALL_SECONDS", 5.0)
+    registry = CircuitBreakerRegistry()
+    for _ in range(3):
+        registry.record_success(URL, "m", 6.0)
+    assert _state(registry) == OPEN
+    assert registry.stats()["endpoints"][f"m @ {URL}"]["slow_calls"] == 3
+
+
+def test_disabled_breaker_always_allows(monkeypatch):
+    monkeypatch.setattr(CONFIG, "LLM_BREAKER_ENABLED", False)
+    registry = CircuitBreakerRegistry()
+    for _ in range(10):
+        registry.record_failure(URL, "m")
+    assert registry.allow(URL, "m")
@@ -0,0 +1,154 @@
+import asyncio
+
+import pytest
+
+from backend import llm_admission
+from backend.config import CONFIG
+from backend.llm_admission import (
+    LLMAdmissionController,
+    PRIORITY_BACKGROUND,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_REPORT,
+    _TokenBucket,
+)
+
+
+@pytest.fixture(autouse=True)
+def fake_time(monkeypatch, clock):
+    monkeypatch.setattr(llm_admission, "time", clock)
+
+
+def test_bucket_refills_at_the_configured_rate(clock):
+    bucket = _TokenBucket(60)
+    bucket.take(60)
+    assert bucket.wait_time(1) == pytest.approx(1.0)
+    clock.advance(0.5)
+    assert bucket.wait_time(1) == pytest.approx(0.5)
+    clock.advance(29.5)
+    assert bucket.available() == pytest.approx(30.0)
+    clock.advance(120)
+    # Never refills past the one-minute burst
+    assert bucket.available() == pytest.approx(60.0)
+
+
+def test_bucket_request_larger_than_burst_waits_for_a_full_bucket(clock):
+    bucket = _TokenBucket(120)
+    bucket.take(120)
+    assert bucket.wait_time(1000) == pytest.approx(60.0)
+    clock.advance(60)
+    assert bucket.wait_time(1000) == 0.0
+
+
+def test_disabled_bucket_never_waits():
+    bucket = _TokenBucket(0)
+    bucket.take(10)
+    assert bucket.wait_time(10) == 0.0
+    assert bucket.available() is None
+
+
+def _limit(monkeypatch, concurrency: int) -> None:
+    monkeypatch.setattr(CONFIG, "LLM_ADMISSION_ENABLED", True)
+    monkeypatch.setattr(CONFIG, "LLM_MAX_CONCURRENCY", concurrency)
+    monkeypatch.setattr(CONFIG, "LLM_RPM_LIMIT", 0)
+    monkeypatch.setattr(CONFIG, "LLM_TPM_LIMIT", 0)
+
+
+def test_waiters_are_admitted_by_priority_then_fifo(monkeypatch):
+    _limit(monkeypatch, 1)
+    controller = LLMAdmissionController()
+    order = []
+
+    async def request(name: str, priority: str) -> None:
+        async with controller.admit("http://llm", "k", priority=priority):
+            order.append(name)
+
+    async def main() -> None:
+        release = asyncio.Event()
+
+        async def holder() -> None:
+            async with controller.admit("http://llm", "k"):
+                await release.wait()
+
+        first = asyncio.create_task(holder())
+        await asyncio.sleep(0)
+        tasks = [
+            asyncio.create_task(request("background", PRIORITY_BACKGROUND)),
+            asyncio.create_task(request("report", PRIORITY_REPORT)),
+            asyncio.create_task(request("interactive-1", PRIORITY_INTERACTIVE)),
+            asyncio.create_task(request("interactive-2", PRIORITY_INTERACTIVE)),
+        ]
+        await asyncio.sleep(0)
+        assert order == []
+        release.set()
+        await asyncio.gather(first, *tasks)
+
+    asyncio.run(main())
+    assert order == ["interactive-1", "interactive-2", "report", "background"]
+
+
+def test_cancelled_waiter_does_not_block_the_queue(monkeypatch):
+    _limit(monkeypatch, 1)
+    controller = LLMAdmissionController()
+    admitted = []
+
+    async def main() -> None:
+        release = asyncio.Event()
+
+        async def holder() -> None:
+            async with controller.admit("http://llm", "k"):
+                await release.wait()
+
+        async def request(name: str) -> None:
+            async with controller.admit("http://llm", "k"):
+                admitted.append(name)
+
+        first = asyncio.create_task(holder())
+        await asyncio.sleep(0)
+        gone = asyncio.create_task(request("cancelled"))
+        kept = asyncio.create_task(request("kept"))
+        await asyncio.sleep(0)
+        gone.cancel()
+        await asyncio.gather(gone, return_exceptions=True)
+        release.set()
+        await asyncio.gather(first, kept)
+
+    asyncio.run(main())
+    assert admitted == ["kept"]
+    stats = controller.stats()["keys"]
+    priorities = next(iter(stats.values()))["priorities"][PRIORITY_INTERACTIVE]
+    assert priorities["cancelled"] == 1
+    assert priorities["queued"] == 0
+    assert next(iter(stats.values()))["in_flight"] == 0
+
+
+def test_rate_limited_waiter_is_scheduled_after_the_refill_delay(monkeypatch, clock):
+    _limit(monkeypatch, 4)
+    monkeypatch.setattr(CONFIG, "LLM_RPM_LIMIT", 60)
+    controller = LLMAdmissionController()
+    limiter = controller._limiter("http://llm", "k")
+    limiter.rpm.take(60)
+    delays = []
+
+    async def main() -> None:
+        loop = asyncio.get_running_loop()
+        call_later = loop.call_later
+
+        def record(delay, callback, *args):
+            delays.append(delay)
+            return call_later(delay, callback, *args)
+
+        monkeypatch.setattr(loop, "call_later", record)
+
+        async def request() -> None:
+            async with controller.admit("http://llm", "k"):
+                pass
+
+        task = asyncio.create_task(request())
+        await asyncio.sleep(0)
+        assert not task.done()
+        # The timer fires after the computed delay; by then the fake clock has refilled one request
+        clock.advance(1.0)
+        await asyncio.wait_for(task, timeout=5)
+
+    asyncio.run(main())
+    assert delays and delays[0] == pytest.approx(1.0)
@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+from backend import llm_handler
+from backend.circuit_breaker import CircuitBreakerRegistry
+from backend.config import CONFIG
+from backend.llm_handler import LLMHandler
+from backend.llm_hedging import HedgePolicy
+from backend.retry_policy import RETRY_POLICY
+
+URL = "https://llm.example.com/v1/chat/completions"
+
+
+@pytest.fixture(autouse=True)
+def settings(monkeypatch):
+    monkeypatch.setattr(CONFIG, "LLM_HEDGE_PERCENTILE", 90.0)
+    monkeypatch.setattr(CONFIG, "LLM_HEDGE_DEFAULT_DELAY", 3.0)
+    monkeypatch.setattr(CONFIG, "LLM_HEDGE_MIN_DELAY", 0.5)
+    monkeypatch.setattr(CONFIG, "LLM_HEDGE_MAX_DELAY", 15.0)
+    monkeypatch.setattr(CONFIG, "LLM_HEDGE_MIN_SAMPLES", 10)
+    monkeypatch.setattr(CONFIG, "LLM_HEDGE_WINDOW", 100)
+    monkeypatch.setattr(CONFIG, "LLM_HEDGE_ENDPOINT", "")
+    monkeypatch.setattr(CONFIG, "LLM_HEDGE_API_KEY", "")
+
+
+def test_default_delay_until_enough_samples():
+    policy = HedgePolicy()
+    for _ in range(9):
+        policy.observe(URL, "m", 1.0)
+    assert policy.delay(URL, "m") == 3.0
+
+
+def test_delay_is_the_latency_percentile():
+    policy = HedgePolicy()
+    for i in range(1, 11):
+        policy.observe(URL, "m", float(i))
+    assert policy.delay(URL, "m") == 10.0
+    policy = HedgePolicy()
+    for i in range(1, 101):
+        policy.observe(URL, "m", i / 10.0)
+    assert policy.delay(URL, "m") == pytest.approx(9.1)
+
+
+def test_delay_is_clamped():
+    policy = HedgePolicy()
+    for _ in range(10):
+        policy.observe(URL, "fast", 0.01)
+        policy.observe(URL, "slow", 60.0)
+    assert policy.delay(URL, "fast") == 0.5
+    assert policy.delay(URL, "slow") == 15.0
+
+
+def test_secondary_reuses_the_key_only_on_the_same_origin(monkeypatch):
+    assert HedgePolicy.secondary(URL, "key", "m") == (URL, "key", "m")
+    monkeypatch.setattr(CONFIG, "LLM_HEDGE_ENDPOINT", "https://llm.example.com/v2/chat|m2")
+    assert HedgePolicy.secondary(URL, "key", "m") == ("https://llm.example.com/v2/chat", "key", "m2")
+    monkeypatch.setattr(CONFIG, "LLM_HEDGE_ENDPOINT", "https://other.example.com/v1/chat|m2")
+    assert HedgePolicy.secondary(URL, "key", "m") == (URL, "key", "m")
+    monkeypatch.setattr(CONFIG, "LLM_HEDGE_API_KEY", "hedge-key")
+    assert HedgePolicy.secondary(URL, "key", "m") == ("https://other.example.com/v1/chat", "hedge-key", "m2")
+
+
+def _hedged_call(monkeypatch, primary_latency: float, delay: float):
+    """Run _call_hedged with a stubbed _call_endpoint; returns (content, start offsets of each request)."""
+    monkeypatch.setattr(llm_handler, "HEDGING", HedgePolicy())
+    monkeypatch.setattr(llm_handler, "CIRCUIT_BREAKERS", CircuitBreakerRegistry())
+    monkeypatch.setattr(llm_handler.HEDGING, "delay", lambda api_url, model_name: delay)
+    handler = LLMHandler(api_url=URL, api_key="key", model_name="m")
+    starts = []
+
+    async def fake_call_endpoint(api_url, api_key, model_name, prompt, query, retry):
+        loop = asyncio.get_running_loop()
+        starts.append(loop.time())
+        if len(starts) == 1:
+            await asyncio.sleep(primary_latency)
+            return "primary"
+        return "hedge"
+
+    monkeypatch.setattr(handler, "_call_endpoint", fake_call_endpoint)
+
+    async def main():
+        begin = asyncio.get_running_loop().time()
+        retry = RETRY_POLICY.begin("chat", deadline=0)
+        content = await handler._call_hedged(URL, "key", "m", "prompt", "query", retry)
+        return content, [t - begin for t in starts]
+
+    return asyncio.run(main())
+
+
+def test_no_hedge_when_the_primary_answers_in_time(monkeypatch):
+    content, starts = _hedged_call(monkeypatch, primary_latency=0.01, delay=0.2)
+    assert content == "primary"
+    assert len(starts) == 1
+    assert llm_handler.HEDGING.stats()["not_needed"] == 1
+
+
+def test_hedge_fires_only_after_the_delay(monkeypatch):
+    content, starts = _hedged_call(monkeypatch, primary_latency=5.0, delay=0.2)
+    assert content == "hedge"
+    assert len(starts) == 2
+    assert starts[1] - starts[0] >= 0.2
+    stats = llm_handler.HEDGING.stats()
+    assert stats["hedges_sent"] == 1 and stats["hedge_wins"] == 1
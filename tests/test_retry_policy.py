@@ -0,0 +1,128 @@
+import asyncio
+from datetime import datetime, timezone
+
+import httpx
+import pytest
+
+from backend import retry_policy
+from backend.retry_policy import RetryPolicy
+
+NOW = datetime(2026, 1, 15, 12, 0, 0, tzinfo=timezone.utc)
+
+
+class _FixedDatetime(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return NOW if tz is not None else NOW.replace(tzinfo=None)
+
+
+@pytest.fixture(autouse=True)
+def fake_time(monkeypatch, clock):
+    monkeypatch.setattr(retry_policy, "time", clock)
+    monkeypatch.setattr(retry_policy, "datetime", _FixedDatetime)
+
+
+@pytest.fixture
+def sleeps(monkeypatch, clock):
+    """Replaces asyncio.sleep: records each delay and moves the fake clock forward by it."""
+    recorded = []
+
+    async def fake_sleep(delay):
+        recorded.append(delay)
+        clock.advance(delay)
+
+    monkeypatch.setattr(retry_policy.asyncio, "sleep", fake_sleep)
+    return recorded
+
+
+def _policy(**overrides) -> RetryPolicy:
+    options = dict(max_attempts=3, base_delay=1.0, max_delay=8.0, max_elapsed=60.0, jitter=0.0,
+                   retryable_statuses={429, 500, 502, 503, 504}, retry_after_max=30.0)
+    options.update(overrides)
+    return RetryPolicy(**options)
+
+
+def _response(status: int, **headers) -> httpx.Response:
+    return httpx.Response(status, headers={k.replace("_", "-"): v for k, v in headers.items()})
+
+
+def test_retry_after_in_seconds_and_milliseconds():
+    assert RetryPolicy.retry_after(_response(429, retry_after="7")) == 7.0
+    assert RetryPolicy.retry_after(_response(429, retry_after_ms="1500", retry_after="9")) == 1.5
+    assert RetryPolicy.retry_after(_response(429)) is None
+    assert RetryPolicy.retry_after(_response(429, retry_after="soon")) is None
+
+
+def test_retry_after_as_http_date():
+    assert RetryPolicy.retry_after(_response(503, retry_after="Thu, 15 Jan 2026 12:00:20 GMT")) == pytest.approx(20.0)
+    # A date in the past means "retry now"
+    assert RetryPolicy.retry_after(_response(503, retry_after="Thu, 15 Jan 2026 11:59:00 GMT")) == 0.0
+
+
+def test_backoff_delay_grows_exponentially_up_to_the_cap():
+    policy = _policy()
+    assert [policy.backoff_delay(n) for n in range(1, 6)] == [1.0, 2.0, 4.0, 8.0, 8.0]
+    jittered = _policy(jitter=0.5)
+    assert all(0.5 * 4.0 <= jittered.backoff_delay(3) <= 4.0 for _ in range(50))
+
+
+def test_http_date_retry_after_is_honoured(sleeps):
+    policy = _policy()
+    state = policy.begin("chat", deadline=0)
+    assert asyncio.run(state.backoff(response=_response(503, retry_after="Thu, 15 Jan 2026 12:00:05 GMT")))
+    assert sleeps == [pytest.approx(5.0)]
+    assert state.attempt == 2
+    ops = policy.stats()["operations"]["chat"]
+    assert ops["retried"] == 1 and ops["retry_after_honored"] == 1
+
+
+def test_non_retryable_status_gives_up_at_once(sleeps):
+    policy = _policy()
+    state = policy.begin("chat", deadline=0)
+    assert not asyncio.run(state.backoff(response=_response(400)))
+    assert state.gave_up == "non_retryable"
+    assert sleeps == []
+
+
+def test_retry_after_beyond_the_limit_is_not_waited_for(sleeps):
+    state = _policy(retry_after_max=10.0).begin("chat", deadline=0)
+    assert not asyncio.run(state.backoff(response=_response(429, retry_after="120")))
+    assert state.gave_up == "exhausted"
+    assert sleeps == []
+
+
+def test_attempts_are_exhausted(sleeps):
+    state = _policy(max_attempts=3).begin("chat", deadline=0)
+
+    async def run() -> list[bool]:
+        return [await state.backoff() for _ in range(3)]
+
+    assert asyncio.run(run()) == [True, True, False]
+    assert sleeps == [1.0, 2.0]
+    assert state.gave_up == "exhausted"
+
+
+def test_per_call_attempt_limit_cannot_exceed_the_policy():
+    policy = _policy(max_attempts=3)
+    assert policy.begin("chat", deadline=0, max_attempts=1).max_attempts == 1
+    assert policy.begin("chat", deadline=0, max_attempts=10).max_attempts == 3
+
+
+def test_no_retry_past_max_elapsed(clock, sleeps):
+    state = _policy(max_elapsed=10.0).begin("chat", deadline=0)
+    clock.advance(9.5)
+    assert not asyncio.run(state.backoff())
+    assert state.gave_up == "exhausted"
+    assert sleeps == []
+
+
+def test_deadline_limits_timeouts_and_retries(clock, sleeps):
+    state = _policy(base_delay=4.0).begin("chat", deadline=5.0)
+    assert state.remaining() == pytest.approx(5.0)
+    assert state.timeout(60.0) == pytest.approx(5.0)
+    clock.advance(2.0)
+    assert state.timeout(60.0) == pytest.approx(3.0)
+    # The 4s backoff would end past the deadline
+    assert not asyncio.run(state.backoff())
+    assert state.gave_up == "deadline_exceeded"
+    assert sleeps == []